@@ -1,8 +1,19 @@
 # IMPORTACIONES
 
 import pandas as pd
+import numpy as np
+import openpyxl
+from openpyxl.utils.datetime import to_excel, WINDOWS_EPOCH
 import glob
+import operator
 import os
+import sys
+import storage
+import dtype_policy
+import runner
+import stage_cache
+import instrumentation
+import time_axis
 
 
 # DEFINICION DE VARIABLES AUXILIARES
@@ -22,33 +33,154 @@ columns_list = [
     'P_baro'
 ]
 
+# Usa el lector directo de archivos *COMPENSADA.xlsx en lugar de pd.read_excel
+fast_xlsx_reader = True
+
 
 # DEFINCION DE FUNCIONES
 
+# Funcion para convertir numeros seriales de Excel a datetime
+def excel_serial_to_datetime(date_serials, time_serials, epoch):
+    """
+    Convierte arreglos de fechas y horas en formato serial de Excel (dias desde el
+    epoch del libro y fraccion del dia) en un DatetimeIndex, sin pasar por strings.
+    """
+    # Suma fecha y hora y las redondea al segundo mas cercano
+    serials = np.asarray(date_serials, dtype=np.float64) + np.asarray(time_serials, dtype=np.float64)
+    seconds = np.rint(serials * 86400).astype(np.int64)
+
+    # Desplaza los segundos desde el epoch del libro (1899-12-30 o 1904-01-01)
+    return pd.DatetimeIndex(np.datetime64(epoch, 's') + seconds.astype('timedelta64[s]'),
+                            name='Timestamps').as_unit('ns')
+
+
+# Funcion para convertir fechas y horas de openpyxl a numeros seriales de Excel
+def excel_serials(values, epoch):
+    """
+    Convierte los valores de una columna de fecha u hora entregados por openpyxl
+    (datetime, date, time o timedelta, o numeros si la celda no tiene formato de fecha)
+    en numeros seriales de Excel. Las columnas de un solo tipo se convierten con
+    operaciones vectoriales de pandas, con el mismo resultado que la funcion publica
+    to_excel; las columnas con tipos mezclados se convierten celda por celda con
+    to_excel. Las celdas vacias quedan como NaN.
+    """
+    values = np.asarray(values, dtype=object)
+    kind = pd.api.types.infer_dtype(values, skipna=True)
+
+    try:
+        if kind in ['datetime', 'date']:
+            # Dias (con fraccion) desde el epoch del libro
+            serials = np.asarray((pd.to_datetime(values) - pd.Timestamp(epoch)) / pd.Timedelta('1D'))
+
+            # Error del 29-02-1900 de Excel: to_excel resta un dia a los seriales 1 a 60
+            if epoch == WINDOWS_EPOCH:
+                serials[(serials >= 1) & (serials < 61)] -= 1
+            return serials
+        if kind == 'time':
+            # pandas convierte las horas como texto HH:MM:SS (una hora con fraccion de
+            # segundo no coincide con el formato y se convierte celda por celda)
+            times = pd.to_datetime(values, format='%H:%M:%S')
+            return np.asarray((times - pd.Timestamp('1900-01-01')) / pd.Timedelta('1D'))
+        if kind == 'timedelta':
+            return np.asarray(pd.to_timedelta(values) / pd.Timedelta('1D'))
+        if kind in ['floating', 'integer', 'mixed-integer-float', 'empty']:
+            return pd.to_numeric(values).astype(np.float64)
+    except (TypeError, ValueError):
+        pass
+
+    return np.array([np.nan if value is None
+                     else value if isinstance(value, (int, float))
+                     else to_excel(value, epoch)
+                     for value in values], dtype=np.float64)
+
+
+# Funcion de lectura directa de archivos *COMPENSADA.xlsx
+def read_compensated_xlsx(file_path):
+    """
+    Lee un archivo *COMPENSADA.xlsx fila por fila en modo de solo lectura, conservando
+    solo Date, Time y las columnas que no estan en columns_list. El indice Timestamps
+    se construye directamente de los valores numericos de fecha y hora.
+    """
+    with instrumentation.stage('lectura_xlsx', bytes_read=os.path.getsize(file_path)) as record:
+        # data_only=True entrega el valor calculado de las celdas con formulas (NE_m, Cota_m)
+        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            worksheet = workbook.active
+            rows = worksheet.iter_rows(values_only=True)
+
+            # Identifica las columnas a conservar a partir del encabezado
+            header = next(rows)
+            keep_indices = [i for i, name in enumerate(header)
+                            if name is not None and name not in columns_list]
+            keep_names = [header[i] for i in keep_indices]
+
+            # Conserva de cada fila solo las celdas de las columnas necesarias. No se fijan
+            # limites de fila o columna porque openpyxl recorreria la hoja completa para
+            # calcular sus dimensiones; las filas con celdas vacias al final se completan con None
+            width = max(keep_indices) + 1
+            padding = (None,) * width
+            select = operator.itemgetter(*keep_indices)
+            selected_rows = [select(row if len(row) >= width else row + padding) for row in rows]
+            epoch = workbook.epoch
+        finally:
+            workbook.close()
+        record['rows_out'] = len(selected_rows)
+
+    with instrumentation.stage('conversion_fechas', rows_in=record['rows_out']) as record:
+        # Transpone las filas conservadas a columnas (una hoja sin registros da columnas vacias)
+        columns = list(zip(*selected_rows)) or [()] * len(keep_names)
+
+        # Convierte fecha y hora a numeros seriales (las celdas vacias quedan como NaN)
+        data = dict(zip(keep_names, columns))
+        date_serials = excel_serials(data.pop('Date'), epoch)
+        time_serials = excel_serials(data.pop('Time'), epoch)
+
+        # Descarta las filas vacias al final de la hoja (sin fecha), como pd.read_excel
+        valid_rows = ~np.isnan(date_serials)
+
+        # Construye el df con las columnas conservadas y el indice de tiempo
+        df = pd.DataFrame({name: np.array(values, dtype=object)[valid_rows]
+                           for name, values in data.items()})
+        df.index = excel_serial_to_datetime(
+            date_serials[valid_rows], time_serials[valid_rows], epoch)
+        record['rows_out'] = len(df)
+
+    return df
+
+
 # Funcion para la lectura y manejo de fechas
-def configure_timestamps(file_path):
+def configure_timestamps(file_path, fast=None):
     """
     Lee un archivo xlsx, crea una columna Timestamps con formato datetime
     uniendo las columnas de fecha y hora y la establece como indice.
+    Por defecto usa el lector directo read_compensated_xlsx (ver fast_xlsx_reader).
     """
+    # Lector directo para archivos con el formato *COMPENSADA.xlsx
+    if fast_xlsx_reader if fast is None else fast:
+        return read_compensated_xlsx(file_path)
+
     # Lee el archivo xlsx
-    df_raw = pd.read_excel(file_path)
+    with instrumentation.stage('lectura_xlsx', bytes_read=os.path.getsize(file_path)) as record:
+        df_raw = pd.read_excel(file_path)
+        record['rows_out'] = len(df_raw)
 
-    # Convierte las columnas 'Date' y 'Time' en strings
-    date_str = df_raw['Date'].astype(str)
-    time_str = df_raw['Time'].astype(str)
+    with instrumentation.stage('conversion_fechas', rows_in=len(df_raw)) as record:
+        # Convierte las columnas 'Date' y 'Time' en strings
+        date_str = df_raw['Date'].astype(str)
+        time_str = df_raw['Time'].astype(str)
 
-    # Crea la columna 'Timestamps' con formato datetime a partir de 'Date' y 'Time'
-    df_raw['Timestamps'] = pd.to_datetime(
-        date_str + ' ' + time_str,
-        format='%Y-%m-%d %H:%M:%S'
-    )
+        # Crea la columna 'Timestamps' con formato datetime a partir de 'Date' y 'Time'
+        df_raw['Timestamps'] = pd.to_datetime(
+            date_str + ' ' + time_str,
+            format='%Y-%m-%d %H:%M:%S'
+        )
 
-    # Establece 'Timestamps' como indice
-    df_raw = df_raw.set_index('Timestamps')
+        # Establece 'Timestamps' como indice
+        df_raw = df_raw.set_index('Timestamps')
 
-    # Elimina las columnas 'Date' y 'Time'
-    df = df_raw.drop(columns=['Date', 'Time'])
+        # Elimina las columnas 'Date' y 'Time'
+        df = df_raw.drop(columns=['Date', 'Time'])
+        record['rows_out'] = len(df)
 
     return df
 
@@ -72,59 +204,105 @@ def format_columns(df):
     return df_formatted
 
 
+# Funcion de procesamiento de un piezometro (unidad de trabajo en paralelo)
+def process_piezometer(filepath):
+    """
+    Lee, formatea y guarda los datos de un piezometro. Cada llamada es independiente,
+    por lo que los piezometros se pueden procesar en paralelo.
+    """
+    # Extrae el nombre del archivo desde la ruta completa
+    basename = os.path.basename(filepath)
+
+    # Extrae el nombre del piezometro: penultima cadena de texto separada por '_'
+    piezometer_name = basename.split('_')[-2].strip()
+    print(f'Procesando piezometro {piezometer_name}')
+
+    # Construye el nombre de salida del archivo (sin extension)
+    output_filename = f'piezo-data_{piezometer_name}_formatted'
+
+    # Construye la ruta de salida del archivo
+    output_filepath = os.path.join(output_path, output_filename)
+
+    # Compara la huella del archivo crudo, la configuracion y el codigo con la guardada
+    with instrumentation.stage(instrumentation.fingerprint_stage, bytes_read=os.path.getsize(filepath)):
+        up_to_date, fingerprint = stage_cache.check_target(
+            output_path, output_filename, [filepath],
+            config=stage_cache.config_digest(columns_dict, columns_list, fast_xlsx_reader, storage.output_formats,
+                                             dtype_policy.compact_storage, dtype_policy.unit_decimals,
+                                             dtype_policy.round_trip_tolerance),
+            code=stage_cache.code_digest(excel_serial_to_datetime, excel_serials, read_compensated_xlsx,
+                                         configure_timestamps, format_columns, process_piezometer),
+            outputs_exist=storage.stage_exists(output_filepath))
+    if up_to_date:
+        print('  Sin cambios desde la ultima ejecucion, se omite.\n')
+        return
+
+    # Aplica la funcion configure_timestamps para leer el archivo y manejar las fechas
+    df = configure_timestamps(filepath)
+    print('  Indice timestamp configurado.')
+
+    # Aplica la funcion format_columns
+    with instrumentation.stage('formateo', rows_in=len(df)) as record:
+        df_formatted = format_columns(df)
+        record['rows_out'] = len(df_formatted)
+    print('  Nombres de columnas formateados.')
+
+    # Exporta el archivo en los formatos configurados en storage
+    with instrumentation.stage('escritura', rows_in=len(df_formatted)) as record:
+        written_paths = storage.write_stage(df_formatted, output_filepath)
+        axis = time_axis.write_time_axis(output_filepath, df_formatted.index)
+        stage_cache.save_fingerprint(output_path, output_filename, fingerprint)
+        record['bytes_written'] = instrumentation.path_bytes(written_paths)
+    print(f'  Eje temporal: {time_axis.describe(axis)}.')
+    print(f'  Datos procesados guardados en: {", ".join(written_paths)}\n')
+
+
 # MANEJO DE RUTAS Y ARCHIVOS
 
 # Ruta a la carpeta con los datos crudos
-raw_data_path = '../data/raw/piezometers/'
+raw_data_path = os.path.join(storage.raw_root, 'piezometers/')
 
 # Patron en archivos crudos para buscar dentro de la carpeta
 file_pattern = '*COMPENSADA.xlsx'
 
 # Ruta a la carpeta de salida
-output_path = '../data/processed/01_formatted'
-
-# Crea la carpeta de salida en caso de que no exista
-os.makedirs(output_path, exist_ok=True)
-
-# Construye un patron de ruta usando el patron de file_pattern
-filepath_pattern = os.path.join(raw_data_path, file_pattern)
-
-# Genera una lista con las rutas de las archivos que cumplen con el patron
-piezometer_files = glob.glob(filepath_pattern)
-
-# Imprime los archivos crudos encontrados en la carpeta
-if piezometer_files:
-    print(f'{len(piezometer_files)} archivos identificados:')
-    for filepath in sorted(piezometer_files):
-        print(f'  - {filepath}')
+output_path = os.path.join(storage.processed_root, '01_formatted')
 
 
 ## BUCLE DE EJECUCION
 
-# Itera sobre el archivo de cada piezometro
-for filepath in piezometer_files:
+# Funcion principal del script (tambien la ejecuta pipeline.py en un solo proceso)
+def main():
+    """
+    Busca los archivos *COMPENSADA.xlsx, procesa cada piezometro en paralelo y guarda
+    el reporte de la ejecucion.
+    Devuelve las unidades que fallaron ({etiqueta: traceback}).
+    """
+    # Crea la carpeta de salida en caso de que no exista
+    os.makedirs(output_path, exist_ok=True)
 
-    # Extrae el nombre del archivo desde la ruta completa
-    basename = os.path.basename(filepath)
+    # Construye un patron de ruta usando el patron de file_pattern
+    filepath_pattern = os.path.join(raw_data_path, file_pattern)
 
-    # Extrae el nombre del piezometro: penultima cadena de texto separada por '_'
-    piezometer_name = basename.split('_')[-2].strip()
-    print(f'Procesando piezometro {piezometer_name}')
+    # Genera una lista con las rutas de las archivos que cumplen con el patron
+    piezometer_files = glob.glob(filepath_pattern)
 
-    # Aplica la funcion configure_timestamps para leer el archivo y manejar las fechas
-    df = configure_timestamps(filepath)
-    print('  Indice timestamp configurado.')
+    # Imprime los archivos crudos encontrados en la carpeta
+    if piezometer_files:
+        print(f'{len(piezometer_files)} archivos identificados:')
+        for filepath in sorted(piezometer_files):
+            print(f'  - {filepath}')
 
-    # Aplica la funcion format_columns
-    df_formatted = format_columns(df)
-    print('  Nombres de columnas formateados.')
+    # Procesa el archivo de cada piezometro en paralelo
+    _, failures = runner.run_parallel(
+        process_piezometer,
+        {os.path.basename(filepath): (filepath,) for filepath in piezometer_files})
 
-    # Construye el nombre de salida del archivo
-    output_filename = f'piezo-data_{piezometer_name}_formatted.csv'
+    # Guarda el reporte de tiempos, memoria y volumen de datos de cada etapa
+    instrumentation.write_run_report(output_path, '01a_piezometric-data_formatting')
+    return failures
 
-    # Construye la ruta de salida del archivo
-    output_filepath = os.path.join(output_path, output_filename)
 
-    # Exporta el archivo como csv
-    df_formatted.to_csv(output_filepath)
-    print(f'  Datos procesados guardados en: {output_filepath}\n')
\ No newline at end of file
+# El bloque solo se ejecuta al correr el script (no al importarlo desde los procesos del pool)
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
@@ -3,6 +3,16 @@
 import pandas as pd
 import glob
 import os
+import sys
+import json
+import csv
+import itertools
+import storage
+import dtype_policy
+import runner
+import stage_cache
+import instrumentation
+import time_axis
 from collections import defaultdict
 
 
@@ -27,6 +37,22 @@ datalogger_ports_map = {
         'Port5': 'TEROS21_31cm'
     }}
 
+# Modo de ingesta incremental: solo se leen las exportaciones nuevas o modificadas
+# y sus registros se agregan al final del archivo formateado existente
+incremental_mode = True
+
+# Numero de lineas del encabezado de las exportaciones: puertos, sensores (con la celda
+# '# Records: N') y unidades con el nombre de la variable
+header_line_count = 3
+
+# Numero de filas de datos que se leen, transforman y escriben por bloque. La memoria
+# usada por un datalogger depende de este valor y no del numero ni del largo de sus
+# exportaciones
+export_chunksize = 100_000
+
+# Planes de columnas compilados en la ejecucion en curso, por firma de encabezado
+column_plans = {}
+
 
 # DEFINICION DE FUNCIONES
 
@@ -67,100 +93,156 @@ def group_datalogger_files(data_path):
     return dict(datalogger_files)
 
 
-# Funcion para filtrar y concatenar archivos de un mismo datalogger
-def concatenate_datalogger_data(file_paths, port_map):
+# Funcion de lectura del encabezado de una exportacion
+def read_header_lines(file_path):
     """
-    Lee y concatena los datos provenientes de multiples archivos csv, filtrando las columnas
-    innecesarias mediante un diccionario de mapeo. Devuelve un df con los datos concatenados 
-    (sin encabezado) y dos listas con la informacion de los encabezados.
-    """    
-    # Ordena los archivos previo a la lectura
-    sorted_paths = sorted(file_paths)
+    Lee una sola vez las lineas del encabezado de una exportacion z6 (puertos, sensores
+    y unidades) y devuelve una lista con las celdas de cada linea.
+    """
+    # utf-8-sig descarta el BOM con que el software de los dataloggers inicia el archivo
+    with open(file_path, encoding='utf-8-sig', newline='') as f:
+        return list(itertools.islice(csv.reader(f), header_line_count))
+
 
-    # Define el primer archivo para extraer informacion de los encabezados
-    first_file_path = sorted_paths[0]
+# Funcion de calculo de la firma de un encabezado
+def header_signature(header_rows, port_map):
+    """
+    Calcula el hash de las lineas del encabezado y del mapa de puertos. La celda
+    '# Records: N' cambia en cada exportacion, por lo que se excluye de la firma:
+    dos exportaciones con la misma configuracion comparten firma y plan de columnas.
+    """
+    rows = [list(row) for row in header_rows]
+    if len(rows) > 1 and rows[1] and rows[1][0].startswith('# Records'):
+        rows[1][0] = '# Records'
+    return stage_cache.config_digest(rows, port_map)
 
-    # Extrae la primera fila (Ports) como una serie de Pandas
-    port_row_full = pd.read_csv(first_file_path, header=None, nrows=1).iloc[0]
 
-    # Extrae la tercera fila (unidad de medida) como una serie
-    header_row_full = pd.read_csv(first_file_path, header=None, skiprows=2, nrows=1).iloc[0]
+# Funcion de formateo del nombre de una columna
+def format_column_name(sensor, header_text):
+    """
+    Construye el nombre Sensor_profundidad_variable_unidad de una columna a partir del
+    sensor del mapa de puertos y del texto de unidad y variable del encabezado
+    (ej. 'TEROS12_48cm' y ' m3/m3 Water Content' -> 'TEROS12_48cm_water-content_m3/m3').
+    """
+    # Divide el texto del encabezado usando el primer espacio
+    parts = header_text.strip().split(' ', 1)
+    # Almacena la unidad de medida de la columna (primer elemento) y la formatea
+    unit = parts[0].replace('_', '')
+    # Almacena la variable medida en la columna (segundo elemento) y la formatea
+    variable = parts[1].replace(' ', '-').lower()
 
-    # Genera listas para almacenar la informacion de las columnas necesarias
-    columns_to_keep_indices = [] # Indices numericos de las columnas a conservar
-    port_row_filtered = []       # Nombres de los puertos de las columnas filtradas
-    header_row_filtered = []     # Unidades de medida de las columnas filtradas
+    return f'{sensor}_{variable}_{unit}'
 
-    # Itera sobre las columnas del primer archivo usando el nombre del puerto
-    for i, port_name in enumerate(port_row_full):
 
-        # La condicion verifica si el puerto actual esta en el mapa; si no esta, no se procesa
-        if port_name in port_map:
-            columns_to_keep_indices.append(i)               # Guarda su indice de columna
-            port_row_filtered.append(port_name)             # Guarda su nombre de puerto
-            header_row_filtered.append(header_row_full[i])  # Guarda su unidad de medida
+# Funcion de compilacion del plan de columnas de un encabezado
+def compile_column_plan(header_rows, port_map):
+    """
+    Compila el plan de lectura de un encabezado: indices de las columnas a conservar
+    (Timestamps y los puertos presentes en el mapa), su nombre formateado, su unidad
+    y su tipo de datos.
+    """
+    port_row, _, header_row = header_rows
 
-    # Crea una lista para almacenar los dfs del datalogger
-    list_of_dfs = []
+    # La primera columna contiene siempre los Timestamps
+    plan = {'indices': [0], 'names': ['Timestamps'], 'units': [None],
+            'dtypes': {'Timestamps': 'str'}}
 
-    # Itera sobre cada archivo en sorted_paths
-    for path in sorted_paths:
+    # Itera sobre las columnas usando el nombre del puerto; los puertos que no estan
+    # en el mapa (ej. bateria y barometro) no se leen
+    for i, port_name in enumerate(port_row[1:], start=1):
+        if port_map.get(port_name) is None:
+            continue
+        name = format_column_name(port_map[port_name], header_row[i])
+        plan['indices'].append(i)
+        plan['names'].append(name)
+        plan['units'].append(header_row[i].strip().split(' ', 1)[0])
+        plan['dtypes'][name] = 'float64'
 
-        # Genera un df unicamente de las filas con datos y columnas necesarias
-        df = pd.read_csv(path, header=None, skiprows=3, usecols=columns_to_keep_indices)
-        # Almacena los df leidos en una lista
-        list_of_dfs.append(df)
+    return plan
 
-    # Si no encuentra dfs en la lista devuelve un df vacio
-    if not list_of_dfs:
-        return pd.DataFrame(), None, None
-    
-    # Concatena los datos de los df
-    concatenated_data = pd.concat(list_of_dfs, ignore_index=True)
 
-    # Devuelve el df concatenado (solo datos) y las filas con informacion asociada
-    return concatenated_data, port_row_filtered, header_row_filtered
+# Funcion para construir la ruta de los planes de columnas de un datalogger
+def column_plans_path(datalogger_name):
+    """
+    Devuelve la ruta del archivo json con los planes de columnas de un datalogger,
+    dentro de la carpeta de huellas de stage_cache.
+    """
+    return os.path.join(output_path, stage_cache.cache_folder, f'{datalogger_name}_column-plans.json')
 
 
-# Funcion de formateo de nombres de columnas
-def format_column_names(df, port_row, header_row, port_map):
+# Funcion de lectura de los planes de columnas guardados
+def load_column_plans(plans_path):
     """
-    Extrae texto de un diccionario de mapeo y dos listas con informacion sobre los encabezados 
-    de un df, lo formatea y asigna como nuevo nombre de columna al df.
+    Lee los planes de columnas compilados en ejecuciones previas ({firma: plan}). Si el
+    archivo no existe o los planes se compilaron con otro codigo devuelve un
+    diccionario vacio.
     """
-    # Crea una lista vacia para almacenar los nuevos nombres de columnas
-    new_columns = []
+    if not os.path.exists(plans_path):
+        return {}
 
-    # Itera sobre cada columna del df
-    for i in range(len(df.columns)):
-    
-        # Asigna 'Timestamps' al nombre de la primera columna y continua el bucle
-        if i == 0:
-            new_columns.append('Timestamps')
-            continue
+    with open(plans_path, encoding='utf-8') as f:
+        saved = json.load(f)
+    if saved.get('code') != stage_cache.code_digest(format_column_name, compile_column_plan):
+        return {}
+    return saved['plans']
+
+
+# Funcion de escritura de los planes de columnas
+def save_column_plans(plans, plans_path):
+    """
+    Guarda los planes de columnas junto con el hash del codigo que los compila. Como
+    el manifiesto, se escribe primero un archivo temporal que luego reemplaza al anterior.
+    """
+    os.makedirs(os.path.dirname(plans_path), exist_ok=True)
+    temporary_path = plans_path + '.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as f:
+        json.dump({'code': stage_cache.code_digest(format_column_name, compile_column_plan),
+                   'plans': plans}, f, indent=2)
+    os.replace(temporary_path, plans_path)
+
+
+# Funcion de obtencion del plan de columnas de una exportacion
+def get_column_plan(file_path, port_map, plans):
+    """
+    Devuelve el plan de columnas de una exportacion. El plan se compila solo la
+    primera vez que aparece la firma de su encabezado y se guarda en plans.
+    """
+    header_rows = read_header_lines(file_path)
+    signature = header_signature(header_rows, port_map)
+    if signature not in plans:
+        plans[signature] = compile_column_plan(header_rows, port_map)
+    return plans[signature]
 
-        # Extrae el nombre de puerto de la lista port_row usando el indice de columna actual (i)
-        port_name = port_row[i]
-        # Lo mismo, pero de la lista header_row
-        header_text = header_row[i].strip()
-        # Extrae los valores asociados a la clave Port del diccionario port map
-        sensor = port_map[port_name]
-
-        # Divide el texto del encabezado usando el primer espacio
-        parts = header_text.split(' ', 1)
-        # Almacena la unidad de medida de la columna (primer elemento) y la formatea
-        unit = parts[0].replace('_', '')
-        # Almacena la variable medida en la columna (segundo elemento) y la formatea
-        variable = parts[1].replace(' ', '-').lower()
-
-        # Construye el nuevo nombre para la columna
-        new_name = f'{sensor}_{variable}_{unit}'
-        # Agrega el nuevo nombre a la lista de columnas
-        new_columns.append(new_name)
-    
-    # Asigna la lista con nombres de columna nuevos a las columnas del df
-    df.columns = new_columns
-    return df
+
+# Funcion de lectura por bloques de una exportacion con su plan de columnas
+def iter_export_chunks(file_path, plan, chunksize=None):
+    """
+    Recorre las filas de datos de una exportacion en bloques de a lo mas chunksize
+    filas (por defecto export_chunksize), leyendo solo las columnas del plan y
+    asignandoles sus nombres formateados. La memoria usada depende del tamano del
+    bloque y no del largo de la exportacion.
+    """
+    chunksize = chunksize or export_chunksize
+    read_options = {'header': None, 'usecols': plan['indices'], 'chunksize': chunksize}
+    dtypes = {i: plan['dtypes'][name] for i, name in zip(plan['indices'], plan['names'])}
+
+    # Las columnas numericas se leen directamente como float64; si un bloque contiene
+    # texto, el archivo se vuelve a leer sin tipos desde ese bloque y
+    # transform_data_types convierte esos valores en NaN
+    rows_read = 0
+    try:
+        for chunk in pd.read_csv(file_path, skiprows=header_line_count, dtype=dtypes, **read_options):
+            rows_read += len(chunk)
+            # usecols entrega las columnas en el orden del archivo, el mismo de los indices del plan
+            chunk.columns = plan['names']
+            yield chunk
+        return
+    except ValueError:
+        pass
+
+    for chunk in pd.read_csv(file_path, skiprows=header_line_count + rows_read, **read_options):
+        chunk.columns = plan['names']
+        yield chunk
 
 
 # Funcion para transformar los tipos de datos
@@ -182,65 +264,386 @@ def transform_data_types(df):
     return df
 
 
-# MANEJO DE RUTAS Y ARCHIVOS
+# Funcion para obtener las columnas de salida de un datalogger
+def datalogger_columns(file_paths, port_map, plans=None):
+    """
+    Devuelve las columnas formateadas (sin Timestamps) de un conjunto de exportaciones
+    a partir de sus planes de columnas, sin leer los datos: la union de las columnas
+    de cada plan en el orden en que aparecen en los archivos ordenados.
+    """
+    plans = column_plans if plans is None else plans
+    columns = []
+    for path in sorted(file_paths):
+        plan = get_column_plan(path, port_map, plans)
+        columns += [name for name in plan['names'][1:] if name not in columns]
+    return columns
 
-# Ruta a la carpeta con los datos crudos
-raw_data_path = '../data/raw/soil-sensors'
 
-# Patron en archivos crudos para buscar dentro de la carpeta
-file_pattern = 'z6*'
+# Funcion de lectura por bloques de los archivos de un mismo datalogger
+def iter_datalogger_chunks(file_paths, port_map, plans=None, columns=None):
+    """
+    Generador que recorre por bloques las exportaciones ordenadas de un datalogger y
+    entrega la ruta de cada bloque y el bloque con los tipos convertidos, el indice de
+    tiempo y las columnas formateadas. Cada archivo se lee con el plan de columnas de
+    su propio encabezado, por lo que una exportacion con otra configuracion del
+    datalogger (ej. 'Configuration N') se lee correctamente; todos los bloques se
+    alinean a las mismas columnas (por defecto, las de datalogger_columns).
+    """
+    # Planes de columnas por firma de encabezado (por defecto, los de esta ejecucion)
+    plans = column_plans if plans is None else plans
+    columns = datalogger_columns(file_paths, port_map, plans) if columns is None else columns
 
-# Ruta a la carpeta de salida
-output_path = '../data/processed/01_formatted'
+    for path in sorted(file_paths):
+        plan = get_column_plan(path, port_map, plans)
+        for chunk in iter_export_chunks(path, plan):
+            yield path, transform_data_types(chunk).reindex(columns=columns)
 
-# Crea la carpeta de salida en caso de que no exista
-os.makedirs(output_path, exist_ok=True)
 
-# Aplica la funcion group_datalogger_files para almacenar todas las
-# rutas a archivos en un diccionario
-all_dataloggers = group_datalogger_files(raw_data_path)
+# Funcion de escritura de todas las exportaciones de un datalogger
+def write_datalogger_stage(file_paths, port_map, output_filepath, plans=None):
+    """
+    Lee por bloques todas las exportaciones de un datalogger y escribe cada bloque en
+    la etapa de salida a medida que se lee, reemplazando cualquier version previa.
+    Devuelve las rutas escritas y el numero de registros.
+    """
+    chunks = (chunk for _, chunk in iter_datalogger_chunks(file_paths, port_map, plans))
+    return storage.write_stage_chunks(chunks, output_filepath)
 
-# Imprime los archivos encontrados por datalogger
-if all_dataloggers:
-    print(f'{len(all_dataloggers)} dataloggers identificados:')
-    for datalogger, files in all_dataloggers.items():
-        print(f'Datalogger {datalogger}')
-        for filepath in sorted(files):
-            print(f'  - {filepath}')
 
+# Funcion de creacion de un manifiesto vacio
+def new_manifest():
+    """
+    Devuelve un manifiesto vacio: sin columnas, sin timestamps ni archivos ingeridos.
+    'sorted' indica si los registros del archivo de salida estan ordenados en el tiempo.
+    """
+    return {'columns': None, 'last_timestamp': None, 'sorted': True, 'files': {}}
+
+
+# Funcion de lectura del manifiesto de un datalogger
+def load_manifest(manifest_path):
+    """
+    Lee el manifiesto json de un datalogger. Si no existe devuelve un manifiesto vacio.
+    """
+    if not os.path.exists(manifest_path):
+        return new_manifest()
+
+    with open(manifest_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+# Funcion de escritura del manifiesto de un datalogger
+def save_manifest(manifest, manifest_path):
+    """
+    Guarda el manifiesto de un datalogger. Escribe primero un archivo temporal y luego
+    lo reemplaza, para no dejar un manifiesto corrupto si la ejecucion se interrumpe.
+    """
+    temporary_path = manifest_path + '.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temporary_path, manifest_path)
 
-# BUCLE DE EJECUCIÓN
 
-# Itera sobre cada datalogger en el diccionario
-for datalogger_name, file_paths_list in all_dataloggers.items():
+# Funcion de seleccion de archivos nuevos o modificados
+def select_files_to_ingest(file_paths, manifest):
+    """
+    Compara cada archivo con su registro en el manifiesto y devuelve una lista ordenada
+    con las rutas nuevas o modificadas y un diccionario con sus registros actualizados.
+    El hash solo se calcula cuando cambia el tamano o la fecha de modificacion.
+    """
+    files_to_ingest = []
+    updated_entries = {}
+
+    for path in sorted(file_paths):
+
+        # Informacion del archivo en disco y registro previo en el manifiesto
+        stat = os.stat(path)
+        entry = manifest['files'].get(path)
+
+        # Si el tamano y la fecha de modificacion no cambiaron, el archivo se omite
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            continue
+
+        # Si el contenido no cambio (ej. archivo copiado) solo se actualiza el registro
+        file_hash = stage_cache.file_digest(path)
+        if entry and entry['sha256'] == file_hash:
+            updated_entries[path] = dict(entry, mtime=stat.st_mtime)
+            continue
+
+        files_to_ingest.append(path)
+        updated_entries[path] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'sha256': file_hash,
+            'last_timestamp': None
+        }
+
+    return files_to_ingest, updated_entries
+
+
+# Funcion de ingesta incremental de los archivos de un datalogger
+def ingest_datalogger_files(file_paths, port_map, stored_index, file_entries, plans=None, columns=None):
+    """
+    Generador que lee cada archivo por bloques y entrega solo los registros cuyo
+    timestamp no esta en el archivo de salida (stored_index) ni fue entregado en un
+    bloque anterior. Las exportaciones se traslapan, pero tambien pueden rellenar
+    vacios o llegar fuera de orden, por lo que se compara con todos los timestamps
+    almacenados y no solo con el ultimo; dentro de cada bloque los registros se
+    ordenan por timestamp.
+    """
+    # Timestamps ya almacenados o entregados
+    ingested = pd.DatetimeIndex(stored_index)
+
+    for path, chunk in iter_datalogger_chunks(file_paths, port_map, plans, columns):
+        if chunk.empty:
+            continue
+
+        # Registra el ultimo timestamp contenido en el archivo
+        file_end = file_entries[path]['last_timestamp']
+        if file_end is None or chunk.index.max() > pd.Timestamp(file_end):
+            file_entries[path]['last_timestamp'] = str(chunk.index.max())
+
+        # Descarta registros ya almacenados y timestamps repetidos dentro del bloque
+        chunk = chunk[~chunk.index.isin(ingested)]
+        chunk = chunk[~chunk.index.duplicated(keep='first')].sort_index()
+
+        if chunk.empty:
+            continue
+
+        ingested = ingested.append(chunk.index)
+        yield chunk
+
+
+# Funcion de registro en el manifiesto de los bloques ya escritos
+def checkpoint_manifest(chunks, manifest, manifest_path):
+    """
+    Entrega los bloques de registros nuevos y, una vez escrito cada uno (cuando se pide
+    el siguiente), guarda en el manifiesto sus columnas, el ultimo timestamp almacenado
+    y si el archivo de salida sigue ordenado (un bloque que comienza antes del ultimo
+    timestamp, ej. una exportacion que rellena un vacio, lo desordena). Si la ejecucion
+    se interrumpe, la siguiente descarta los registros ya escritos al compararlos con
+    el indice del archivo de salida.
+    """
+    for chunk in chunks:
+        yield chunk
+        last_timestamp = manifest['last_timestamp']
+        if last_timestamp is not None and chunk.index[0] <= pd.Timestamp(last_timestamp):
+            manifest['sorted'] = False
+        if last_timestamp is None or chunk.index[-1] > pd.Timestamp(last_timestamp):
+            manifest['last_timestamp'] = str(chunk.index[-1])
+        manifest['columns'] = chunk.columns.tolist()
+        save_manifest(manifest, manifest_path)
+
+
+# Funcion de registro de los timestamps de los bloques escritos
+def collect_chunk_indexes(chunks, indexes):
+    """
+    Entrega los bloques sin modificarlos y agrega el indice de cada uno a la lista
+    indexes, para extender el eje temporal de la etapa sin volver a leerla.
+    """
+    for chunk in chunks:
+        indexes.append(chunk.index)
+        yield chunk
+
+
+# Funcion de procesamiento de un datalogger (unidad de trabajo en paralelo)
+def process_datalogger(datalogger_name, file_paths_list):
+    """
+    Lee, formatea y guarda los datos de todos los archivos de un datalogger. Cada
+    llamada es independiente, por lo que los dataloggers se pueden procesar en paralelo.
+    """
     print(f'Procesando datalogger {datalogger_name}')
 
     # Verifica si existe un mapa de puertos para el datalogger actual
     if datalogger_name not in datalogger_ports_map:
         print(f'No se encontro un mapa de puertos para {datalogger_name}')
-        continue
+        return
 
     # Extrae el mapa de puertos para el datalogger actual
     current_ports_map = datalogger_ports_map[datalogger_name]
 
-    # Aplica la funcion concatenate_datalogger_data para unir todos los archivos
-    # asociados a un mismo datalogger; genera 3 outputs
-    data_df, filtered_port_row, filtered_header_row = concatenate_datalogger_data(file_paths_list, current_ports_map)
-    print(f'  Datos concatenados: {len(data_df)} registros.')
+    # Construye el nombre de salida del archivo (sin extension)
+    output_filename = f'soil-data_{datalogger_name}_formatted'
+    # Construye la ruta de salida del archivo
+    output_filepath = os.path.join(output_path, output_filename)
+
+    # Compara la huella de los archivos crudos, la configuracion y el codigo con la guardada
+    with instrumentation.stage(instrumentation.fingerprint_stage,
+                               bytes_read=instrumentation.path_bytes(file_paths_list)):
+        previous_fingerprint = stage_cache.load_fingerprint(output_path, output_filename)
+        up_to_date, fingerprint = stage_cache.check_target(
+            output_path, output_filename, file_paths_list,
+            config=stage_cache.config_digest(current_ports_map, incremental_mode, storage.output_formats,
+                                             dtype_policy.compact_storage, dtype_policy.unit_decimals,
+                                             dtype_policy.round_trip_tolerance),
+            code=stage_cache.code_digest(read_header_lines, header_signature, format_column_name,
+                                         compile_column_plan, iter_export_chunks, transform_data_types,
+                                         datalogger_columns, iter_datalogger_chunks,
+                                         write_datalogger_stage, select_files_to_ingest,
+                                         ingest_datalogger_files, checkpoint_manifest,
+                                         process_datalogger),
+            outputs_exist=storage.stage_exists(output_filepath))
+    if up_to_date:
+        print('  Sin cambios desde la ultima ejecucion, se omite.\n')
+        return
 
-    # Aplica la funcion format_column_names para renombrar las columnas del df concatenado
-    formatted_data_df = format_column_names(data_df, filtered_port_row, filtered_header_row, current_ports_map)
-    print('  Nombres de columnas formateados.')
+    # Planes de columnas compilados en ejecuciones previas para este datalogger
+    plans_path = column_plans_path(datalogger_name)
+    plans = load_column_plans(plans_path)
+
+    # Ingesta incremental: agrega al archivo existente solo los registros nuevos
+    if incremental_mode:
+
+        # Lee el manifiesto del datalogger; sin archivo de salida se reconstruye desde cero
+        manifest_path = os.path.join(output_path, f'soil-data_{datalogger_name}_manifest.json')
+        manifest = load_manifest(manifest_path)
+        if not storage.stage_exists(output_filepath):
+            manifest = new_manifest()
+
+        # Si cambio la configuracion o el codigo tambien se reconstruye desde cero
+        if previous_fingerprint and (previous_fingerprint['config'], previous_fingerprint['code']) != (
+                fingerprint['config'], fingerprint['code']):
+            manifest = new_manifest()
+
+        # Selecciona los archivos nuevos o modificados y obtiene sus columnas desde los
+        # planes de columnas, sin leer los datos
+        files_to_ingest, updated_entries = select_files_to_ingest(file_paths_list, manifest)
+        new_columns = datalogger_columns(files_to_ingest, current_ports_map, plans)
+        print(f'  {len(files_to_ingest)} de {len(file_paths_list)} archivos nuevos o modificados.')
+
+        # Si cambio la configuracion del datalogger las columnas no coinciden y se
+        # reconstruye el archivo de salida completo
+        if files_to_ingest and manifest['columns'] not in (None, new_columns):
+            print('  Las columnas no coinciden con el archivo existente, se reconstruye.')
+            manifest = new_manifest()
+            files_to_ingest, updated_entries = select_files_to_ingest(file_paths_list, manifest)
+            new_columns = datalogger_columns(files_to_ingest, current_ports_map, plans)
+
+        # Timestamps ya almacenados (solo el indice del archivo de salida), para
+        # descartar los registros ya ingeridos aunque sean anteriores al ultimo
+        append = manifest['columns'] is not None
+        stored_index = (storage.read_stage(output_filepath, columns=[]).index
+                        if append and files_to_ingest else pd.DatetimeIndex([]))
+
+        # Lee los archivos seleccionados por bloques, descarta los registros ya
+        # almacenados y agrega cada bloque al archivo de salida (o lo crea si no existe)
+        with instrumentation.stage('lectura_escritura',
+                                   bytes_read=instrumentation.path_bytes(files_to_ingest)) as record:
+            new_chunks = ingest_datalogger_files(files_to_ingest, current_ports_map, stored_index,
+                                                 updated_entries, plans, new_columns)
+            new_indexes = []
+            written_paths, n_new_records = storage.write_stage_chunks(
+                collect_chunk_indexes(checkpoint_manifest(new_chunks, manifest, manifest_path), new_indexes),
+                output_filepath, append=append)
+            record['rows_out'] = n_new_records
+            record['bytes_written'] = instrumentation.path_bytes(written_paths)
+        print(f'  Registros nuevos: {n_new_records}.')
+
+        # Registros anteriores al final del archivo (ej. exportaciones que rellenan
+        # vacios): se reescribe la etapa ordenada en el tiempo
+        sorted_index = None
+        if not manifest.get('sorted', True):
+            print('  Registros anteriores al ultimo almacenado: se reordena el archivo de salida.')
+            with instrumentation.stage('reordenamiento', bytes_read=instrumentation.path_bytes(
+                    storage.stage_read_files(output_filepath))) as record:
+                df_sorted = storage.read_stage(output_filepath).sort_index(kind='stable')
+                written_paths = storage.write_stage(df_sorted, output_filepath)
+                record['rows_out'] = len(df_sorted)
+                sorted_index = df_sorted.index
+                record['bytes_written'] = instrumentation.path_bytes(written_paths)
+            manifest['sorted'] = True
+            save_manifest(manifest, manifest_path)
+
+        if n_new_records:
+            print(f'  Datos procesados agregados en: {", ".join(written_paths)}')
+
+            # Extiende el indice del eje temporal con los timestamps de los bloques
+            # escritos; si la etapa se reordeno (o el indice previo no corresponde) se
+            # construye con el indice completo, que ya esta en memoria
+            appended_index = new_indexes[0].append(new_indexes[1:])
+            previous_axis = time_axis.load_time_axis(output_filepath)
+            axis = None
+            if sorted_index is None and time_axis.matches(previous_axis, stored_index):
+                axis = time_axis.extend_time_axis(previous_axis, appended_index)
+            if axis is None:
+                axis = time_axis.build_time_axis(
+                    sorted_index if sorted_index is not None else stored_index.append(appended_index))
+            time_axis.save_time_axis(output_filepath, axis)
+            print(f'  Eje temporal: {time_axis.describe(axis)}.')
+
+        # Actualiza el manifiesto con los archivos ingeridos (las columnas y el ultimo
+        # timestamp se registran en checkpoint_manifest a medida que se escriben)
+        manifest['files'].update(updated_entries)
+        save_manifest(manifest, manifest_path)
+        save_column_plans(plans, plans_path)
+        stage_cache.save_fingerprint(output_path, output_filename, fingerprint)
+        print(f'  Manifiesto actualizado: {manifest_path}\n')
+        return
 
-    # Aplica la funcion transform_data_types
-    transformed_df = transform_data_types(formatted_data_df)
-    print('  Tipo de datos transformados.')
+    # Lee por bloques todas las exportaciones del datalogger, cada una con el plan de
+    # columnas de su encabezado, transforma los tipos de datos de cada bloque y lo
+    # escribe en los formatos configurados en storage
+    with instrumentation.stage('lectura_escritura',
+                               bytes_read=instrumentation.path_bytes(file_paths_list)) as record:
+        written_paths, n_records = write_datalogger_stage(
+            file_paths_list, current_ports_map, output_filepath, plans)
+        save_column_plans(plans, plans_path)
+        record['rows_out'] = n_records
+        record['bytes_written'] = instrumentation.path_bytes(written_paths)
+    print(f'  Datos formateados: {n_records} registros, columnas y tipos de datos transformados.')
+
+    # Construye el indice del eje temporal leyendo solo los timestamps
+    axis = time_axis.write_time_axis(output_filepath, storage.read_stage(output_filepath, columns=[]).index)
+    stage_cache.save_fingerprint(output_path, output_filename, fingerprint)
+    print(f'  Eje temporal: {time_axis.describe(axis)}.')
+    print(f'  Datos procesados guardados en: {", ".join(written_paths)}\n')
 
-    # Construye el nombre de salida del archivo
-    output_filename = f'soil-data_{datalogger_name}_formatted.csv'
-    # Construye la ruta de salida del archivo
-    output_filepath = os.path.join(output_path, output_filename)
-    
-    # Exporta el archivo como csv
-    transformed_df.to_csv(output_filepath)
-    print(f'  Datos procesados guardados en: {output_filepath}\n')
\ No newline at end of file
+
+# MANEJO DE RUTAS Y ARCHIVOS
+
+# Ruta a la carpeta con los datos crudos
+raw_data_path = os.path.join(storage.raw_root, 'soil-sensors')
+
+# Patron en archivos crudos para buscar dentro de la carpeta
+file_pattern = 'z6*'
+
+# Ruta a la carpeta de salida
+output_path = os.path.join(storage.processed_root, '01_formatted')
+
+
+# BUCLE DE EJECUCIÓN
+
+# Funcion principal del script (tambien la ejecuta pipeline.py en un solo proceso)
+def main():
+    """
+    Agrupa las exportaciones por datalogger, procesa cada datalogger en paralelo y
+    guarda el reporte de la ejecucion.
+    Devuelve las unidades que fallaron ({etiqueta: traceback}).
+    """
+    # Crea la carpeta de salida en caso de que no exista
+    os.makedirs(output_path, exist_ok=True)
+
+    # Aplica la funcion group_datalogger_files para almacenar todas las
+    # rutas a archivos en un diccionario
+    all_dataloggers = group_datalogger_files(raw_data_path)
+
+    # Imprime los archivos encontrados por datalogger
+    if all_dataloggers:
+        print(f'{len(all_dataloggers)} dataloggers identificados:')
+        for datalogger, files in all_dataloggers.items():
+            print(f'Datalogger {datalogger}')
+            for filepath in sorted(files):
+                print(f'  - {filepath}')
+
+    # Procesa cada datalogger del diccionario en paralelo
+    _, failures = runner.run_parallel(
+        process_datalogger,
+        {name: (name, paths) for name, paths in (all_dataloggers or {}).items()})
+
+    # Guarda el reporte de tiempos, memoria y volumen de datos de cada etapa
+    instrumentation.write_run_report(output_path, '01b_soil-data_formatting')
+    return failures
+
+
+# El bloque solo se ejecuta al correr el script (no al importarlo desde los procesos del pool)
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
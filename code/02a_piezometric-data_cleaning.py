@@ -1,8 +1,15 @@
 # IMPORTACIONES
 
 import pandas as pd
-import glob
+import numpy as np
 import os
+import sys
+import storage
+import dtype_policy
+import runner
+import stage_cache
+import instrumentation
+import time_axis
 
 
 # DEFINICION DE VARIABLES AUXILIARES
@@ -24,121 +31,218 @@ field_campaigns = {
 
 # Funcion de lectura de datos
 def read_data(file_path):
-    """ Lee los datos de un csv a partir de una ruta de archivo"""
-    df = pd.read_csv(file_path, index_col=0, parse_dates=True)
+    """ Lee los datos de una etapa (parquet o csv) a partir de una ruta sin extension"""
+    df = storage.read_stage(file_path)
     return df
 
 
+# Funcion de etiquetado de campanas
+def label_campaigns(timestamps, campaigns, axis=None):
+    """
+    Asigna a cada timestamp el numero de la campana que lo contiene (-1 si no
+    pertenece a ninguna) con una unica busqueda binaria (searchsorted) sobre los
+    limites de las campanas. Si se entrega el indice del eje temporal (time_axis) y
+    el eje esta alineado, las filas de cada campana se obtienen por posicion con
+    aritmetica entera, sin comparar fechas. Devuelve el arreglo de etiquetas y los
+    nombres de las campanas ordenados por fecha de inicio.
+    """
+    # Ordena las campanas por fecha de inicio
+    campaign_names = sorted(campaigns, key=lambda name: campaigns[name].min())
+    starts = pd.DatetimeIndex([campaigns[name].min() for name in campaign_names])
+
+    # La fecha de termino es excluyente: el ultimo instante incluido es 1 segundo antes
+    ends = pd.DatetimeIndex([campaigns[name].max() for name in campaign_names]) - pd.Timedelta(seconds=1)
+
+    # Con campanas traslapadas un timestamp podria pertenecer a dos campanas
+    if (starts[1:] <= ends[:-1]).any():
+        raise ValueError('Las campanas de terreno no pueden traslaparse.')
+
+    # Eje alineado: cada campana es un tramo contiguo de filas [inicio, termino]
+    first_rows = time_axis.positions(axis, starts, side='left')
+    if first_rows is not None:
+        end_rows = time_axis.positions(axis, ends, side='right')
+        labels = np.full(len(timestamps), -1, dtype=np.int64)
+        for campaign_number, (first_row, end_row) in enumerate(zip(first_rows, end_rows)):
+            labels[first_row:end_row] = campaign_number
+        return labels, campaign_names
+
+    # Busca la ultima campana que comienza antes (o en) cada timestamp
+    timestamps = pd.DatetimeIndex(timestamps).as_unit(starts.unit)
+    labels = starts.searchsorted(timestamps, side='right') - 1
+
+    # Descarta los timestamps posteriores al termino de esa campana
+    inside = labels >= 0
+    inside[inside] = timestamps[inside] <= ends[labels[inside]]
+    labels[~inside] = -1
+
+    return labels, campaign_names
+
+
 # Funcion de identificacion de datos anomalos
-def identify_campaign_outliers(df, campaign_dates):
+def identify_campaign_outliers(df, campaigns, axis=None):
     """
-    Identifica outliers en un df dentro de un rango de fechas a partir de 
-    una condicion. Devuelve los indices de las filas consideradas outliers.
+    Identifica outliers en un df dentro de los rangos de fechas de todas las campanas
+    a la vez. Calcula la media y la desviacion estandar de cada campana con un unico
+    groupby-transform. axis es el indice opcional del eje temporal del df (ver
+    label_campaigns). Devuelve una mascara booleana con las filas consideradas
+    outliers y un diccionario con el numero de outliers por campana.
     """
-    # Filtra el df a las fechas de terreno
-    df_campaign = df.loc[
-        campaign_dates.min():campaign_dates.max()-pd.Timedelta(seconds=1)
-        ].copy()
-    
-    # Si no hay datos durante la campana devuelve un indice vacio
-    if df_campaign.empty:
-        return pd.Index([])
-    
-    # Calcula la media y la desviacion estandar de cada columna
-    mean = df_campaign.mean()
-    std = df_campaign.std()
-
-    # Calcula el zscore de las columnas numericas. 
+    # Etiqueta cada fila con su campana y conserva solo las filas dentro de campanas
+    labels, campaign_names = label_campaigns(df.index, campaigns, axis)
+    in_campaign = labels >= 0
+    df_campaigns = df[in_campaign]
+    campaign_labels = labels[in_campaign]
+
+    # Calcula la media y la desviacion estandar de cada columna en cada campana
+    grouped = df_campaigns.groupby(campaign_labels)
+    mean = grouped.transform('mean')
+    std = grouped.transform('std')
+
+    # Calcula el zscore de las columnas numericas.
     # Si std = 0, zscore = NaN, por lo que se reemplaza por 0
-    z_scores = (df_campaign - mean).div(std).fillna(0)
+    z_scores = (df_campaigns - mean).div(std).fillna(0)
 
     # Crea una condicion para identificar datos con z-scores > 3
-    outlier_condition = (z_scores.abs() > 3).any(axis=1)
+    outlier_condition = (z_scores.abs() > 3).any(axis=1).to_numpy()
 
-    # Obtiene los indices de los outliers
-    outlier_indices = df_campaign[outlier_condition].index
-    return outlier_indices
+    # Traslada la condicion a una mascara sobre todas las filas del df
+    outlier_mask = in_campaign.copy()
+    outlier_mask[in_campaign] = outlier_condition
+
+    # Cuenta los outliers de cada campana
+    counts = pd.Series(campaign_labels[outlier_condition]).value_counts()
+    outlier_counts = {name: int(counts.get(i, 0)) for i, name in enumerate(campaign_names)}
+
+    return outlier_mask, outlier_counts
 
 
 # Funcion de remocion de datos anomalos
-def remove_outliers(df, outlier_indices):
+def remove_outliers(df, outlier_mask):
     """
     Reemplaza con NaN los valores en filas identificadas como outliers.
+    Modifica el df recibido, sin crear copias.
     """
-    # Crea una copia del df
-    df_cleaned = df.copy()
-
     # Reemplaza con NaN los datos en las filas identificadas como outliers
-    df_cleaned.loc[outlier_indices, df_cleaned.columns] = pd.NA
-    print(f'    Se removieron {len(outlier_indices)} registros anomalos.')
-    return df_cleaned
+    df.loc[outlier_mask, df.columns] = pd.NA
+    return df
 
 
-# MANEJO DE RUTAS Y ARCHIVOS
+# Funcion de limpieza de un archivo piezometrico (unidad de trabajo en paralelo)
+def process_piezometer_file(filepath):
+    """
+    Lee un archivo formateado, remueve los outliers de cada campana y guarda el
+    resultado. Cada llamada es independiente, por lo que los archivos se pueden
+    procesar en paralelo.
+    """
+    # Extrae el nombre del archivo desde la ruta completa
+    basename = os.path.basename(filepath)
 
-# Ruta a la carpeta con los datos formateados
-formatted_data_path = '../data/processed/01_formatted'
+    # Define el nombre del sensor: elimina el sufijo
+    sensor_name = basename.replace('_formatted', '')
+    print(f'Procesando {sensor_name}')
 
-# Patron en archivos para buscar dentro de la carpeta
-file_pattern = 'piezo-data*'
+    # Construye el nombre de salida del archivo (sin extension)
+    output_filename = f'{sensor_name}_cleaned'
 
-# Ruta a la carpeta de salida
-output_path = '../data/processed/02_cleaned'
+    # Construye la ruta de salida del archivo
+    output_filepath = os.path.join(output_path, output_filename)
+
+    # Compara la huella del archivo formateado, las campanas y el codigo con la guardada
+    with instrumentation.stage(instrumentation.fingerprint_stage,
+                               bytes_read=instrumentation.path_bytes(storage.stage_files(filepath))):
+        up_to_date, fingerprint = stage_cache.check_target(
+            output_path, output_filename, storage.stage_files(filepath),
+            config=stage_cache.config_digest(field_campaigns, storage.output_formats,
+                                             dtype_policy.compact_storage, dtype_policy.unit_decimals,
+                                             dtype_policy.round_trip_tolerance),
+            code=stage_cache.code_digest(read_data, label_campaigns, identify_campaign_outliers,
+                                         remove_outliers, process_piezometer_file),
+            outputs_exist=storage.stage_exists(output_filepath))
+    if up_to_date:
+        print('  Sin cambios desde la ultima ejecucion, se omite.\n')
+        return
 
-# Crea la carpeta de salida en caso de que no exista
-os.makedirs(output_path, exist_ok=True)
+    # Aplica la funcion de lectura de archivo
+    with instrumentation.stage('lectura',
+                               bytes_read=instrumentation.path_bytes(storage.stage_read_files(filepath))) as record:
+        df = read_data(filepath)
+        record['rows_out'] = len(df)
+    print('  Datos leidos.')
 
-# Construye un patron de ruta usando el patron de file_pattern
-filepath_pattern = os.path.join(formatted_data_path, file_pattern)
+    # Usa el indice del eje temporal guardado en la ingesta (o lo construye si falta
+    # o no corresponde a los datos leidos)
+    axis = time_axis.load_time_axis(filepath)
+    if not time_axis.matches(axis, df.index):
+        axis = time_axis.build_time_axis(df.index)
 
-# Genera una lista con las rutas de las archivos que cumplen con el patron
-formatted_files = glob.glob(filepath_pattern)
+    # Aplica las funciones de identificacion (sobre todas las campanas) y remocion de outliers
+    with instrumentation.stage('outliers', rows_in=len(df)) as record:
+        outlier_mask, outlier_counts = identify_campaign_outliers(df, field_campaigns, axis)
+        df_cleaned = remove_outliers(df, outlier_mask)
+        record['rows_out'] = len(df_cleaned)
 
-# Imprime los archivos encontrados en la carpeta
-if formatted_files:
-    print(f'{len(formatted_files)} archivos identificados:')
-    for filepath in sorted(formatted_files):
-        print(f'  - {filepath}')
+    # Informa el numero de outliers encontrados en cada campana
+    for campaign_name, n_outliers in outlier_counts.items():
+        print(f'  Campana de {campaign_name}:')
+        if n_outliers:
+            print(f'    Se removieron {n_outliers} registros anomalos.')
+        else:
+            print('    No se encontraron outliers.')
 
+    # Exporta el archivo en los formatos configurados en storage
+    with instrumentation.stage('escritura', rows_in=len(df_cleaned)) as record:
+        written_paths = storage.write_stage(df_cleaned, output_filepath)
 
-# BUCLE DE EJECUCIÓN
+        # Los outliers se reemplazan por NaN, por lo que el eje temporal no cambia
+        time_axis.save_time_axis(output_filepath, axis)
+        stage_cache.save_fingerprint(output_path, output_filename, fingerprint)
+        record['bytes_written'] = instrumentation.path_bytes(written_paths)
+    print(f'  Datos procesados guardados en: {", ".join(written_paths)}\n')
 
-# Bucle externo: itera sobre cada archivo encontrado
-for filepath in formatted_files:
 
-    # Extrae el nombre del archivo desde la ruta completa
-    basename = os.path.basename(filepath)
+# MANEJO DE RUTAS Y ARCHIVOS
 
-    # Define el nombre del sensor: elimina el sufijo
-    sensor_name = basename.replace('_formatted.csv', '')
-    print(f'Procesando {sensor_name}')
+# Ruta a la carpeta con los datos formateados
+formatted_data_path = os.path.join(storage.processed_root, '01_formatted')
 
-    # Aplica la funcion de lectura de archivo
-    df = read_data(filepath)
-    print('  Datos leidos.')
+# Patron en archivos para buscar dentro de la carpeta (sin extension)
+file_pattern = 'piezo-data*_formatted'
 
-    # Crea el objeto df_cleaned
-    df_cleaned = df.copy()
+# Ruta a la carpeta de salida
+output_path = os.path.join(storage.processed_root, '02_cleaned')
 
-    # Bucle interno: itera sobre las campanas de terreno
-    for campaign_name, campaign_dates in field_campaigns.items():
-        print(f'  Campana de {campaign_name}:')
 
-        # Aplica la funcion de identificacion de outliers
-        outlier_indices = identify_campaign_outliers(df_cleaned, campaign_dates)
+# BUCLE DE EJECUCIÓN
 
-        # Aplica la funcion de remocion de outliers
-        if not outlier_indices.empty:
-            df_cleaned = remove_outliers(df_cleaned, outlier_indices)
-        else:
-            print('    No se encontraron outliers.')
+# Funcion principal del script (tambien la ejecuta pipeline.py en un solo proceso)
+def main():
+    """
+    Busca los archivos formateados de los piezometros, limpia cada uno en paralelo y
+    guarda el reporte de la ejecucion.
+    Devuelve las unidades que fallaron ({etiqueta: traceback}).
+    """
+    # Crea la carpeta de salida en caso de que no exista
+    os.makedirs(output_path, exist_ok=True)
 
-    # Construye el nombre de salida del archivo
-    output_filename = f'{sensor_name}_cleaned.csv'
+    # Genera una lista con las rutas (sin extension) de los archivos que cumplen con el patron
+    formatted_files = storage.list_stages(formatted_data_path, file_pattern)
+
+    # Imprime los archivos encontrados en la carpeta
+    if formatted_files:
+        print(f'{len(formatted_files)} archivos identificados:')
+        for filepath in sorted(formatted_files):
+            print(f'  - {filepath}')
+
+    # Procesa cada archivo encontrado en paralelo
+    _, failures = runner.run_parallel(
+        process_piezometer_file,
+        {os.path.basename(filepath): (filepath,) for filepath in formatted_files})
+
+    # Guarda el reporte de tiempos, memoria y volumen de datos de cada etapa
+    instrumentation.write_run_report(output_path, '02a_piezometric-data_cleaning')
+    return failures
 
-    # Construye la ruta de salida del archivo
-    output_filepath = os.path.join(output_path, output_filename)
 
-    # Exporta el archivo como csv
-    df_cleaned.to_csv(output_filepath)
-    print(f'  Datos procesados guardados en: {output_filepath}\n')
\ No newline at end of file
+# El bloque solo se ejecuta al correr el script (no al importarlo desde los procesos del pool)
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
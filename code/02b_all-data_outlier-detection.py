@@ -0,0 +1,119 @@
+# IMPORTACIONES
+
+import os
+import sys
+import storage
+import dtype_policy
+import runner
+import stage_cache
+import instrumentation
+import outlier_detectors
+
+
+# DEFINICION DE FUNCIONES
+
+# Funcion de deteccion de outliers de un sensor (unidad de trabajo en paralelo)
+def process_sensor_file(filepath):
+    """
+    Recorre un archivo formateado (piezometro o datalogger de suelo) por bloques en
+    una sola pasada, aplica los detectores robustos de outlier_detectors a todas sus
+    columnas y guarda la mascara de outliers del sensor. Los datos no se modifican:
+    la mascara se aplica al leerlos en la agregacion (03) con
+    outlier_detectors.iter_masked_chunks. Cada llamada es independiente, por lo que
+    los archivos se pueden procesar en paralelo.
+    """
+    # Define el nombre del sensor: elimina el sufijo
+    sensor_name = os.path.basename(filepath).replace('_formatted', '')
+    print(f'Procesando {sensor_name}')
+
+    # Construye el nombre y la ruta de salida de la mascara
+    output_filename = f'{sensor_name}_outliers'
+    mask_path = outlier_detectors.mask_path_for(output_path, sensor_name)
+
+    # Compara la huella del archivo formateado, los detectores y el codigo con la guardada
+    detectors = outlier_detectors.build_detectors()
+    with instrumentation.stage(instrumentation.fingerprint_stage,
+                               bytes_read=instrumentation.path_bytes(storage.stage_files(filepath))):
+        up_to_date, fingerprint = stage_cache.check_target(
+            output_path, output_filename, storage.stage_files(filepath),
+            config=stage_cache.config_digest(
+                {name: vars(detector) for name, detector in detectors.items()},
+                outlier_detectors.max_rate_per_hour, outlier_detectors.sensor_resolution,
+                dtype_policy.unit_decimals),
+            code=stage_cache.code_digest(outlier_detectors, process_sensor_file),
+            outputs_exist=os.path.exists(mask_path))
+    if up_to_date:
+        print('  Sin cambios desde la ultima ejecucion, se omite.\n')
+        return
+
+    # Lee el archivo por bloques y aplica todos los detectores en la misma pasada
+    with instrumentation.stage('deteccion',
+                               bytes_read=instrumentation.path_bytes(storage.stage_read_files(filepath))) as record:
+        n_rows, counts = outlier_detectors.detect_outliers(
+            storage.iter_stage_chunks(filepath, detection_chunksize), detectors, mask_path)
+        record['rows_in'] = n_rows
+        record['bytes_written'] = instrumentation.path_bytes([mask_path])
+    stage_cache.save_fingerprint(output_path, output_filename, fingerprint)
+
+    # Informa el numero de outliers de cada detector en cada columna
+    for detector_name, column_counts in counts.items():
+        flagged = {column: n for column, n in column_counts.items() if n}
+        print(f'  Detector {detector_name}:')
+        if flagged:
+            for column, n_outliers in flagged.items():
+                print(f'    {column}: {n_outliers} valores anomalos.')
+        else:
+            print('    No se encontraron outliers.')
+    print(f'  Mascara de outliers guardada en: {mask_path}\n')
+
+
+# MANEJO DE RUTAS Y ARCHIVOS
+
+# Ruta a la carpeta con los datos formateados
+formatted_data_path = os.path.join(storage.processed_root, '01_formatted')
+
+# Patrones en archivos para buscar dentro de la carpeta (sin extension)
+file_patterns = ['piezo-data*_formatted', 'soil-data*_formatted']
+
+# Ruta a la carpeta de salida
+output_path = os.path.join(storage.processed_root, '02_cleaned')
+
+# Numero de filas leidas por bloque
+detection_chunksize = 100_000
+
+
+# BUCLE DE EJECUCIÓN
+
+# Funcion principal del script (tambien la ejecuta pipeline.py en un solo proceso)
+def main():
+    """
+    Busca los archivos formateados de todos los sensores, detecta los outliers de cada
+    uno en paralelo y guarda el reporte de la ejecucion.
+    Devuelve las unidades que fallaron ({etiqueta: traceback}).
+    """
+    # Crea la carpeta de salida en caso de que no exista
+    os.makedirs(output_path, exist_ok=True)
+
+    # Genera una lista con las rutas (sin extension) de los archivos que cumplen con los patrones
+    formatted_files = [filepath for pattern in file_patterns
+                       for filepath in storage.list_stages(formatted_data_path, pattern)]
+
+    # Imprime los archivos encontrados en la carpeta
+    if formatted_files:
+        print(f'{len(formatted_files)} archivos identificados:')
+        for filepath in formatted_files:
+            print(f'  - {filepath}')
+
+    # Procesa cada archivo encontrado en paralelo
+    _, failures = runner.run_parallel(
+        process_sensor_file,
+        {os.path.basename(filepath): (filepath,) for filepath in formatted_files})
+
+    # Guarda el reporte de tiempos, memoria y volumen de datos de cada etapa
+    instrumentation.write_run_report(output_path, '02b_all-data_outlier-detection')
+    return failures
+
+
+# El bloque solo se ejecuta al correr el script (no al importarlo desde los procesos del pool)
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
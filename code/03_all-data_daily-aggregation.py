@@ -2,91 +2,544 @@
 
 import pandas as pd
 import numpy as np
-import glob
 import os
+import sys
+import storage
+import dtype_policy
+import runner
+import stage_cache
+import instrumentation
+import time_axis
+import outlier_detectors
+
+
+# DEFINICION DE VARIABLES AUXILIARES
+
+# Frecuencias de agregacion: el nombre define la carpeta (03_<nombre>) y el sufijo
+# de los archivos; el valor es la regla de resample de pandas
+aggregation_frequencies = {
+    'hourly': 'h',
+    'daily': 'D',
+    'monthly': 'MS'
+}
+
+# Estadisticos calculados en cada frecuencia. 'coverage' es la fraccion de registros
+# presentes respecto de los esperados segun el intervalo de muestreo, y 'qNN' el
+# cuantil NN/100
+aggregation_statistics = ['mean', 'min', 'max', 'std', 'count', 'coverage', 'q05', 'q50', 'q95']
+
+# Diferencia maxima del promedio y la desviacion estandar de las frecuencias derivadas
+# de agregados parciales (y del promedio diario de registros sin orden temporal)
+# respecto de resample sobre los registros, relativa al mayor valor absoluto de la
+# columna en el periodo (redondeo de sumas en otro orden)
+partial_aggregate_tolerance = 1e-12
+
+# Aplicacion opcional de las mascaras de outliers de 02b: con la variable de entorno
+# HUASCO_APPLY_OUTLIER_MASKS=1 (o --apply-outlier-masks de pipeline.py) se reemplazan con
+# NaN, al leer cada etapa, los valores marcados en la mascara de su sensor. Por defecto
+# se agregan los datos sin modificar
+apply_outlier_masks = os.environ.get('HUASCO_APPLY_OUTLIER_MASKS') == '1'
 
 
 # DEFINICION DE FUNCIONES
 
+# Funcion para obtener el nombre del sensor de una etapa
+def stage_sensor(file_path):
+    """
+    Devuelve el nombre del sensor de una etapa: el nombre del archivo sin los sufijos
+    _cleaned y _formatted (ej. 'piezo-data_SDH1PS02').
+    """
+    return os.path.basename(file_path).replace('_cleaned', '').replace('_formatted', '')
+
+
+# Funcion para obtener la mascara de outliers de un sensor
+def sensor_mask_path(sensor_name):
+    """
+    Devuelve la ruta de la mascara de outliers de un sensor en outlier_masks_path si
+    apply_outlier_masks esta activo, o None.
+    """
+    return outlier_detectors.mask_path_for(outlier_masks_path, sensor_name) if apply_outlier_masks else None
+
+
+# Funcion de verificacion de la mascara de outliers de una etapa
+def current_outlier_mask(file_path, mask_path):
+    """
+    Devuelve mask_path si la mascara existe y corresponde a las filas actuales de la
+    etapa (ver outlier_detectors.mask_matches_axis), o None. Una mascara
+    desactualizada (la etapa cambio despues de 02b) se omite con un aviso sin detener
+    la agregacion; como la huella de 03 incluye la mascara, el sensor se vuelve a
+    agregar con ella cuando 02b la actualice.
+    """
+    if mask_path is None or not os.path.exists(mask_path):
+        return None
+
+    axis = time_axis.load_time_axis(file_path)
+    if axis is None:
+        axis = time_axis.build_time_axis(storage.read_stage(file_path, columns=[]).index)
+    if not outlier_detectors.mask_matches_axis(outlier_detectors.load_mask_metadata(mask_path), axis):
+        print(f'  Aviso: la mascara {mask_path} no corresponde a la etapa actual '
+              f'(ejecute 02b); se agrega sin ella.')
+        return None
+    return mask_path
+
+
+# Funcion de lectura por bloques de una etapa sin sus outliers
+def iter_input_chunks(file_path, chunksize, mask_path=None):
+    """
+    Recorre una etapa por bloques (storage.iter_stage_chunks), con las columnas en
+    float64 aunque se lean en float32 (representacion compacta de dtype_policy). Con
+    mask_path, los valores marcados en la mascara de outliers se reemplazan por NaN.
+    """
+    chunks = (dtype_policy.float64_frame(chunk) for chunk in storage.iter_stage_chunks(file_path, chunksize))
+    return chunks if mask_path is None else outlier_detectors.iter_masked_chunks(chunks, mask_path)
+
+
+# Funcion de lectura completa de una etapa sin sus outliers
+def read_input_view(file_path, mask_path=None):
+    """
+    Lee una etapa completa (storage.read_stage_view), en el orden de filas guardado y
+    con las columnas en float64. Con mask_path, los valores marcados en la mascara de
+    outliers se reemplazan por NaN.
+    """
+    df = dtype_policy.float64_frame(storage.read_stage_view(file_path))
+    return df if mask_path is None else outlier_detectors.apply_outlier_mask(df, mask_path)
+
+
+# Funcion de agregacion diaria de datos subhorarios sin orden temporal
+def aggregate_unsorted_to_daily_mean(file_path, chunksize, mask_path=None):
+    """
+    Lee una etapa por bloques y acumula, por dia y columna, la suma y el numero de
+    datos validos. Se usa cuando los registros no estan ordenados en el tiempo. Las
+    sumas de cada dia se hacen en otro orden que resample('D').mean(), por lo que el
+    resultado no es identico: difiere a lo sumo en partial_aggregate_tolerance del mayor
+    valor absoluto de la columna en el dia (benchmarks/check_aggregation.py lo verifica).
+    """
+    daily_sums = None
+    daily_counts = None
+
+    for chunk in iter_input_chunks(file_path, chunksize, mask_path):
+
+        # Suma y cuenta los datos de cada dia dentro del bloque (dias por division entera)
+        grouped = chunk.groupby(time_axis.day_codes(chunk.index))
+        sums, counts = grouped.sum(), grouped.count()
+
+        # Acumula los resultados del bloque (los dias pueden repetirse entre bloques)
+        if daily_sums is None:
+            daily_sums, daily_counts = sums, counts
+        else:
+            daily_sums = daily_sums.add(sums, fill_value=0)
+            daily_counts = daily_counts.add(counts, fill_value=0)
+
+    # Promedio diario; los dias sin datos quedan como NaN
+    daily_df = (daily_sums / daily_counts.where(daily_counts > 0)).sort_index()
+    daily_df.index = time_axis.days_to_index(daily_df.index, name=storage.index_name)
+    return daily_df.asfreq('D')
+
+
+# Funcion de promedio diario de un bloque ordenado
+def daily_mean(df, days):
+    """
+    Calcula el promedio de cada columna por dia, agrupando por el numero de dia de
+    cada fila (time_axis.day_codes) en lugar de comparar fechas. El resultado es el
+    mismo de resample('D').mean() sin los dias vacios, que completa asfreq('D').
+    """
+    daily_df = df.groupby(days).mean()
+    daily_df.index = time_axis.days_to_index(daily_df.index, name=df.index.name)
+    return daily_df
+
+
 # Funcion de agregación diaria de datos subhorarios
-def aggregate_to_daily_mean(file_path):
-    """
-    Lee un archivo csv, establece un indice datetime y calcula el 
-    valor diario promedio para cada columna.
-    """
-    # Asigna el tipo float64 a todas las columnas que no sean Timestamp
-    columns = pd.read_csv(file_path, nrows=0).columns.tolist()
-    numeric_columns = [col for col in columns if col != 'Timestamps']
-    dtype_map = {col: np.float64 for col in numeric_columns}
-
-    # Lee el csv y establece el indice como datetime
-    df = pd.read_csv(file_path, 
-                     parse_dates=['Timestamps'], 
-                     index_col='Timestamps', 
-                     dtype=dtype_map,
-                     na_values=['#N/D'])
-    
-    # Resamplea el df a escala diaria usando el promedio
-    daily_df = df.resample('D').mean()
+def aggregate_to_daily_mean(file_path, chunksize=None, mask_path=None):
+    """
+    Lee una etapa (parquet o csv) por bloques (sin sus outliers si se entrega la
+    mascara mask_path) y calcula el valor diario promedio para cada columna. Las filas
+    del ultimo dia de cada bloque se trasladan al bloque siguiente, de modo que cada
+    dia se promedia con todas sus filas en el mismo orden que resample('D').mean() y
+    el resultado es identico bit a bit, con memoria acotada por el tamano del bloque.
+    Solo si los registros no estan ordenados en el tiempo se usa
+    aggregate_unsorted_to_daily_mean, cuyo resultado tiene la tolerancia indicada alli.
+    """
+    chunksize = chunksize or aggregation_chunksize
+    daily_parts = []
+    carry = None
+    columns = None
+
+    for chunk in iter_input_chunks(file_path, chunksize, mask_path):
+        columns = chunk.columns
+
+        # Antepone las filas del dia que quedo abierto en el bloque anterior
+        if carry is not None:
+            chunk = pd.concat([carry, chunk])
+
+        # Sin orden temporal un dia puede repartirse en bloques no consecutivos
+        if not chunk.index.is_monotonic_increasing:
+            print('  Registros sin orden temporal: se acumulan sumas diarias.')
+            return aggregate_unsorted_to_daily_mean(file_path, chunksize, mask_path)
+
+        # Separa los dias completos del ultimo dia, que puede continuar en el bloque siguiente
+        if chunk.empty:
+            continue
+        days = time_axis.day_codes(chunk.index)
+        complete_days = days < days[-1]
+        carry = chunk[~complete_days]
+
+        # Promedia los dias completos a escala diaria
+        if complete_days.any():
+            daily_parts.append(daily_mean(chunk[complete_days], days[complete_days]))
+
+    # Agrega el ultimo dia pendiente
+    if carry is not None and not carry.empty:
+        daily_parts.append(daily_mean(carry, time_axis.day_codes(carry.index)))
+
+    # Etapa sin registros: df diario vacio con las columnas de la etapa
+    if not daily_parts:
+        return pd.DataFrame(columns=columns, index=pd.DatetimeIndex([], name=storage.index_name),
+                            dtype='float64')
+
+    # Une los resultados y completa los dias sin datos entre bloques
+    daily_df = pd.concat(daily_parts).asfreq('D')
     return daily_df
 
 
-# MANEJO DE RUTAS Y ARCHIVOS
+# Funcion para ordenar las frecuencias de la mas fina a la mas gruesa
+def sort_frequencies(frequencies):
+    """
+    Ordena un diccionario {nombre: regla} segun la duracion de un periodo de cada regla.
+    """
+    reference = pd.Timestamp('2001-01-01')
+    return dict(sorted(frequencies.items(),
+                       key=lambda item: reference + pd.tseries.frequencies.to_offset(item[1])))
 
-# Rutas a la carpetas con los datos
-formatted_data_path = '../data/processed/01_formatted'
-cleaned_data_path = '../data/processed/02_cleaned'
 
-# Patrones en archivos para buscar dentro de las carpetas
-piezo_pattern = '*cleaned.csv'
-soil_pattern = 'soil-data*formatted.csv'
+# Funcion de calculo de agregados parciales
+def compute_partial_aggregates(df, rule):
+    """
+    Calcula por periodo y columna, sobre los registros originales, los agregados
+    parciales a partir de los cuales se derivan los estadisticos: numero de datos,
+    suma, minimo, maximo y suma de los cuadrados de las desviaciones respecto de la
+    media (m2).
+    """
+    resampled = df.resample(rule)
+    count = resampled.count()
+    return {
+        'count': count,
+        'sum': resampled.sum(),
+        'min': resampled.min(),
+        'max': resampled.max(),
+        'm2': (resampled.var(ddof=0) * count).fillna(0)
+    }
+
 
-# Ruta a la carpeta de salida
-output_path = '../data/processed/03_daily'
+# Funcion de combinacion de agregados parciales
+def combine_partial_aggregates(partials, rule):
+    """
+    Deriva los agregados parciales de una frecuencia mas gruesa a partir de los de
+    una frecuencia mas fina cuyos periodos estan contenidos en ella (ej. horas en dias).
+    El numero de datos, el minimo y el maximo son exactos; la suma solo cambia el orden
+    de las sumas, y m2 se combina con la formula de Chan et al.: la suma de los m2
+    parciales mas n_i * (media_i - media)^2 de cada periodo fino.
+    """
+    count = partials['count'].resample(rule).sum()
+    total = partials['sum'].resample(rule).sum()
+
+    # Media del periodo grueso repetida en cada uno de sus periodos finos
+    fine_count = partials['count']
+    fine_mean = partials['sum'] / fine_count.where(fine_count > 0)
+    coarse_mean = (partials['sum'].resample(rule).transform('sum')
+                   / fine_count.resample(rule).transform('sum'))
+    between_m2 = (fine_count * (fine_mean - coarse_mean) ** 2).fillna(0)
+
+    return {
+        'count': count,
+        'sum': total,
+        'min': partials['min'].resample(rule).min(),
+        'max': partials['max'].resample(rule).max(),
+        'm2': partials['m2'].resample(rule).sum() + between_m2.resample(rule).sum()
+    }
 
-# Crea la carpeta de salida en caso de que no exista
-os.makedirs(output_path, exist_ok=True)
 
-# Construye los patrones de ruta
-piezo_filepath_pattern = os.path.join(cleaned_data_path, piezo_pattern)
-soil_filepath_pattern = os.path.join(formatted_data_path, soil_pattern)
+# Funcion de calculo de los estadisticos finales
+def finalize_statistics(partials, df, rule, statistics, sampling_interval):
+    """
+    Calcula los estadisticos pedidos a partir de los agregados parciales de una
+    frecuencia. Los cuantiles no se pueden derivar de agregados parciales, por lo que
+    se calculan directamente sobre los registros originales (df).
+    """
+    count = partials['count']
+    valid_count = count.where(count > 0)
+    results = {}
 
-# Genera listas con las rutas de los archivos que cumplen con los patrones
-piezo_files = glob.glob(piezo_filepath_pattern)
-soil_files = glob.glob(soil_filepath_pattern)
+    for statistic in statistics:
+        if statistic == 'mean':
+            results[statistic] = partials['sum'] / valid_count
+        elif statistic in ['min', 'max', 'count']:
+            results[statistic] = partials[statistic]
+        elif statistic == 'std':
+            # Desviacion estandar muestral (ddof=1), igual que pandas
+            results[statistic] = np.sqrt(partials['m2'] / (valid_count - 1).where(valid_count > 1))
+        elif statistic == 'coverage':
+            # Registros esperados en cada periodo segun el intervalo de muestreo
+            period_ends = count.index + pd.tseries.frequencies.to_offset(rule)
+            expected = (period_ends - count.index) / sampling_interval
+            results[statistic] = count.div(np.asarray(expected), axis=0)
+        elif statistic.startswith('q'):
+            results[statistic] = df.resample(rule).quantile(int(statistic[1:]) / 100)
+        else:
+            raise ValueError(f'Estadistico no reconocido: {statistic}')
 
-# Combina ambas listas de archivos
-files_to_process = piezo_files + soil_files
+    return results
 
-# Imprime los archivos encontrados
-if files_to_process:
-    print(f'{len(files_to_process)} archivos identificados:')
-    for filepath in sorted(files_to_process):
-        print(f'  - {filepath}')
+
+# Funcion de agregacion de un bloque con periodos completos
+def aggregate_block(df, frequencies, statistics, sampling_interval):
+    """
+    Calcula los estadisticos de todas las frecuencias para un bloque de registros
+    que contiene solo periodos completos de la frecuencia mas gruesa. La frecuencia
+    mas fina se calcula sobre los registros y las demas se derivan de la anterior,
+    sin volver a recorrer los registros (salvo los cuantiles).
+    """
+    block_results = {}
+    partials = None
+
+    for name, rule in frequencies.items():
+        if partials is None:
+            partials = compute_partial_aggregates(df, rule)
+        else:
+            partials = combine_partial_aggregates(partials, rule)
+        block_results[name] = finalize_statistics(partials, df, rule, statistics, sampling_interval)
+
+    return block_results
+
+
+# Funcion de agregacion con multiples estadisticos y frecuencias
+def aggregate_statistics(file_path, frequencies=None, statistics=None, chunksize=None, mask_path=None):
+    """
+    Lee una etapa una sola vez, por bloques (sin sus outliers si se entrega la mascara
+    mask_path), y calcula los estadisticos pedidos en todas las frecuencias. Las filas
+    del ultimo periodo de la frecuencia mas gruesa se trasladan al bloque siguiente,
+    por lo que la memoria queda acotada por el tamano del bloque mas un periodo.
+    Devuelve {frecuencia: {estadistico: df}}.
+
+    Respecto de resample(regla) sobre la etapa completa, el numero de datos, la
+    cobertura, el minimo, el maximo y los cuantiles son identicos. El promedio y la
+    desviacion estandar de las frecuencias derivadas (ej. diaria y mensual a partir
+    de la horaria) suman en otro orden, por lo que difieren en a lo sumo
+    partial_aggregate_tolerance; benchmarks/check_aggregation.py lo verifica.
+    """
+    frequencies = sort_frequencies(frequencies or aggregation_frequencies)
+    statistics = statistics or aggregation_statistics
+    chunksize = chunksize or aggregation_chunksize
+    coarsest_rule = list(frequencies.values())[-1]
+
+    block_results = []
+    carry = None
+
+    # Intervalo de muestreo nominal del indice del eje temporal guardado, si existe
+    axis = time_axis.load_time_axis(file_path)
+    sampling_interval = pd.Timedelta(axis['interval_ns'], unit='ns') if axis and axis['interval_ns'] else None
+
+    # Funcion interna que agrega un bloque y guarda sus resultados
+    def process_block(df):
+        nonlocal sampling_interval
+        if sampling_interval is None:
+            # Intervalo de muestreo nominal: mediana de las diferencias positivas
+            steps = np.diff(df.index.asi8)
+            sampling_interval = pd.Timedelta(int(np.median(steps[steps > 0])), unit='ns')
+        block_results.append(aggregate_block(df, frequencies, statistics, sampling_interval))
+
+    for chunk in iter_input_chunks(file_path, chunksize, mask_path):
+
+        # Antepone las filas del periodo que quedo abierto en el bloque anterior
+        if carry is not None:
+            chunk = pd.concat([carry, chunk])
+
+        # Sin orden temporal se agrega la etapa completa en memoria; se ordena (y copia)
+        # solo si el indice completo no esta ordenado, conservando la vista mapeada
+        if not chunk.index.is_monotonic_increasing:
+            print('  Registros sin orden temporal: se agregan en memoria.')
+            block_results, carry = [], None
+            df = read_input_view(file_path, mask_path)
+            if not df.index.is_monotonic_increasing:
+                df = df.sort_index()
+            process_block(df)
+            break
+
+        if chunk.empty:
+            continue
+
+        # Separa los periodos completos del ultimo, que puede continuar en el bloque siguiente
+        last_period_start = chunk.resample(coarsest_rule).size().index[-1]
+        complete_periods = chunk.index < last_period_start
+        carry = chunk[~complete_periods]
+
+        if complete_periods.any():
+            process_block(chunk[complete_periods])
+
+    # Agrega el ultimo periodo pendiente
+    if carry is not None and not carry.empty:
+        process_block(carry)
+
+    # Une los bloques y completa los periodos sin datos
+    results = {}
+    for name, rule in frequencies.items():
+        results[name] = {}
+        for statistic in statistics:
+            df_statistic = pd.concat([block[name][statistic] for block in block_results]).asfreq(rule)
+            if statistic in ['count', 'coverage']:
+                df_statistic = df_statistic.fillna(0)
+            df_statistic.index.name = storage.index_name
+            results[name][statistic] = df_statistic
+
+    return results
+
+
+# Funcion para construir las rutas de salida de un sensor
+def build_output_filepaths(sensor_name):
+    """
+    Devuelve un diccionario {(frecuencia, estadistico): ruta base} con los archivos de
+    salida de un sensor. El promedio conserva el nombre <sensor>_<frecuencia>
+    (ej. piezo-data_SDH1PS01_daily) y los demas estadisticos agregan un sufijo.
+    """
+    output_filepaths = {}
+    for frequency_name in aggregation_frequencies:
+        frequency_path = os.path.join(output_root_path, f'03_{frequency_name}')
+        for statistic in aggregation_statistics:
+            output_filename = f'{sensor_name}_{frequency_name}'
+            if statistic != 'mean':
+                output_filename = f'{output_filename}_{statistic}'
+            output_filepaths[(frequency_name, statistic)] = os.path.join(frequency_path, output_filename)
+    return output_filepaths
+
+
+# Funcion de agregacion de un archivo (unidad de trabajo en paralelo)
+def process_file(filepath, mask_path=None):
+    """
+    Agrega un archivo en todas las frecuencias y estadisticos configurados y guarda
+    un archivo por frecuencia y estadistico. Cada llamada es independiente, por lo
+    que los archivos se pueden procesar en paralelo.
+    """
+    # Define el nombre del sensor a partir de la ruta del archivo
+    sensor = stage_sensor(filepath)
+    print(f'Procesando {sensor}')
+
+    # Construye las rutas de salida (sin extension) de cada frecuencia y estadistico
+    output_filepaths = build_output_filepaths(sensor)
+
+    # Archivos de entrada: la etapa y, si se pide y existe, la mascara de outliers (aun si
+    # esta desactualizada, para volver a agregar cuando 02b la actualice)
+    mask_exists = mask_path is not None and os.path.exists(mask_path)
+    input_paths = storage.stage_files(filepath) + ([mask_path] if mask_exists else [])
+
+    # Compara la huella de los archivos de entrada, la configuracion y el codigo con la guardada
+    with instrumentation.stage(instrumentation.fingerprint_stage,
+                               bytes_read=instrumentation.path_bytes(input_paths)):
+        up_to_date, fingerprint = stage_cache.check_target(
+            output_root_path, sensor, input_paths,
+            config=stage_cache.config_digest(aggregation_frequencies, aggregation_statistics,
+                                             storage.output_formats, dtype_policy.compact_storage,
+                                             dtype_policy.unit_decimals, dtype_policy.round_trip_tolerance,
+                                             apply_outlier_masks),
+            code=stage_cache.code_digest(current_outlier_mask, iter_input_chunks, read_input_view,
+                                         outlier_detectors.load_mask_metadata, outlier_detectors.mask_matches_axis,
+                                         outlier_detectors.mask_frame, outlier_detectors.iter_masked_chunks,
+                                         outlier_detectors.apply_outlier_mask, outlier_detectors.load_outlier_mask,
+                                         aggregate_unsorted_to_daily_mean, daily_mean, aggregate_to_daily_mean,
+                                         sort_frequencies, compute_partial_aggregates,
+                                         combine_partial_aggregates, finalize_statistics,
+                                         aggregate_block, aggregate_statistics,
+                                         build_output_filepaths, process_file),
+            outputs_exist=all(storage.stage_exists(path) for path in output_filepaths.values()))
+    if up_to_date:
+        print('  Sin cambios desde la ultima ejecucion, se omite.\n')
+        return
+
+    # Usa la mascara solo si corresponde a las filas actuales de la etapa
+    mask_path = current_outlier_mask(filepath, mask_path)
+
+    # Si solo se pide el promedio diario se usa la agregacion diaria directa
+    # (la agregacion lee la etapa por bloques, por lo que rows_in no se conoce de antemano)
+    with instrumentation.stage('agregacion',
+                               bytes_read=instrumentation.path_bytes(storage.stage_read_files(filepath))) as record:
+        if aggregation_frequencies == {'daily': 'D'} and aggregation_statistics == ['mean']:
+            results = {'daily': {'mean': aggregate_to_daily_mean(filepath, mask_path=mask_path)}}
+        else:
+            results = aggregate_statistics(filepath, mask_path=mask_path)
+        record['rows_out'] = sum(len(df_statistic) for frequency_results in results.values()
+                                 for df_statistic in frequency_results.values())
+    print(f'  Datos agregados: {", ".join(results)}.')
+
+    with instrumentation.stage('escritura', rows_in=record['rows_out']) as record:
+        written_paths = []
+        for frequency_name, frequency_results in results.items():
+
+            # Crea la carpeta de salida de la frecuencia en caso de que no exista
+            os.makedirs(os.path.join(output_root_path, f'03_{frequency_name}'), exist_ok=True)
+
+            # Exporta cada estadistico en los formatos configurados en storage
+            for statistic, df_statistic in frequency_results.items():
+                written_paths += storage.write_stage(df_statistic, output_filepaths[(frequency_name, statistic)])
+
+        stage_cache.save_fingerprint(output_root_path, sensor, fingerprint)
+        record['bytes_written'] = instrumentation.path_bytes(written_paths)
+
+    output_folders = [os.path.join(output_root_path, f'03_{name}') for name in results]
+    print(f'  Datos procesados guardados en: {", ".join(output_folders)}\n')
+
+
+# MANEJO DE RUTAS Y ARCHIVOS
+
+# Rutas a la carpetas con los datos
+formatted_data_path = os.path.join(storage.processed_root, '01_formatted')
+cleaned_data_path = os.path.join(storage.processed_root, '02_cleaned')
+
+# Ruta a la carpeta con las mascaras de outliers de 02b (con apply_outlier_masks activo)
+outlier_masks_path = os.path.join(storage.processed_root, '02_cleaned')
+
+# Patrones en archivos para buscar dentro de las carpetas (sin extension)
+piezo_pattern = '*cleaned'
+soil_pattern = 'soil-data*formatted'
+
+# Ruta a la carpeta donde se crean las carpetas de salida de cada frecuencia (03_<nombre>)
+output_root_path = storage.processed_root
+
+# Numero de filas leidas por bloque en la agregacion
+aggregation_chunksize = 100_000
 
 
 # BUCLE DE EJECUCION
 
-# Itera sobre cada archivo encontrado
-for filepath in files_to_process:
+# Funcion principal del script (tambien la ejecuta pipeline.py en un solo proceso)
+def main():
+    """
+    Busca los archivos limpios y formateados, agrega cada uno en paralelo y guarda el
+    reporte de la ejecucion.
+    Devuelve las unidades que fallaron ({etiqueta: traceback}).
+    """
+    # Genera listas con las rutas (sin extension) de los archivos que cumplen con los patrones
+    piezo_files = storage.list_stages(cleaned_data_path, piezo_pattern)
+    soil_files = storage.list_stages(formatted_data_path, soil_pattern)
 
-    # Extrae el nombre del archivo desde la ruta completa
-    basename = os.path.basename(filepath)
+    # Combina ambas listas de archivos
+    files_to_process = piezo_files + soil_files
 
-    # Define el nombre del sensor: elimina los sufijos
-    sensor_name = basename.replace('_cleaned.csv', '').replace('_formatted.csv', '')
-    print(f'Procesando {sensor_name}')
+    # Imprime los archivos encontrados
+    if files_to_process:
+        print(f'{len(files_to_process)} archivos identificados:')
+        for filepath in sorted(files_to_process):
+            print(f'  - {filepath}')
 
-    # Aplica la funcion de promedio diario de los datos
-    df_daily = aggregate_to_daily_mean(filepath)
-    print('  Datos agregados diariamente.')
+    # Procesa cada archivo encontrado en paralelo
+    # (con apply_outlier_masks activo, junto a la mascara de outliers de su sensor)
+    _, failures = runner.run_parallel(
+        process_file,
+        {os.path.basename(filepath): (filepath, sensor_mask_path(stage_sensor(filepath)))
+         for filepath in files_to_process})
 
-    # Construye el nombre de salida del archivo
-    output_filename = f'{sensor_name}_daily.csv'
+    # Guarda el reporte de tiempos, memoria y volumen de datos de cada etapa
+    instrumentation.write_run_report(output_root_path, '03_all-data_daily-aggregation')
+    return failures
 
-    # Construye la ruta de salida del archivo
-    output_filepath = os.path.join(output_path, output_filename)
 
-    # Exporta el archivo como csv
-    df_daily.to_csv(output_filepath)
-    print(f'  Datos procesados guardados en: {output_filepath}\n')
\ No newline at end of file
+# El bloque solo se ejecuta al correr el script (no al importarlo desde los procesos del pool)
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
@@ -0,0 +1,63 @@
+# IMPORTACIONES
+
+import os
+import sys
+import storage
+import runner
+import instrumentation
+import station_analysis
+
+
+# MANEJO DE RUTAS Y ARCHIVOS
+
+# La tabla de estaciones (piezometro, datalogger y profundidades) y la carpeta con los
+# datos diarios se definen en station_analysis
+
+# Ruta a la carpeta de salida
+output_path = os.path.join(storage.processed_root, '05_stations')
+
+
+# BUCLE DE EJECUCIÓN
+
+# Funcion principal del script (tambien la ejecuta pipeline.py en un solo proceso)
+def main():
+    """
+    Analiza cada estacion de la tabla en paralelo, guarda las tablas consolidadas y el
+    reporte de la ejecucion.
+    Devuelve las unidades que fallaron ({etiqueta: traceback}).
+    """
+    # Imprime las estaciones de la tabla
+    print(f'{len(station_analysis.stations)} estaciones identificadas:')
+    for station_name, station in station_analysis.stations.items():
+        print(f'  - {station_name}: piezometro {station["piezometer"]}, datalogger {station["datalogger"]}')
+
+    # Omite con un aviso las estaciones cuyas etapas diarias aun no existen (ej. un
+    # datalogger sin datos descargados), sin contarlas como errores
+    available_stations = {}
+    for station_name, station in station_analysis.stations.items():
+        try:
+            station_analysis.station_stages(station)
+        except FileNotFoundError as error:
+            print(f'Se omite la estacion {station_name}: {error}')
+            continue
+        available_stations[station_name] = station
+
+    # Analiza cada estacion en paralelo; un error en una estacion no detiene al resto
+    results, failures = runner.run_parallel(
+        station_analysis.analyze_station,
+        {station_name: (station_name, station) for station_name, station in available_stations.items()})
+
+    # Une los resultados de todas las estaciones y los guarda en una tabla por tipo
+    if results:
+        written_paths = station_analysis.write_result_tables(
+            station_analysis.consolidate(results), output_path)
+        print(f'Resultados de {len(results)} estaciones guardados en: {", ".join(written_paths)}')
+
+    # Guarda el reporte de tiempos, memoria y volumen de datos de cada etapa
+    instrumentation.write_run_report(output_path, '05_all-stations_batch-analysis')
+    return failures
+
+
+# El bloque solo se ejecuta al correr el script (no al importarlo desde los procesos del pool)
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
@@ -0,0 +1,191 @@
+# IMPORTACIONES
+
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+
+# DEFINICION DE VARIABLES AUXILIARES
+
+# Cache opcional de las etapas como arreglos .npy mapeados en memoria. Se activa con la
+# variable de entorno HUASCO_ARRAY_CACHE=1: las lecturas de solo lectura
+# (storage.read_stage_view e iter_stage_chunks) usan vistas sobre los arreglos en vez
+# de leer y convertir el csv o parquet, y los procesos que leen la misma etapa
+# comparten una sola copia en el cache de paginas del sistema operativo
+enabled = os.environ.get('HUASCO_ARRAY_CACHE') == '1'
+
+# Sufijo de la carpeta del cache, junto a la etapa (ruta sin extension)
+cache_suffix = '.arrays'
+
+# Nombre del archivo json con los metadatos de las columnas
+sidecar_name = 'columns.json'
+
+# Tipo de los arreglos de valores (uno por columna, alineados con el indice)
+value_dtype = np.float64
+
+# Campos codificados en el nombre de cada columna: Sensor_profundidad_variable_unidad
+metadata_fields = ['Sensor', 'Depth', 'Variable', 'Unit']
+
+
+# DEFINICION DE FUNCIONES
+
+# Funcion para construir la ruta del cache de una etapa
+def cache_path(base_path):
+    """
+    Devuelve la ruta de la carpeta con los arreglos de una etapa.
+    """
+    return f'{base_path}{cache_suffix}'
+
+
+# Funcion para describir los archivos de origen de una etapa
+def source_state(source_files):
+    """
+    Devuelve el tamano y la fecha de modificacion de cada archivo de origen del cache
+    (los que lee storage), para detectar sin leerlos si la etapa cambio. Cada archivo
+    se identifica con su carpeta, ya que las partes parquet de distintas particiones
+    anuales tienen el mismo nombre.
+    """
+    state = {}
+    for path in sorted(source_files):
+        stat = os.stat(path)
+        key = f'{os.path.basename(os.path.dirname(path))}/{os.path.basename(path)}'
+        state[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    return state
+
+
+# Funcion de lectura de los metadatos del cache de una etapa
+def load_sidecar(base_path):
+    """
+    Lee el json con los metadatos del cache de una etapa, o devuelve None si no existe.
+    """
+    path = os.path.join(cache_path(base_path), sidecar_name)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+# Funcion para verificar si el cache de una etapa esta al dia
+def is_current(base_path, source_files):
+    """
+    Devuelve True si el cache existe y fue construido a partir de los archivos de la
+    etapa en su estado actual (mismo tamano y fecha de modificacion).
+    """
+    sidecar = load_sidecar(base_path)
+    return sidecar is not None and sidecar['source'] == source_state(source_files)
+
+
+# Funcion para extraer los metadatos del nombre de una columna
+def column_metadata(column):
+    """
+    Divide el nombre Sensor_profundidad_variable_unidad de una columna en sus campos
+    (None en los campos que falten). La unidad puede contener guiones bajos.
+    """
+    parts = str(column).split('_', len(metadata_fields) - 1)
+    parts += [None] * (len(metadata_fields) - len(parts))
+    return dict(zip(metadata_fields, parts))
+
+
+# Funcion de construccion del cache de una etapa
+def build_array_cache(base_path, chunks, n_rows, source_files):
+    """
+    Escribe el cache de una etapa a partir de sus bloques (ej. storage.iter_file_chunks)
+    sin cargarla completa: un arreglo int64 con el indice (nanosegundos desde 1970) y
+    un arreglo value_dtype por columna, todos de n_rows filas, mas un json con el
+    nombre, archivo, tipo y metadatos de cada columna y el estado de los archivos de
+    origen. Se escribe en una carpeta temporal que luego reemplaza a la anterior, por
+    lo que los procesos que ya mapearon los arreglos anteriores no se ven afectados.
+    """
+    target_path = cache_path(base_path)
+    temporary_path = f'{target_path}.tmp-{os.getpid()}'
+    shutil.rmtree(temporary_path, ignore_errors=True)
+    os.makedirs(temporary_path)
+
+    index_array = np.lib.format.open_memmap(os.path.join(temporary_path, 'index.npy'),
+                                            mode='w+', dtype=np.int64, shape=(n_rows,))
+    sidecar = {'n_rows': n_rows, 'index': {'file': 'index.npy', 'dtype': 'int64'},
+               'columns': [], 'source': source_state(source_files)}
+    value_arrays = None
+    position = 0
+
+    for chunk in chunks:
+        # Los arreglos de valores se crean con las columnas del primer bloque
+        if value_arrays is None:
+            sidecar['index']['name'] = chunk.index.name
+            value_arrays = []
+            for number, column in enumerate(chunk.columns):
+                file_name = f'column_{number:03d}.npy'
+                value_arrays.append(np.lib.format.open_memmap(
+                    os.path.join(temporary_path, file_name), mode='w+',
+                    dtype=value_dtype, shape=(n_rows,)))
+                sidecar['columns'].append({'name': column, 'file': file_name,
+                                           'dtype': np.dtype(value_dtype).name,
+                                           **column_metadata(column)})
+
+        stop = position + len(chunk)
+        index_array[position:stop] = chunk.index.as_unit('ns').asi8
+        for array, column in zip(value_arrays, chunk.columns):
+            array[position:stop] = chunk[column].to_numpy(dtype=value_dtype)
+        position = stop
+
+    if position != n_rows:
+        shutil.rmtree(temporary_path, ignore_errors=True)
+        raise ValueError(f'La etapa {base_path} tiene {position} filas y se esperaban {n_rows}.')
+
+    # Escribe los arreglos a disco antes de publicar el cache
+    for array in [index_array] + (value_arrays or []):
+        array.flush()
+    del index_array, value_arrays
+
+    with open(os.path.join(temporary_path, sidecar_name), 'w', encoding='utf-8') as f:
+        json.dump(sidecar, f, indent=2)
+
+    # Reemplaza el cache anterior (si otro proceso publico uno al mismo tiempo, se
+    # conserva el suyo)
+    if os.path.exists(target_path):
+        old_path = f'{target_path}.old-{os.getpid()}'
+        os.rename(target_path, old_path)
+        shutil.rmtree(old_path, ignore_errors=True)
+    try:
+        os.rename(temporary_path, target_path)
+    except OSError:
+        shutil.rmtree(temporary_path, ignore_errors=True)
+    return sidecar
+
+
+# Funcion de lectura de una etapa como df de solo lectura
+def load_frame(base_path, columns=None):
+    """
+    Devuelve un df cuyas columnas son vistas de solo lectura sobre los arreglos
+    mapeados en memoria del cache (sin copiar ni convertir los datos); asignar valores
+    en el df produce un error. Con columns se mapean solo las columnas indicadas.
+    """
+    directory = cache_path(base_path)
+    sidecar = load_sidecar(base_path)
+
+    index_array = np.load(os.path.join(directory, sidecar['index']['file']), mmap_mode='r')
+    index = pd.DatetimeIndex(index_array.view('datetime64[ns]'), name=sidecar['index'].get('name'),
+                             copy=False)
+
+    selected = [entry for entry in sidecar['columns'] if columns is None or entry['name'] in columns]
+    if columns is not None:
+        order = {column: position for position, column in enumerate(columns)}
+        selected.sort(key=lambda entry: order[entry['name']])
+    data = {entry['name']: np.load(os.path.join(directory, entry['file']), mmap_mode='r')
+            for entry in selected}
+
+    # copy=False conserva un bloque por columna, cada uno sobre su arreglo mapeado
+    return pd.DataFrame(data, index=index, columns=[entry['name'] for entry in selected], copy=False)
+
+
+# Funcion de lectura de los metadatos de las columnas del cache
+def column_table(base_path):
+    """
+    Devuelve un df indexado por nombre de columna con los metadatos guardados en el
+    json del cache (Sensor, Depth, Variable, Unit, archivo y tipo).
+    """
+    sidecar = load_sidecar(base_path)
+    return pd.DataFrame(sidecar['columns']).set_index('name').rename_axis('Column')
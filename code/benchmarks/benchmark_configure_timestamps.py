@@ -0,0 +1,46 @@
+# IMPORTACIONES
+
+import os
+import tempfile
+
+from run_benchmarks import load_script, time_function
+from synthetic_data import write_synthetic_compensated_xlsx
+
+
+# DEFINICION DE VARIABLES AUXILIARES
+
+# Un ano de registros cada 5 minutos
+n_days = 365
+interval_minutes = 5
+
+# Numero de repeticiones de cada medicion (se reporta la menor)
+n_repeats = 3
+
+
+# BUCLE DE EJECUCION
+
+if __name__ == '__main__':
+
+    piezometer_script = load_script('01a_piezometric-data_formatting.py')
+
+    with tempfile.TemporaryDirectory() as tmp_path:
+        file_path = os.path.join(tmp_path, 'Data_synthetic_ SDHBENCH_COMPENSADA.xlsx')
+        n_rows = write_synthetic_compensated_xlsx(file_path, n_days, interval_minutes)
+        print(f'Archivo sintetico: {n_rows} registros cada {interval_minutes} minutos.')
+
+        # Lectura con pd.read_excel y union de strings de fecha y hora
+        time_pandas, df_pandas = time_function(
+            piezometer_script.configure_timestamps, file_path, False, repeats=n_repeats)
+
+        # Lectura directa con openpyxl en modo de solo lectura
+        time_fast, df_fast = time_function(
+            piezometer_script.configure_timestamps, file_path, True, repeats=n_repeats)
+
+    # Verifica que ambos lectores producen el mismo df formateado
+    identical = piezometer_script.format_columns(df_pandas).equals(
+        piezometer_script.format_columns(df_fast))
+
+    print(f'  pd.read_excel + strings:  {time_pandas:.2f} s')
+    print(f'  read_compensated_xlsx:    {time_fast:.2f} s')
+    print(f'  Aceleracion:              {time_pandas / time_fast:.2f}x')
+    print(f'  Resultados identicos:     {identical}')
@@ -0,0 +1,133 @@
+# IMPORTACIONES
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from run_benchmarks import base_days, piezometer_interval_minutes, load_script
+from synthetic_data import synthetic_field_campaigns, synthetic_piezometer_df
+
+
+# DEFINICION DE VARIABLES AUXILIARES
+
+# Tamano de bloque pequeno para que los periodos se repartan entre varios bloques
+check_chunksize = 10_000
+
+# Estadisticos que se derivan de agregados parciales sumando en otro orden; los demas
+# deben ser identicos a resample
+rounded_statistics = ['mean', 'std']
+
+
+# DEFINICION DE FUNCIONES
+
+# Funcion de calculo de un estadistico con resample sobre los registros
+def resample_statistic(df, rule, statistic):
+    """
+    Calcula un estadistico de aggregation_statistics directamente con resample(rule).
+    """
+    resampled = df.resample(rule)
+    if statistic.startswith('q'):
+        return resampled.quantile(int(statistic[1:]) / 100)
+    return getattr(resampled, statistic)()
+
+
+# Funcion de diferencia relativa a la escala de cada periodo
+def scaled_difference(result, expected, df, rule):
+    """
+    Devuelve la mayor diferencia absoluta entre dos df agregados dividida por el mayor
+    valor absoluto de cada columna en el periodo.
+    """
+    scale = np.maximum(df.resample(rule).max().abs(), df.resample(rule).min().abs())
+    return ((result - expected).abs() / scale).max().max()
+
+
+# Funcion de verificacion del promedio diario
+def check_daily_mean(aggregation_script, df, stage_path, sorted_stage):
+    """
+    Compara aggregate_to_daily_mean, calculado por bloques, con resample('D').mean()
+    sobre la etapa completa. Con registros ordenados el resultado debe ser identico;
+    sin orden temporal se admite partial_aggregate_tolerance. Devuelve True si cumple.
+    """
+    result = aggregation_script.aggregate_to_daily_mean(stage_path, chunksize=check_chunksize)
+    expected = df.resample('D').mean()
+    if result.equals(expected):
+        print('  identico')
+        return True
+
+    tolerance = 0 if sorted_stage else aggregation_script.partial_aggregate_tolerance
+    difference = scaled_difference(result, expected, df, 'D')
+    within = difference <= tolerance and not sorted_stage
+    print(f'  diferencia relativa {difference:.1e} '
+          f'({"dentro" if within else "fuera"} de la tolerancia {tolerance:.0e})')
+    return within
+
+
+# Funcion de verificacion de los agregados parciales
+def check_partial_aggregates(aggregation_script, df, stage_path):
+    """
+    Compara aggregate_statistics, calculado por bloques, con resample sobre la etapa
+    completa para cada frecuencia y estadistico (salvo la cobertura, que no tiene
+    equivalente en pandas). Devuelve True si todos quedan dentro de la tolerancia.
+    """
+    results = aggregation_script.aggregate_statistics(stage_path, chunksize=check_chunksize)
+    tolerance = aggregation_script.partial_aggregate_tolerance
+    passed = True
+
+    for name, rule in aggregation_script.aggregation_frequencies.items():
+        for statistic in aggregation_script.aggregation_statistics:
+            if statistic == 'coverage':
+                continue
+            expected = resample_statistic(df, rule, statistic)
+            result = results[name][statistic]
+            if statistic == 'count':
+                identical = result.astype('int64').equals(expected)
+            else:
+                identical = result.equals(expected)
+
+            # El promedio y la desviacion estandar admiten la tolerancia documentada
+            if identical:
+                print(f'  {name:<8} {statistic:<8} identico')
+            elif statistic in rounded_statistics:
+                difference = scaled_difference(result, expected, df, rule)
+                within = difference <= tolerance
+                passed = passed and within
+                print(f'  {name:<8} {statistic:<8} diferencia relativa {difference:.1e} '
+                      f'({"dentro" if within else "fuera"} de la tolerancia {tolerance:.0e})')
+            else:
+                passed = False
+                print(f'  {name:<8} {statistic:<8} distinto')
+
+    return passed
+
+
+# BUCLE DE EJECUCION
+
+if __name__ == '__main__':
+
+    aggregation_script = load_script('03_all-data_daily-aggregation.py')
+    import storage
+
+    campaigns = synthetic_field_campaigns('2024-05-22', base_days)
+    df = synthetic_piezometer_df(base_days, piezometer_interval_minutes, campaigns)
+    print(f'Etapa sintetica: {len(df)} registros cada {piezometer_interval_minutes} minutos.')
+
+    with tempfile.TemporaryDirectory() as tmp_path:
+        stage_path = os.path.join(tmp_path, 'piezo-data_SDHCHECK_cleaned')
+        storage.write_stage(df, stage_path)
+        df = storage.read_stage(stage_path)
+
+        # Misma etapa con los registros desordenados (ruta de sumas diarias acumuladas)
+        shuffled_path = os.path.join(tmp_path, 'piezo-data_SDHSHUFFLED_cleaned')
+        storage.write_stage(df.sample(frac=1, random_state=0), shuffled_path)
+
+        print('aggregate_to_daily_mean frente a resample(\'D\').mean(), registros ordenados:')
+        passed = check_daily_mean(aggregation_script, df, stage_path, sorted_stage=True)
+        print('aggregate_to_daily_mean frente a resample(\'D\').mean(), registros desordenados:')
+        passed = check_daily_mean(aggregation_script, df, shuffled_path, sorted_stage=False) and passed
+        print('aggregate_statistics frente a resample:')
+        passed = check_partial_aggregates(aggregation_script, df, stage_path) and passed
+
+    print(f'Verificacion {"superada" if passed else "fallida"}.')
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,229 @@
+# IMPORTACIONES
+
+import datetime
+import importlib.util
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import synthetic_data
+
+
+# DEFINICION DE VARIABLES AUXILIARES
+
+# Carpeta con los scripts del flujo de trabajo
+code_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Escalas respecto del volumen de datos actual. Se pueden fijar con la variable de
+# entorno HUASCO_BENCHMARK_SCALES (ej. HUASCO_BENCHMARK_SCALES=1,10)
+scales = [int(scale) for scale in os.environ.get('HUASCO_BENCHMARK_SCALES', '1,10,100').split(',')]
+
+# Volumen de datos actual (1x): ~14 meses de un piezometro cada 10 minutos y de un
+# datalogger cada 15 minutos, con una exportacion cada ~3 meses
+base_days = 420
+piezometer_interval_minutes = 10
+datalogger_interval_minutes = 15
+days_per_export = 90
+
+# Parametros del analisis de correlaciones (los mismos del sitio web)
+lag_days = 15
+window_days = 61
+
+# Limite de filas de una hoja de Excel: las escalas mayores no se pueden generar
+excel_max_rows = 1_048_576
+
+# Numero de repeticiones de cada medicion de tiempo (se reporta la menor). En las
+# escalas mayores a 1x se mide una sola vez para acotar la duracion total
+n_repeats = 3
+
+# Carpeta donde se guardan los resultados en formato json
+results_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+# DEFINICION DE FUNCIONES
+
+# Funcion para importar un script del flujo de trabajo sin ejecutar su bucle principal
+def load_script(filename):
+    """
+    Importa un script numerado (ej. 01a_...) como modulo a partir de su nombre de archivo.
+    """
+    if code_path not in sys.path:
+        sys.path.insert(0, code_path)
+    spec = importlib.util.spec_from_file_location(
+        filename.split('_')[0], os.path.join(code_path, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# Funcion de medicion de tiempo
+def time_function(function, *args, repeats=n_repeats):
+    """
+    Ejecuta una funcion varias veces y devuelve el menor tiempo y el ultimo resultado.
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(*args)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+# Funcion de medicion de memoria
+def peak_memory(function, *args):
+    """
+    Ejecuta una funcion con tracemalloc activo y devuelve el maximo de memoria asignada
+    (MB) durante la llamada. Incluye los arreglos de numpy y pandas. Se mide en una
+    ejecucion aparte porque tracemalloc hace mas lenta la ejecucion.
+    """
+    tracemalloc.start()
+    try:
+        function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024 ** 2
+
+
+# Funcion de medicion de una etapa
+def measure(stage, scale, n_rows, function, *args):
+    """
+    Mide el tiempo y la memoria de una funcion y devuelve un registro de resultados.
+    """
+    seconds, _ = time_function(function, *args, repeats=n_repeats if scale <= 1 else 1)
+    peak_mb = peak_memory(function, *args)
+    print(f'  {stage:<28} {scale:>4}x {n_rows:>10} filas {seconds:>9.3f} s {peak_mb:>9.1f} MB')
+    return {'stage': stage, 'scale': scale, 'rows': n_rows,
+            'seconds': round(seconds, 6), 'peak_memory_mb': round(peak_mb, 3)}
+
+
+# Funcion de registro de una etapa omitida
+def skipped(stage, scale, n_rows, reason):
+    """
+    Devuelve el registro de una etapa que no se pudo medir en una escala.
+    """
+    print(f'  {stage:<28} {scale:>4}x {n_rows:>10} filas  omitida: {reason}')
+    return {'stage': stage, 'scale': scale, 'rows': n_rows, 'skipped': reason}
+
+
+# Funcion de ejecucion de las etapas en una escala
+def run_scale(scripts, storage, correlation, scale, tmp_path):
+    """
+    Genera los datos sinteticos de una escala y mide cada etapa del flujo de trabajo.
+    """
+    n_days = base_days * scale
+    results = []
+
+    # 01a: lectura de un libro *COMPENSADA.xlsx
+    n_rows = n_days * 24 * 60 // piezometer_interval_minutes
+    if n_rows + 1 > excel_max_rows:
+        results.append(skipped('configure_timestamps', scale, n_rows,
+                               f'{n_rows + 1} filas superan el limite de filas de Excel ({excel_max_rows})'))
+    else:
+        xlsx_path = os.path.join(tmp_path, f'Data_synthetic_ SDHBENCH{scale}_COMPENSADA.xlsx')
+        synthetic_data.write_synthetic_compensated_xlsx(
+            xlsx_path, n_days, piezometer_interval_minutes, write_only=n_rows > 100_000)
+        results.append(measure('configure_timestamps', scale, n_rows,
+                               scripts['01a'].configure_timestamps, xlsx_path))
+
+    # 01b: lectura por bloques, formateo y escritura de la etapa de un datalogger (sin
+    # unir las exportaciones en memoria, a diferencia de la antigua concatenacion)
+    datalogger_path = os.path.join(tmp_path, f'datalogger_{scale}')
+    os.makedirs(datalogger_path, exist_ok=True)
+    export_paths, n_rows = synthetic_data.write_synthetic_datalogger_exports(
+        datalogger_path, 'z6-25818', n_days, datalogger_interval_minutes,
+        n_exports=max(1, n_days // days_per_export))
+    results.append(measure('read_format_write_datalogger', scale, n_rows,
+                           scripts['01b'].write_datalogger_stage, export_paths,
+                           scripts['01b'].datalogger_ports_map['z6-25818'],
+                           os.path.join(tmp_path, f'soil-data_SDHBENCH{scale}_formatted')))
+
+    # 02a: outliers de todas las campanas
+    campaigns = synthetic_data.synthetic_field_campaigns('2024-05-22', n_days)
+    piezometer_df = synthetic_data.synthetic_piezometer_df(
+        n_days, piezometer_interval_minutes, campaigns)
+    results.append(measure('identify_campaign_outliers', scale, len(piezometer_df),
+                           scripts['02a'].identify_campaign_outliers, piezometer_df, campaigns))
+
+    # 03: promedio diario de una etapa guardada
+    stage_path = os.path.join(tmp_path, f'piezo-data_SDHBENCH{scale}_cleaned')
+    storage.write_stage(piezometer_df, stage_path)
+    results.append(measure('aggregate_to_daily_mean', scale, len(piezometer_df),
+                           scripts['03'].aggregate_to_daily_mean, stage_path))
+
+    # Analisis: correlaciones cruzadas y moviles de las series diarias diferenciadas
+    diff_wide_df = synthetic_data.synthetic_daily_wide_df(n_days).diff().diff().dropna()
+    groundwater_col = 'Piezometer_NA_groundwater-depth_m'
+    column_labels = {column: tuple(column.split('_')[1:3])
+                     for column in diff_wide_df.columns if column != groundwater_col}
+    lags = np.arange(-lag_days, lag_days + 1)
+    results.append(measure('cross_correlation_df', scale, len(diff_wide_df),
+                           correlation.cross_correlation_df,
+                           diff_wide_df, groundwater_col, column_labels, lags))
+    results.append(measure('rolling_correlation_df', scale, len(diff_wide_df),
+                           correlation.rolling_correlation_df,
+                           diff_wide_df, groundwater_col, column_labels, window_days))
+
+    return results
+
+
+# Funcion con la informacion del entorno de ejecucion
+def environment_info():
+    """
+    Devuelve las versiones y el hardware con que se midieron los resultados.
+    """
+    return {'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count()}
+
+
+# BUCLE DE EJECUCION
+
+if __name__ == '__main__':
+
+    # Importa los scripts del flujo de trabajo y los modulos auxiliares
+    scripts = {
+        '01a': load_script('01a_piezometric-data_formatting.py'),
+        '01b': load_script('01b_soil-data_formatting.py'),
+        '02a': load_script('02a_piezometric-data_cleaning.py'),
+        '03': load_script('03_all-data_daily-aggregation.py')
+    }
+    import storage
+    import correlation
+
+    print(f'Escalas: {", ".join(f"{scale}x" for scale in scales)} '
+          f'(1x = {base_days} dias de datos)')
+
+    results = []
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as tmp_path:
+            results.extend(run_scale(scripts, storage, correlation, scale, tmp_path))
+
+    # Informa las etapas que no se pudieron medir (ej. xlsx sobre el limite de Excel)
+    skipped_results = [result for result in results if 'skipped' in result]
+    if skipped_results:
+        print(f'{len(skipped_results)} mediciones omitidas:')
+        for result in skipped_results:
+            print(f'  {result["stage"]} {result["scale"]}x: {result["skipped"]}')
+
+    # Guarda los resultados con la fecha de ejecucion para comparar entre versiones
+    os.makedirs(results_path, exist_ok=True)
+    created = datetime.datetime.now()
+    output_file = os.path.join(results_path, f'benchmark_{created:%Y%m%d-%H%M%S}.json')
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump({'created': created.isoformat(timespec='seconds'),
+                   'base_days': base_days,
+                   'environment': environment_info(),
+                   'skipped': [f'{result["stage"]} {result["scale"]}x' for result in skipped_results],
+                   'results': results}, f, indent=2)
+    print(f'Resultados guardados en: {output_file}')
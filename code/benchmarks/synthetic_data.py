@@ -0,0 +1,200 @@
+# IMPORTACIONES
+
+import datetime
+import os
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+
+# DEFINICION DE VARIABLES AUXILIARES
+
+# Columnas de una exportacion de los dataloggers z6: puerto, sensor y unidad con
+# nombre de la variable, en el mismo orden que las exportaciones reales
+datalogger_columns = [
+    ('Port1', 'TEROS 12 Moisture/Temp/EC', ' m3/m3 Water Content'),
+    ('Port1', 'TEROS 12 Moisture/Temp/EC', ' degree_C Soil Temperature'),
+    ('Port1', 'TEROS 12 Moisture/Temp/EC', ' mS/cm Saturation Extract EC'),
+    ('Port2', 'TEROS 12 Moisture/Temp/EC', ' m3/m3 Water Content'),
+    ('Port2', 'TEROS 12 Moisture/Temp/EC', ' degree_C Soil Temperature'),
+    ('Port2', 'TEROS 12 Moisture/Temp/EC', ' mS/cm Saturation Extract EC'),
+    ('Port3', 'TEROS 12 Moisture/Temp/EC', ' m3/m3 Water Content'),
+    ('Port3', 'TEROS 12 Moisture/Temp/EC', ' degree_C Soil Temperature'),
+    ('Port3', 'TEROS 12 Moisture/Temp/EC', ' mS/cm Saturation Extract EC'),
+    ('Port4', 'TEROS 21 Water Potential/Temp', ' kPa Matric Potential'),
+    ('Port4', 'TEROS 21 Water Potential/Temp', ' degree_C Soil Temperature'),
+    ('Port5', 'TEROS 21 Water Potential/Temp', ' kPa Matric Potential'),
+    ('Port5', 'TEROS 21 Water Potential/Temp', ' degree_C Soil Temperature'),
+    ('Port7', 'Battery', '% Battery Percent'),
+    ('Port7', 'Battery', ' mV Battery Voltage'),
+    ('Port8', 'Barometer', ' kPa Reference Pressure'),
+    ('Port8', 'Barometer', ' degree_C Logger Temperature')
+]
+
+
+# DEFINICION DE FUNCIONES
+
+# Funcion para generar una serie suave con ciclo anual, ciclo diario y ruido
+def synthetic_signal(rng, n_rows, rows_per_day, mean, annual_amplitude, daily_amplitude, noise):
+    """
+    Genera una serie similar a las medidas en terreno: un ciclo anual, un ciclo
+    diario y ruido gaussiano alrededor de un valor medio.
+    """
+    days = np.arange(n_rows) / rows_per_day
+    return (mean
+            + annual_amplitude * np.sin(2 * np.pi * days / 365)
+            + daily_amplitude * np.sin(2 * np.pi * days)
+            + rng.normal(0, noise, n_rows))
+
+
+# Funcion para generar un archivo *COMPENSADA.xlsx sintetico
+def write_synthetic_compensated_xlsx(file_path, n_days, interval_minutes, seed=0, write_only=False):
+    """
+    Escribe un libro con el formato de los archivos compensados de los piezometros:
+    Date, Time, ms, LEVEL, TEMPERATURE, NE_m y Cota_m. Devuelve el numero de registros.
+    """
+    rng = np.random.default_rng(seed)
+    n_rows = n_days * 24 * 60 // interval_minutes
+    start = datetime.datetime(2024, 5, 23)
+    step = datetime.timedelta(minutes=interval_minutes)
+
+    # Series con variaciones suaves y ruido, similares a las medidas en terreno
+    level = 0.45 + 0.05 * np.sin(np.linspace(0, 2 * np.pi, n_rows)) + rng.normal(0, 0.001, n_rows)
+    temperature = 8 + 2 * np.sin(np.linspace(0, 730 * np.pi, n_rows)) + rng.normal(0, 0.01, n_rows)
+
+    # Por defecto se usa el modo normal (no write_only) para que el libro incluya la
+    # dimension de la hoja, igual que los archivos exportados por el software de los
+    # piezometros. En libros grandes write_only evita mantener todas las celdas en memoria
+    workbook = openpyxl.Workbook(write_only=write_only)
+    worksheet = workbook.create_sheet('COMPENSADA') if write_only else workbook.active
+    worksheet.title = 'COMPENSADA'
+    worksheet.append(['Date', 'Time', 'ms', 'LEVEL', 'TEMPERATURE', 'NE_m', 'Cota_m'])
+    for i in range(n_rows):
+        timestamp = start + i * step
+        worksheet.append([
+            datetime.datetime.combine(timestamp.date(), datetime.time()),
+            timestamp.time(),
+            0,
+            round(level[i], 4),
+            round(temperature[i], 3),
+            round(1.05 - level[i], 4),
+            round(3828.499 - (1.05 - level[i]), 4)
+        ])
+    workbook.save(file_path)
+    return n_rows
+
+
+# Funcion para generar exportaciones sinteticas de un datalogger z6
+def write_synthetic_datalogger_exports(folder_path, datalogger_name, n_days, interval_minutes=15,
+                                       n_exports=1, seed=0):
+    """
+    Escribe n_exports archivos csv consecutivos de un datalogger z6 con el encabezado
+    de 3 lineas de las exportaciones reales (puertos, '# Records' y sensores, unidades).
+    Devuelve la lista de rutas escritas y el numero total de registros.
+    """
+    rng = np.random.default_rng(seed)
+    rows_per_day = 24 * 60 // interval_minutes
+    n_rows = n_days * rows_per_day
+    timestamps = pd.date_range('2024-05-22 10:30', periods=n_rows, freq=f'{interval_minutes}min')
+
+    # Valores de cada columna segun la variable que representa
+    signal_parameters = {
+        'Water Content': (0.3, 0.1, 0.005, 0.002, 3),
+        'Soil Temperature': (12, 6, 3, 0.1, 1),
+        'Saturation Extract EC': (0.2, 0.1, 0.01, 0.005, 3),
+        'Matric Potential': (-300, 250, 20, 5, 1),
+        'Battery Percent': (85, 5, 0, 1, 0),
+        'Battery Voltage': (7600, 100, 0, 10, 0),
+        'Reference Pressure': (64.8, 0.3, 0.1, 0.02, 2),
+        'Logger Temperature': (14, 7, 8, 0.2, 1)
+    }
+    data = {}
+    for i, (_, _, unit_variable) in enumerate(datalogger_columns):
+        variable = unit_variable.strip().split(' ', 1)[1]
+        mean, annual, daily, noise, decimals = signal_parameters[variable]
+        data[i] = synthetic_signal(rng, n_rows, rows_per_day, mean, annual, daily, noise).round(decimals)
+    data_df = pd.DataFrame(data)
+    data_df.insert(0, 'Timestamps', timestamps.strftime('%Y/%m/%d %H:%M:%S'))
+
+    # Cada exportacion contiene un tramo consecutivo de registros
+    written_paths = []
+    for export_number, export_rows in enumerate(np.array_split(np.arange(n_rows), n_exports)):
+        export_df = data_df.iloc[export_rows]
+        file_path = os.path.join(
+            folder_path, f'{datalogger_name}({datalogger_name})-Configuration 3-{1756238685 + export_number}.csv')
+        header_lines = [
+            ','.join([datalogger_name] + [port for port, _, _ in datalogger_columns]),
+            ','.join([f'# Records: {len(export_df)}'] + [sensor for _, sensor, _ in datalogger_columns]),
+            ','.join(['Timestamps'] + [unit for _, _, unit in datalogger_columns])
+        ]
+        with open(file_path, 'w', encoding='utf-8-sig', newline='') as f:
+            f.write('\n'.join(header_lines) + '\n')
+            export_df.to_csv(f, header=False, index=False, lineterminator='\n')
+        written_paths.append(file_path)
+
+    return written_paths, n_rows
+
+
+# Funcion para generar un calendario sintetico de campanas de terreno
+def synthetic_field_campaigns(start, n_days, interval_days=60, duration_days=4):
+    """
+    Genera un diccionario de campanas con el mismo formato que field_campaigns: nombre
+    y rango de fechas de trabajo, una campana cada interval_days dias.
+    """
+    campaigns = {}
+    for offset in range(interval_days // 2, n_days, interval_days):
+        campaign_start = pd.Timestamp(start) + pd.Timedelta(days=offset)
+        campaign_name = f'{campaign_start:%b %Y} ({offset})'
+        campaigns[campaign_name] = pd.date_range(start=campaign_start, periods=duration_days)
+    return campaigns
+
+
+# Funcion para generar un df formateado de piezometro
+def synthetic_piezometer_df(n_days, interval_minutes=10, campaigns=None, seed=0):
+    """
+    Genera un df con el formato de salida de 01a (Timestamps como indice y las
+    columnas de temperatura, profundidad y cota del nivel freatico). Si se entregan
+    campanas, se agregan valores anomalos durante ellas, como los que genera la
+    manipulacion de los piezometros en terreno.
+    """
+    rng = np.random.default_rng(seed)
+    rows_per_day = 24 * 60 // interval_minutes
+    n_rows = n_days * rows_per_day
+    index = pd.date_range('2024-05-22', periods=n_rows, freq=f'{interval_minutes}min', name='Timestamps')
+
+    depth = synthetic_signal(rng, n_rows, rows_per_day, 0.6, 0.15, 0.005, 0.002)
+    df = pd.DataFrame({
+        'Piezometer_NA_temperature_degreeC': synthetic_signal(rng, n_rows, rows_per_day, 9, 2, 0.2, 0.01),
+        'Piezometer_NA_groundwater-depth_m': depth,
+        'Piezometer_NA_groundwater-level_masl': 3828.499 - depth
+    }, index=index)
+
+    for dates in (campaigns or {}).values():
+        in_campaign = np.flatnonzero((index >= dates.min()) & (index < dates.max()))
+        spikes = rng.choice(in_campaign, size=min(5, len(in_campaign)), replace=False)
+        df.iloc[spikes, 1] += 1.0
+
+    return df
+
+
+# Funcion para generar un df diario en formato ancho para el analisis de correlaciones
+def synthetic_daily_wide_df(n_days, seed=0):
+    """
+    Genera un df diario con la profundidad del nivel freatico y el contenido de agua y
+    la temperatura de tres sensores TEROS12, con las mismas columnas que wide_df.
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2024-05-22', periods=n_days, freq='D', name='Timestamps')
+    groundwater = synthetic_signal(rng, n_days, 1, 0.6, 0.15, 0, 0.01)
+
+    data = {'Piezometer_NA_groundwater-depth_m': groundwater}
+    for variable, unit, mean, amplitude, coupling in [('water-content', 'm3/m3', 0.3, 0.05, -0.5),
+                                                      ('soil-temperature', 'degreeC', 12, 6, 0)]:
+        for depth in ['15cm', '30cm', '48cm']:
+            # Respuesta del suelo al nivel freatico con un desfase de algunos dias
+            lagged = np.roll(groundwater, rng.integers(0, 5))
+            data[f'TEROS12_{depth}_{variable}_{unit}'] = (
+                synthetic_signal(rng, n_days, 1, mean, amplitude, 0, 0.01) + coupling * lagged)
+
+    return pd.DataFrame(data, index=index)
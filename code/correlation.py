@@ -0,0 +1,212 @@
+# IMPORTACIONES
+
+import pandas as pd
+import numpy as np
+
+
+# DEFINICION DE VARIABLES AUXILIARES
+
+# Numero minimo de pares de observaciones para calcular una correlacion (igual que pandas)
+min_pairs = 2
+
+
+# DEFINICION DE FUNCIONES
+
+# Funcion para calcular sumas cruzadas desfasadas mediante fft
+def lagged_sums(a, b, lags):
+    """
+    Calcula, para cada desfase k, la suma sobre t de a[t] * b[t - k], donde a es un
+    arreglo 1-D de largo n y b un arreglo 2-D (n, m). Usa la transformada de Fourier
+    con relleno de ceros, por lo que todos los desfases se obtienen de una vez en
+    O(n log n) por columna. Devuelve un arreglo (len(lags), m).
+    """
+    n = len(a)
+
+    # Largo de la transformada: potencia de 2 que evita la superposicion circular
+    fft_length = 1 << int(2 * n - 1).bit_length()
+
+    a_fft = np.fft.rfft(a, n=fft_length)
+    b_fft = np.fft.rfft(b, n=fft_length, axis=0)
+    sums = np.fft.irfft(a_fft[:, None] * np.conj(b_fft), n=fft_length, axis=0)
+
+    # Los desfases negativos quedan al final del arreglo circular
+    return sums[np.asarray(lags) % fft_length]
+
+
+# Funcion de calculo de la matriz de correlaciones cruzadas
+def cross_correlation_matrix(reference, targets, lags):
+    """
+    Calcula la correlacion de Pearson entre una serie de referencia (1-D) y cada
+    columna de targets (2-D) desplazada en cada desfase, equivalente a
+    pd.Series(reference).corr(pd.Series(target).shift(lag)). Los NaN se excluyen
+    por pares, como en pandas. Devuelve un arreglo (len(lags), numero de columnas).
+    """
+    reference = np.asarray(reference, dtype=np.float64)
+    targets = np.asarray(targets, dtype=np.float64).reshape(len(reference), -1)
+
+    # Mascaras de datos validos; los NaN se reemplazan por cero para no sumar
+    reference_valid = ~np.isnan(reference)
+    targets_valid = ~np.isnan(targets)
+
+    # Se centran las series en su media global para reducir la cancelacion numerica
+    # de las sumas (la correlacion no cambia al restar una constante)
+    x = np.where(reference_valid, reference - np.nanmean(reference), 0.0)
+    y = np.where(targets_valid, targets - np.nanmean(targets, axis=0), 0.0)
+    x_mask = reference_valid.astype(np.float64)
+    y_mask = targets_valid.astype(np.float64)
+
+    # Sumas sobre los pares validos de cada desfase: numero de pares, sumas,
+    # sumas de cuadrados y suma de productos
+    n = np.rint(lagged_sums(x_mask, y_mask, lags))
+    sum_x = lagged_sums(x, y_mask, lags)
+    sum_y = lagged_sums(x_mask, y, lags)
+    sum_xx = lagged_sums(x * x, y_mask, lags)
+    sum_yy = lagged_sums(x_mask, y * y, lags)
+    sum_xy = lagged_sums(x, y, lags)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = sum_xy - sum_x * sum_y / n
+        variance_x = sum_xx - sum_x ** 2 / n
+        variance_y = sum_yy - sum_y ** 2 / n
+        corr = covariance / np.sqrt(variance_x * variance_y)
+
+    # Sin pares suficientes o con una serie constante la correlacion no esta definida
+    corr[(n < min_pairs) | ~(variance_x > 0) | ~(variance_y > 0)] = np.nan
+
+    return np.clip(corr, -1.0, 1.0)
+
+
+# Funcion de calculo de correlaciones cruzadas en formato largo
+def cross_correlation_df(df, reference_col, column_labels, lags):
+    """
+    Calcula las correlaciones cruzadas entre la columna de referencia de un df y las
+    columnas de column_labels, un diccionario {columna: (etiqueta de variable,
+    etiqueta de profundidad)}. Devuelve un df con las columnas Variable-label,
+    Depth-label, Lag y Cross-correlation, ordenado por columna y desfase.
+    """
+    lags = np.asarray(lags)
+    target_cols = list(column_labels)
+
+    corr = cross_correlation_matrix(df[reference_col].to_numpy(),
+                                    df[target_cols].to_numpy(), lags)
+
+    # Cada columna aporta un bloque de filas, una por desfase
+    variable_labels, depth_labels = zip(*column_labels.values())
+    return pd.DataFrame({
+        'Variable-label': np.repeat(variable_labels, len(lags)),
+        'Depth-label': np.repeat(depth_labels, len(lags)),
+        'Lag': np.tile(lags, len(target_cols)),
+        'Cross-correlation': corr.T.ravel()
+    })
+
+
+# Funcion para calcular sumas en ventanas moviles centradas
+def centered_window_sums(cumulative, window):
+    """
+    A partir de sumas acumuladas (con un cero inicial) calcula la suma de cada
+    ventana de largo window centrada en cada fila, con la misma convencion que
+    pandas (rolling(center=True)): la ventana de la fila i va desde
+    i - window // 2 hasta i + (window - 1) // 2, recortada en los bordes.
+    """
+    n = len(cumulative) - 1
+    positions = np.arange(n)
+    end = positions + 1 + (window - 1) // 2
+    start = np.maximum(end - window, 0)
+    return cumulative[np.minimum(end, n)] - cumulative[start]
+
+
+# Funcion de calculo de correlaciones moviles en lote
+def rolling_correlation_matrix(reference, targets, windows, min_periods=None):
+    """
+    Calcula la correlacion de Pearson en ventanas moviles centradas entre una serie
+    de referencia (1-D) y cada columna de targets (2-D) para uno o varios largos de
+    ventana, equivalente a pd.Series(reference).rolling(window, center=True).corr(target).
+    Las sumas acumuladas de la referencia se calculan una sola vez y se comparten
+    entre todas las columnas y ventanas, por lo que cada ventana cuesta O(n) por
+    columna. Devuelve un arreglo (len(windows), n, numero de columnas).
+    """
+    reference = np.asarray(reference, dtype=np.float64)
+    targets = np.asarray(targets, dtype=np.float64).reshape(len(reference), -1)
+
+    # Los NaN se excluyen por pares: una fila cuenta solo si ambas series son validas
+    pair_valid = ~np.isnan(reference)[:, None] & ~np.isnan(targets)
+
+    # Se centran las series en su media global para reducir la cancelacion numerica
+    x = reference - np.nanmean(reference)
+    y = targets - np.nanmean(targets, axis=0)
+
+    # Funcion interna de suma acumulada con un cero inicial
+    def cumulative_sum(values):
+        return np.concatenate([np.zeros((1,) + values.shape[1:]), np.cumsum(values, axis=0)])
+
+    # Sin NaN en las columnas objetivo las sumas de la referencia son comunes a todas
+    # las columnas; si no, se enmascaran por columna
+    if pair_valid.all():
+        x_terms = x[:, None]
+        cum_n = cumulative_sum(np.ones((len(x), 1)))
+    else:
+        x_terms = np.where(pair_valid, x[:, None], 0.0)
+        cum_n = cumulative_sum(pair_valid.astype(np.float64))
+    y_terms = np.where(pair_valid, y, 0.0)
+
+    cum_x = cumulative_sum(x_terms)
+    cum_xx = cumulative_sum(x_terms * x_terms)
+    cum_y = cumulative_sum(y_terms)
+    cum_yy = cumulative_sum(y_terms * y_terms)
+    cum_xy = cumulative_sum(x_terms * y_terms)
+
+    results = []
+    for window in windows:
+        n = centered_window_sums(cum_n, window)
+        sum_x = centered_window_sums(cum_x, window)
+        sum_y = centered_window_sums(cum_y, window)
+        sum_xx = centered_window_sums(cum_xx, window)
+        sum_yy = centered_window_sums(cum_yy, window)
+        sum_xy = centered_window_sums(cum_xy, window)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            covariance = sum_xy - sum_x * sum_y / n
+            variance_x = sum_xx - sum_x ** 2 / n
+            variance_y = sum_yy - sum_y ** 2 / n
+            corr = covariance / np.sqrt(variance_x * variance_y)
+
+        # Igual que pandas, por defecto se exigen ventanas completas
+        required = window if min_periods is None else max(min_periods, 1)
+        corr = np.broadcast_to(corr, targets.shape).copy()
+        corr[np.broadcast_to((n < required) | ~(variance_x > 0), targets.shape)] = np.nan
+        corr[~(variance_y > 0)] = np.nan
+        results.append(corr)
+
+    return np.stack(results)
+
+
+# Funcion de calculo de correlaciones moviles en formato largo
+def rolling_correlation_df(df, reference_col, column_labels, windows, min_periods=None):
+    """
+    Calcula las correlaciones moviles entre la columna de referencia de un df y las
+    columnas de column_labels ({columna: (etiqueta de variable, etiqueta de
+    profundidad)}). Devuelve un df indexado por tiempo con las columnas
+    Rolling-correlation, Variable-label y Depth-label. Si windows es una lista de
+    largos de ventana se agrega la columna Window con el largo de cada fila.
+    """
+    single_window = np.ndim(windows) == 0
+    windows = np.atleast_1d(windows)
+    target_cols = list(column_labels)
+
+    corr = rolling_correlation_matrix(df[reference_col].to_numpy(),
+                                      df[target_cols].to_numpy(), windows, min_periods)
+
+    # Cada ventana y columna aporta un bloque de filas con el indice completo
+    variable_labels, depth_labels = zip(*column_labels.values())
+    n_rows, n_cols = len(df), len(target_cols)
+    rolling_df = pd.DataFrame({
+        'Rolling-correlation': corr.transpose(0, 2, 1).ravel(),
+        'Variable-label': np.tile(np.repeat(variable_labels, n_rows), len(windows)),
+        'Depth-label': np.tile(np.repeat(depth_labels, n_rows), len(windows))
+    }, index=np.tile(df.index, n_cols * len(windows)))
+    rolling_df.index.name = df.index.name
+
+    if not single_window:
+        rolling_df['Window'] = np.repeat(windows, n_rows * n_cols)
+
+    return rolling_df
@@ -0,0 +1,170 @@
+# IMPORTACIONES
+
+import numpy as np
+
+
+# DEFINICION DE VARIABLES AUXILIARES
+
+# Resolucion vertical por defecto de la grilla interpolada (m)
+default_resolution = 0.01
+
+# Metodos de interpolacion disponibles: lineal y spline cubica monotona (PCHIP)
+interpolation_methods = ['linear', 'pchip']
+
+
+# DEFINICION DE FUNCIONES
+
+# Funcion para convertir una etiqueta de profundidad en metros
+def depth_label_to_m(depth_label):
+    """
+    Convierte la profundidad de un nombre de columna (ej. '15cm') en metros (0.15).
+    """
+    return float(depth_label.replace('cm', '')) / 100
+
+
+# Funcion para construir la grilla de profundidades
+def build_depth_grid(sensor_depths, resolution=default_resolution, depth_range=None):
+    """
+    Devuelve las profundidades de la grilla, desde la mas somera hasta la mas
+    profunda de los sensores (o el rango indicado), separadas por resolution.
+    Se redondean para que coincidan exactamente con las profundidades de los sensores.
+    """
+    start, stop = depth_range or (min(sensor_depths), max(sensor_depths))
+    n_depths = int(round((stop - start) / resolution)) + 1
+    return np.round(start + resolution * np.arange(n_depths), 10)
+
+
+# Funcion de calculo de las matrices de pesos de interpolacion
+def interpolation_weights(sensor_depths, target_depths, method='linear'):
+    """
+    Calcula las matrices de pesos que llevan los valores de los sensores (ordenados
+    por profundidad) a las profundidades de la grilla. Devuelve (value_weights,
+    slope_weights), de tamano (profundidades de la grilla, sensores): el perfil
+    interpolado es value_weights @ valores + slope_weights @ pendientes. En el metodo
+    lineal slope_weights es cero; en PCHIP son las bases de Hermite de cada tramo.
+    Las profundidades fuera del rango de los sensores quedan como NaN.
+    """
+    if method not in interpolation_methods:
+        raise ValueError(f'Metodo de interpolacion no reconocido: {method}. '
+                         f'Opciones: {", ".join(interpolation_methods)}.')
+
+    sensor_depths = np.asarray(sensor_depths, dtype=np.float64)
+    target_depths = np.asarray(target_depths, dtype=np.float64)
+    n_sensors = len(sensor_depths)
+
+    # Tramo entre sensores de cada profundidad y posicion relativa dentro de el
+    segment = np.clip(np.searchsorted(sensor_depths, target_depths, side='right') - 1,
+                      0, n_sensors - 2)
+    spacing = sensor_depths[segment + 1] - sensor_depths[segment]
+    t = (target_depths - sensor_depths[segment]) / spacing
+    rows = np.arange(len(target_depths))
+
+    value_weights = np.zeros((len(target_depths), n_sensors))
+    slope_weights = np.zeros((len(target_depths), n_sensors))
+
+    if method == 'linear':
+        value_weights[rows, segment] = 1 - t
+        value_weights[rows, segment + 1] = t
+    else:
+        # Bases de Hermite: valores en los extremos del tramo y pendientes escaladas
+        value_weights[rows, segment] = 2 * t ** 3 - 3 * t ** 2 + 1
+        value_weights[rows, segment + 1] = -2 * t ** 3 + 3 * t ** 2
+        slope_weights[rows, segment] = spacing * (t ** 3 - 2 * t ** 2 + t)
+        slope_weights[rows, segment + 1] = spacing * (t ** 3 - t ** 2)
+
+    # Sin extrapolacion fuera del rango de los sensores
+    outside = (target_depths < sensor_depths[0]) | (target_depths > sensor_depths[-1])
+    value_weights[outside] = np.nan
+    slope_weights[outside] = np.nan
+
+    return value_weights, slope_weights
+
+
+# Funcion de calculo de las pendientes PCHIP de todos los perfiles
+def pchip_slopes(sensor_depths, values):
+    """
+    Calcula las pendientes de la spline cubica monotona (Fritsch-Carlson, como
+    scipy.interpolate.PchipInterpolator) en cada sensor y para todas las fechas a la
+    vez. values es un arreglo (sensores, fechas); devuelve un arreglo del mismo tamano.
+    """
+    spacing = np.diff(sensor_depths)[:, None]
+    secants = np.diff(values, axis=0) / spacing
+    slopes = np.zeros_like(values)
+
+    # Con dos sensores el perfil es lineal
+    if len(sensor_depths) == 2:
+        slopes[:] = secants
+        return slopes
+
+    # Sensores interiores: media armonica ponderada de las secantes vecinas, o cero
+    # si cambian de signo (asi el perfil no sobrepasa los valores medidos)
+    w1 = 2 * spacing[1:] + spacing[:-1]
+    w2 = spacing[1:] + 2 * spacing[:-1]
+    same_sign = np.sign(secants[:-1]) * np.sign(secants[1:]) > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        harmonic = (w1 + w2) / (w1 / secants[:-1] + w2 / secants[1:])
+    slopes[1:-1] = np.where(same_sign, harmonic, 0.0)
+
+    # Extremos: formula de tres puntos no centrada, limitada para conservar la forma
+    for edge, h0, h1, s0, s1 in [(0, spacing[0], spacing[1], secants[0], secants[1]),
+                                 (-1, spacing[-1], spacing[-2], secants[-1], secants[-2])]:
+        slope = ((2 * h0 + h1) * s0 - h0 * s1) / (h0 + h1)
+        slope = np.where(np.sign(slope) != np.sign(s0), 0.0, slope)
+        slope = np.where((np.sign(s0) != np.sign(s1)) & (np.abs(slope) > np.abs(3 * s0)),
+                         3 * s0, slope)
+        slopes[edge] = slope
+
+    return slopes
+
+
+# Funcion de interpolacion de perfiles con un mismo conjunto de sensores validos
+def interpolate_profiles(sensor_depths, values, target_depths, method):
+    """
+    Interpola en profundidad todos los perfiles (columnas de values) con una
+    multiplicacion de matrices por los pesos precalculados.
+    """
+    value_weights, slope_weights = interpolation_weights(sensor_depths, target_depths, method)
+    grid = value_weights @ values
+    if method == 'pchip':
+        grid += slope_weights @ pchip_slopes(sensor_depths, values)
+    return grid
+
+
+# Funcion de interpolacion de una grilla profundidad x tiempo
+def interpolate_depth_grid(values, sensor_depths, resolution=default_resolution,
+                           method='linear', depth_range=None, dtype=np.float64):
+    """
+    Interpola las series de varios sensores de un perfil a una grilla regular de
+    profundidades para todas las fechas a la vez. values es un arreglo (sensores,
+    fechas), por ejemplo wide_df[columnas].to_numpy().T. Devuelve las profundidades
+    de la grilla y un arreglo denso (profundidades, fechas) que se puede entregar
+    directamente a pcolormesh. Las fechas en que falta algun sensor se interpolan
+    solo con los sensores validos (los pesos se calculan una vez por combinacion);
+    con menos de dos sensores validos el perfil queda como NaN.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    sensor_depths = np.asarray(sensor_depths, dtype=np.float64)
+
+    # Ordena los sensores de la superficie hacia abajo
+    order = np.argsort(sensor_depths)
+    sensor_depths, values = sensor_depths[order], values[order]
+
+    target_depths = build_depth_grid(sensor_depths, resolution, depth_range)
+    grid = np.full((len(target_depths), values.shape[1]), np.nan, dtype=dtype)
+
+    # Agrupa las fechas segun que sensores tienen datos validos
+    valid = ~np.isnan(values)
+    patterns, pattern_index = np.unique(valid.T, axis=0, return_inverse=True)
+    pattern_index = pattern_index.ravel()
+
+    for pattern_number, pattern in enumerate(patterns):
+        if pattern.sum() < 2:
+            continue
+        columns = np.flatnonzero(pattern_index == pattern_number)
+
+        # Sin datos faltantes (caso habitual) se evita copiar el arreglo de valores
+        pattern_values = values if len(columns) == values.shape[1] else values[:, columns]
+        grid[:, columns] = interpolate_profiles(
+            sensor_depths[pattern], pattern_values[pattern], target_depths, method)
+
+    return target_depths, grid
@@ -0,0 +1,255 @@
+"""
+Representacion compacta opcional de las etapas (HUASCO_COMPACT_DTYPES=1).
+
+Compromiso entre tamano y precision, medido con los datos de SDH1PS02 y z6-25818:
+las etapas 01 en parquet bajan de 560K a 476K (piezometro) y de 172K a 168K
+(datalogger), ya que la compresion de parquet ya aprovecha gran parte de la
+redundancia de los float64. A cambio, las columnas que se leen en float32 se
+desvian del valor medido en hasta round_trip_tolerance veces la resolucion del
+sensor. Los calculos que acumulan deben convertir a float64 antes (float64_frame,
+usado por 03): asi los promedios diarios difieren de los de la representacion
+float64 en menos de 2e-4 veces la resolucion de cada columna (ej. 1.9e-7 degreeC);
+sin esa conversion las sumas se acumulan en float32 y la desviacion crece con el
+numero de registros de cada periodo.
+"""
+
+# IMPORTACIONES
+# IMPORTACIONES
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# pyarrow es opcional: sin el, la representacion compacta solo se usa en memoria
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+# DEFINICION DE VARIABLES AUXILIARES
+
+# Representacion compacta opcional de las etapas. Se activa con la variable de entorno
+# HUASCO_COMPACT_DTYPES=1: las etapas parquet se guardan con enteros escalados o float32
+# y se leen como float32 cuando no hay perdida a la resolucion del sensor (ver el
+# compromiso entre tamano y precision al inicio del modulo)
+compact_storage = os.environ.get('HUASCO_COMPACT_DTYPES') == '1'
+
+# Numero de decimales con que miden los sensores cada unidad (sufijo _unidad del nombre
+# de columna). Las columnas con unidades no incluidas conservan float64
+unit_decimals = {
+    'm3/m3': 3,     # Contenido de agua TEROS12 (ej. 0.43)
+    'mS/cm': 3,     # Conductividad electrica TEROS12 (ej. 0.379)
+    'kPa': 1,       # Potencial matrico TEROS21 (ej. -693.9)
+    'degreeC': 3,   # Temperatura del piezometro (ej. 9.801) y de los TEROS (ej. 6.3)
+    'm': 4,         # Profundidad del nivel freatico, al 0.1 mm (ej. 0.5969)
+    'masl': 4       # Cota del nivel freatico, al 0.1 mm (ej. 3827.0031)
+}
+
+# Error maximo admitido en la ida y vuelta, como fraccion de la resolucion del sensor
+round_trip_tolerance = 0.05
+
+# Clave de los metadatos del esquema parquet donde se guarda la codificacion compacta
+metadata_key = b'huasco_compact'
+
+
+# DEFINICION DE FUNCIONES
+
+# Funcion para obtener los decimales de una columna a partir de su unidad
+def column_decimals(column):
+    """
+    Devuelve los decimales de medicion de una columna Sensor_profundidad_variable_unidad
+    segun su unidad, o None si la unidad no esta en unit_decimals.
+    """
+    parts = str(column).split('_', 3)
+    return unit_decimals.get(parts[3]) if len(parts) == 4 else None
+
+
+# Funcion de verificacion de una ida y vuelta
+def round_trip_ok(values, decoded, decimals):
+    """
+    Verifica que los valores decodificados difieran de los originales en menos de
+    round_trip_tolerance veces la resolucion del sensor y que los NaN se conserven.
+    """
+    missing = np.isnan(values)
+    if not np.array_equal(missing, np.isnan(decoded)):
+        return False
+    error = np.abs(decoded[~missing] - values[~missing])
+    return error.size == 0 or error.max() <= round_trip_tolerance * 10.0 ** -decimals
+
+
+# Funcion de seleccion del tipo en memoria de una columna
+def memory_dtype(values, decimals):
+    """
+    Devuelve float32 si la columna se puede representar en float32 sin perdida a la
+    resolucion del sensor; si no (ej. cotas de 7 digitos significativos), float64.
+    """
+    if decimals is None:
+        return np.float64
+    values = np.asarray(values, dtype=np.float64)
+    decoded = values.astype(np.float32).astype(np.float64)
+    return np.float32 if round_trip_ok(values, decoded, decimals) else np.float64
+
+
+# Funcion de codificacion de una columna como enteros escalados
+def scaled_integers(values, decimals):
+    """
+    Codifica una columna como enteros (valor x 10^decimales) del menor tipo entero en
+    que caben (int16 o int32). Devuelve los enteros y la mascara de NaN, o (None, None)
+    si los valores no estan en la grilla de resolucion del sensor o no caben en int32.
+    """
+    missing = np.isnan(values)
+    scale = 10 ** decimals
+    scaled = np.rint(np.where(missing, 0, values) * scale)
+
+    # Los valores fuera de la grilla (ej. promedios) no se pueden escalar sin perdida
+    if not round_trip_ok(values, np.where(missing, np.nan, scaled / scale), decimals):
+        return None, None
+
+    for dtype in (np.int16, np.int32):
+        limits = np.iinfo(dtype)
+        if scaled.size == 0 or (scaled.min() >= limits.min and scaled.max() <= limits.max):
+            return scaled.astype(dtype), missing
+    return None, None
+
+
+# Funcion de compactacion en memoria de un df
+def compact_frame(df):
+    """
+    Convierte a float32 las columnas numericas con unidad conocida que no pierden
+    precision a la resolucion del sensor. Las demas columnas no cambian.
+    """
+    compact_columns = {}
+    for column in df.columns:
+        decimals = column_decimals(column)
+        if decimals is None or df[column].dtype != np.float64:
+            continue
+        if memory_dtype(df[column].to_numpy(), decimals) == np.float32:
+            compact_columns[column] = np.float32
+    return df.astype(compact_columns) if compact_columns else df
+
+
+# Funcion de conversion a float64 antes de calcular
+def float64_frame(df):
+    """
+    Convierte a float64 las columnas float32 de un df leido con la representacion
+    compacta, para que los calculos que acumulan (ej. sumas y promedios de la
+    agregacion) se hagan en float64. Las demas columnas no cambian.
+    """
+    float32_columns = [column for column in df.columns if df[column].dtype == np.float32]
+    return df.astype(dict.fromkeys(float32_columns, np.float64)) if float32_columns else df
+
+
+# Funcion de descripcion de un indice de frecuencia fija
+def regular_index_spec(index):
+    """
+    Si el indice temporal tiene un intervalo constante (sin vacios ni duplicados)
+    devuelve su inicio y paso en nanosegundos y su largo; si no, devuelve None.
+    """
+    if len(index) < 2:
+        return None
+    epoch_ns = index.as_unit('ns').asi8
+    steps = np.diff(epoch_ns)
+    if steps[0] <= 0 or not (steps == steps[0]).all():
+        return None
+    return {'start': int(epoch_ns[0]), 'step': int(steps[0]), 'periods': len(index)}
+
+
+# Funcion de codificacion compacta de un df como tabla de pyarrow
+def encode_table(df):
+    """
+    Codifica un df con indice temporal como tabla de pyarrow: cada columna como entero
+    escalado, float32 o float64 (la opcion mas compacta que supera la verificacion de
+    ida y vuelta) y el indice como un rango de frecuencia fija (sin columna) o como
+    enteros int64 de nanosegundos desde 1970. La codificacion se guarda en los
+    metadatos del esquema para que decode_table reconstruya el df.
+    """
+    if pa is None:
+        raise ImportError('Se requiere pyarrow para la codificacion compacta.')
+
+    index_name = df.index.name
+    arrays, names = [], []
+    encoding = {'index': {'name': index_name}, 'columns': {}}
+
+    # Indice: rango de frecuencia fija o int64 de nanosegundos
+    spec = regular_index_spec(df.index)
+    if spec is not None:
+        encoding['index'].update(spec)
+    else:
+        arrays.append(pa.array(df.index.as_unit('ns').asi8, type=pa.int64()))
+        names.append(index_name)
+
+    for column in df.columns:
+        values = df[column].to_numpy(dtype=np.float64)
+        decimals = column_decimals(column)
+        column_encoding = {'memory_dtype': np.dtype(memory_dtype(values, decimals)).name}
+
+        integers, missing = (None, None) if decimals is None else scaled_integers(values, decimals)
+        if integers is not None:
+            arrays.append(pa.array(integers, mask=missing))
+            column_encoding.update(encoding='scaled', decimals=decimals)
+        else:
+            arrays.append(pa.array(values.astype(column_encoding['memory_dtype'])))
+            column_encoding['encoding'] = 'float'
+
+        names.append(str(column))
+        encoding['columns'][str(column)] = column_encoding
+
+    table = pa.Table.from_arrays(arrays, names=names)
+    return table.replace_schema_metadata({metadata_key: json.dumps(encoding)})
+
+
+# Funcion para identificar una tabla o esquema con codificacion compacta
+def is_compact(schema):
+    """
+    Devuelve True si el esquema parquet fue escrito por encode_table.
+    """
+    return schema.metadata is not None and metadata_key in schema.metadata
+
+
+# Funcion para obtener las columnas guardadas que se deben leer
+def stored_columns(schema, columns=None):
+    """
+    Devuelve las columnas de un archivo compacto que se deben leer para obtener las
+    columnas pedidas (incluida la columna del indice, si se guardo como int64).
+    """
+    if columns is None:
+        return None
+    encoding = json.loads(schema.metadata[metadata_key])
+    index_column = [] if 'step' in encoding['index'] else [encoding['index']['name']]
+    return index_column + [column for column in columns if column in encoding['columns']]
+
+
+# Funcion de decodificacion de una tabla (o bloque) compacta
+def decode_table(table, encoding=None, offset=0):
+    """
+    Reconstruye el df de una tabla (o de un bloque de filas leido por partes) escrita
+    por encode_table. offset es la posicion de la primera fila del bloque dentro del
+    archivo y se usa para reconstruir los indices de frecuencia fija.
+    """
+    if encoding is None:
+        encoding = json.loads(table.schema.metadata[metadata_key])
+    index_encoding = encoding['index']
+
+    # Indice temporal
+    if 'step' in index_encoding:
+        epoch_ns = index_encoding['start'] + index_encoding['step'] * (
+            offset + np.arange(table.num_rows, dtype=np.int64))
+    else:
+        epoch_ns = table.column(index_encoding['name']).to_numpy()
+    index = pd.DatetimeIndex(epoch_ns.view('datetime64[ns]'), name=index_encoding['name'])
+
+    # Columnas: los enteros escalados se dividen por 10^decimales; con los nulos como
+    # NaN la division es la misma que al leer el valor decimal desde texto
+    data = {}
+    for column, column_encoding in encoding['columns'].items():
+        if column not in table.column_names:
+            continue
+        values = table.column(column).to_numpy(zero_copy_only=False).astype(np.float64)
+        if column_encoding['encoding'] == 'scaled':
+            values = values / 10 ** column_encoding['decimals']
+        data[column] = values.astype(column_encoding['memory_dtype'], copy=False)
+
+    return pd.DataFrame(data, index=index)
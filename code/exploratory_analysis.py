@@ -0,0 +1,283 @@
+# IMPORTACIONES
+
+import hashlib
+import inspect
+import os
+
+import numpy as np
+import pandas as pd
+import storage
+import stage_cache
+import sensor_store
+import correlation
+import depth_interpolation
+
+
+# DEFINICION DE VARIABLES AUXILIARES
+
+# Etapas diarias y columnas usadas en el analisis exploratorio
+stage_columns = {
+    os.path.join(storage.processed_root, '03_daily', 'piezo-data_SDH1PS01_daily'): [
+        'Piezometer_NA_groundwater-depth_m'],
+    os.path.join(storage.processed_root, '03_daily', 'soil-data_z6-25818_daily'): [
+        'TEROS12_15cm_water-content_m3/m3',
+        'TEROS12_30cm_water-content_m3/m3',
+        'TEROS12_48cm_water-content_m3/m3',
+        'TEROS12_15cm_soil-temperature_degreeC',
+        'TEROS12_30cm_soil-temperature_degreeC',
+        'TEROS12_48cm_soil-temperature_degreeC']
+}
+
+# Parametros del analisis: dias de desfase de las correlaciones cruzadas, largo de la
+# ventana movil (dias) y resolucion (m) y metodo ('linear' o 'pchip') de la
+# interpolacion vertical del diagrama de Hovmoller
+analysis_parameters = {
+    'lag_days': 15,
+    'window_days': 61,
+    'depth_resolution': 0.01,
+    'depth_method': 'linear'
+}
+
+# Columna de profundidad del nivel freatico, referencia de las correlaciones
+groundwater_col = 'Piezometer_NA_groundwater-depth_m'
+
+# Etiquetas de cada variable y profundidad (fines esteticos)
+variable_labels = {
+    'groundwater-depth': 'Prof. nivel freático (m)',
+    'water-content': 'Contenido de agua (m³/m³)',
+    'soil-temperature': 'Temperatura (°C)'
+}
+variables_map = {
+    'Contenido de agua (m³/m³)': 'water-content_m3/m3',
+    'Temperatura (°C)': 'soil-temperature_degreeC'
+}
+depth_map = {
+    '15 cm': '15cm',
+    '30 cm': '30cm',
+    '48 cm': '48cm'
+}
+
+# Orden de las columnas del df largo
+long_order = ['Timestamps', 'Sensor', 'Depth', 'Depth-label', 'Variable', 'Variable-label', 'Unit', 'Value']
+
+# Carpeta donde se guardan los resultados intermedios y las figuras del analisis
+cache_path = os.path.join(storage.processed_root, '.analysis-cache')
+
+# Resolucion (puntos por pulgada) de las figuras guardadas
+figure_dpi = 96
+
+# Numero maximo de puntos por serie en los graficos de lineas (ver downsample_long)
+max_points_per_series = 2000
+
+
+# DEFINICION DE FUNCIONES
+
+# Funcion de calculo de los resultados intermedios del analisis
+def build_intermediates(stage_columns, parameters):
+    """
+    Lee las etapas diarias y calcula todos los resultados intermedios de las figuras
+    del analisis exploratorio: df ancho y largo, series diferenciadas, correlaciones
+    cruzadas y moviles, df de los graficos de dispersion y grillas del diagrama de
+    Hovmoller. Devuelve un diccionario con cada resultado.
+    """
+    # Carga de datos y union en un eje temporal comun (interseccion de fechas)
+    store = sensor_store.SensorStore.from_stages(stage_columns, how='inner')
+    wide_df = store.wide()
+
+    # Etiquetas por columna, incluidas luego en el formato largo
+    column_metadata = store.metadata
+    column_metadata['Variable-label'] = column_metadata['Variable'].map(variable_labels)
+    column_metadata['Depth-label'] = column_metadata['Depth'].str.replace('cm', ' cm')
+    long_df = store.long().reindex(columns=long_order)
+
+    # Diferenciacion de segundo orden para generar series temporales estacionarias
+    diff_wide_df = wide_df.diff().diff().dropna()
+    lags = np.arange(-parameters['lag_days'], parameters['lag_days'] + 1)
+    window_days = parameters['window_days']
+
+    # Etiquetas de las columnas de suelo a correlacionar
+    column_labels = {f'TEROS12_{depth_suffix}_{var_suffix}': (var_label, depth_label)
+                     for var_label, var_suffix in variables_map.items()
+                     for depth_label, depth_suffix in depth_map.items()}
+
+    # Correlaciones cruzadas y moviles de todas las columnas a la vez
+    cross_corr_df = correlation.cross_correlation_df(diff_wide_df, groundwater_col, column_labels, lags)
+    rolling_corr_df = correlation.rolling_correlation_df(
+        diff_wide_df, groundwater_col, column_labels, window_days).dropna()
+
+    # Graficos de dispersion: df largo de suelo con la profundidad del nivel freatico
+    soil_long_df = store.long(store.select(Sensor='TEROS12')).reindex(columns=long_order).set_index('Timestamps')
+    piezo_col = store.long(store.select(Sensor='Piezometer')).set_index('Timestamps')['Value']
+    scatter_df = soil_long_df.merge(piezo_col.rename('Groundwater-depth-m'),
+                                    left_index=True, right_index=True)
+    scatter_df['Month'] = scatter_df.index.month
+
+    # Diagrama de Hovmoller: interpolacion vertical de todas las fechas a la vez
+    hovmoller_grids = {}
+    for var_label, var_suffix in variables_map.items():
+        cols_list = [f'TEROS12_{depth_suffix}_{var_suffix}' for depth_suffix in depth_map.values()]
+        fine_depths, hovmoller_grids[var_label] = depth_interpolation.interpolate_depth_grid(
+            wide_df[cols_list].to_numpy().T,
+            [depth_interpolation.depth_label_to_m(depth_suffix) for depth_suffix in depth_map.values()],
+            resolution=parameters['depth_resolution'],
+            method=parameters['depth_method'])
+
+    return {
+        'wide_df': wide_df,
+        'column_metadata': column_metadata,
+        'long_df': long_df,
+        'diff_wide_df': diff_wide_df,
+        'cross_corr_df': cross_corr_df,
+        'rolling_corr_df': rolling_corr_df,
+        'conf_cross_corr': 1.96 / np.sqrt(len(diff_wide_df)),
+        'conf_rolling_corr': 1.96 / np.sqrt(window_days),
+        'scatter_df': scatter_df,
+        'fine_depths': fine_depths,
+        'hovmoller_grids': hovmoller_grids,
+        'hovmoller_df': pd.DataFrame({'Variable-label': list(hovmoller_grids)})
+    }
+
+
+# Funcion de lectura (o calculo) de los resultados intermedios con cache en disco
+def load_intermediates(stage_columns=stage_columns, parameters=analysis_parameters):
+    """
+    Devuelve los resultados intermedios de build_intermediates. Se guardan en
+    cache_path en formato binario de pandas (pickle), junto con la huella de los
+    archivos de entrada, los parametros y el codigo (stage_cache), y solo se vuelven
+    a calcular si alguna de ellas cambio. El diccionario incluye en 'key' el hash de
+    la huella, que identifica a los datos en el cache de figuras.
+    """
+    input_paths = [path for base_path in stage_columns
+                   for path in storage.stage_read_files(base_path)]
+    config = stage_cache.config_digest(stage_columns, parameters, variable_labels,
+                                       variables_map, depth_map, groundwater_col)
+    code = stage_cache.code_digest(build_intermediates, sensor_store, correlation, depth_interpolation)
+    intermediates_path = os.path.join(cache_path, 'exploratory-analysis.pkl')
+
+    up_to_date, fingerprint = stage_cache.check_target(
+        cache_path, 'exploratory-analysis', input_paths, config=config, code=code,
+        outputs_exist=os.path.exists(intermediates_path))
+    if up_to_date:
+        return pd.read_pickle(intermediates_path)
+
+    intermediates = build_intermediates(stage_columns, parameters)
+    intermediates['key'] = stage_cache.config_digest(
+        {path: entry['sha256'] for path, entry in fingerprint['inputs'].items()}, config, code)
+
+    os.makedirs(cache_path, exist_ok=True)
+    pd.to_pickle(intermediates, intermediates_path + '.tmp')
+    os.replace(intermediates_path + '.tmp', intermediates_path)
+    stage_cache.save_fingerprint(cache_path, 'exploratory-analysis', fingerprint)
+    return intermediates
+
+
+# Funcion de seleccion de puntos con Largest-Triangle-Three-Buckets (LTTB)
+def lttb_indices(x, y, n_out):
+    """
+    Devuelve las posiciones de los n_out puntos de una serie (x, y) que mejor
+    conservan su forma segun LTTB: se mantienen el primer y el ultimo punto y, en cada
+    uno de n_out - 2 tramos, el punto que forma el triangulo de mayor area con el punto
+    elegido en el tramo anterior y el promedio del tramo siguiente, lo que conserva
+    los maximos y minimos locales. Si la serie tiene n_out puntos o menos se devuelven
+    todas las posiciones.
+    """
+    n = len(x)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # Limites de los tramos interiores (el primer y el ultimo punto quedan fuera)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_stop = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x = x[stop:next_stop].mean()
+        next_y = y[stop:next_stop].mean()
+
+        # Doble del area de cada triangulo (punto anterior, candidato, promedio siguiente)
+        area = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous])
+                      - (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        selected[bucket + 1] = previous
+
+    return selected
+
+
+# Funcion de reduccion de puntos de un df largo para graficos de lineas
+def downsample_long(df, x, y, by, n_out=None):
+    """
+    Reduce cada serie de un df largo (grupos de las columnas by) a lo mas n_out puntos
+    con LTTB, descartando antes los valores NaN, para que el tiempo de dibujo no crezca
+    con el largo del registro. Las series mas cortas se conservan completas.
+    """
+    n_out = n_out or max_points_per_series
+    df = df.reset_index() if x not in df.columns else df
+    positions = []
+
+    for _, group in df.groupby(by, observed=True, sort=False):
+        group = group[group[y].notna()]
+        x_values = pd.to_datetime(group[x]).astype('int64') if group[x].dtype.kind == 'M' else group[x]
+        selected = lttb_indices(np.asarray(x_values, dtype=np.float64), group[y].to_numpy(), n_out)
+        positions.append(group.index.to_numpy()[selected])
+
+    if not positions:
+        return df
+    return df.loc[np.sort(np.concatenate(positions))]
+
+
+# Funcion para calcular el hash del codigo de una funcion de dibujo
+def drawing_digest(draw_function):
+    """
+    Calcula el hash del codigo fuente de una funcion de dibujo (definida en un modulo
+    o en una celda de Quarto o Jupyter). Devuelve None si el codigo no esta disponible,
+    en cuyo caso la figura no se guarda en el cache.
+    """
+    try:
+        source = inspect.getsource(draw_function)
+    except (OSError, TypeError):
+        return None
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+# Funcion de dibujo de una figura con cache en disco
+def cached_figure(name, draw_function, data_key, *style_objects):
+    """
+    Devuelve la ruta de la imagen de una figura. La imagen se identifica por el hash
+    de los datos (data_key, ver load_intermediates), del codigo de draw_function y de
+    los objetos de estilo (ej. paletas): si ya existe se reutiliza; si no, se llama a
+    draw_function (que debe devolver la figura de matplotlib), se guarda la imagen y
+    se eliminan las versiones anteriores de la misma figura.
+    """
+    import matplotlib.pyplot as plt
+
+    figures_path = os.path.join(cache_path, 'figures')
+    code = drawing_digest(draw_function)
+    digest = stage_cache.config_digest(data_key, code, figure_dpi, *style_objects)[:16]
+    figure_path = os.path.join(figures_path, f'{name}-{digest}.png')
+
+    if code is not None and os.path.exists(figure_path):
+        return figure_path
+
+    figure = draw_function()
+    os.makedirs(figures_path, exist_ok=True)
+    for old_file in os.listdir(figures_path):
+        if old_file.startswith(f'{name}-') and old_file.endswith('.png'):
+            os.remove(os.path.join(figures_path, old_file))
+    figure.savefig(figure_path, dpi=figure_dpi, bbox_inches='tight')
+    plt.close(figure)
+    return figure_path
+
+
+# Funcion de visualizacion de una figura con cache en disco
+def show_cached_figure(name, draw_function, data_key, *style_objects):
+    """
+    Muestra en el notebook o documento de Quarto la imagen de cached_figure.
+    """
+    from IPython.display import Image, display
+    display(Image(filename=cached_figure(name, draw_function, data_key, *style_objects)))
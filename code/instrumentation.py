@@ -0,0 +1,254 @@
+# IMPORTACIONES
+
+import contextlib
+import cProfile
+import datetime
+import io
+import json
+import os
+import platform
+import pstats
+import sys
+import time
+import tracemalloc
+
+# resource no existe en Windows: sin el no se registra la memoria maxima del proceso
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# DEFINICION DE VARIABLES AUXILIARES
+
+# Perfilado opcional de cada unidad de trabajo. Se activa con la variable de entorno
+# HUASCO_PROFILE: 'cprofile' (tiempo por funcion) o 'tracemalloc' (memoria por linea)
+profile_mode = os.environ.get('HUASCO_PROFILE', '').lower()
+
+# Numero de funciones o lineas incluidas en el reporte de perfilado de cada unidad
+profile_top = 25
+
+# Nombre de la carpeta (dentro de cada carpeta de salida) donde se guardan los reportes
+report_folder = 'run-reports'
+
+# Etapa de verificacion de huellas (stage_cache): una ejecucion cuyas unidades solo
+# registran esta etapa no proceso nada y no guarda reporte
+fingerprint_stage = 'verificacion_huella'
+
+# Etiqueta y registros de las etapas de la unidad de trabajo en curso (se reinician
+# en cada unidad)
+current_unit = None
+unit_records = []
+
+# Registros de todas las unidades de la ejecucion en curso (proceso principal)
+run_units = {}
+run_started = datetime.datetime.now()
+
+# Maximo de memoria trazada por tracemalloc en etapas ya cerradas de la unidad en curso
+# (cada etapa reinicia el maximo de tracemalloc para medir el suyo)
+traced_peak = 0
+
+
+# DEFINICION DE FUNCIONES
+
+# Funcion para obtener la memoria maxima usada por el proceso
+def peak_rss_mb():
+    """
+    Devuelve la memoria residente maxima (MB) usada por el proceso hasta el momento,
+    o None si la plataforma no la informa.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # En macOS ru_maxrss esta en bytes y en Linux en kilobytes
+    divisor = 1024 ** 2 if sys.platform == 'darwin' else 1024
+    return round(peak / divisor, 3)
+
+
+# Funcion para calcular el tamano en disco de archivos y carpetas
+def path_bytes(paths):
+    """
+    Suma el tamano en bytes de una lista de rutas. Las carpetas (ej. etapas parquet)
+    se recorren completas; las rutas inexistentes se ignoran.
+    """
+    total = 0
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, _, filenames in os.walk(path):
+                total += sum(os.path.getsize(os.path.join(folder, name)) for name in filenames)
+        elif os.path.exists(path):
+            total += os.path.getsize(path)
+    return total
+
+
+# Funcion de registro de una etapa
+@contextlib.contextmanager
+def stage(stage_name, rows_in=None, bytes_read=None):
+    """
+    Registra el tiempo de reloj, el tiempo de CPU y la memoria de una etapa de la
+    unidad de trabajo (sensor) en curso. La memoria maxima del proceso (ru_maxrss) es
+    acumulada, por lo que se registra su aumento durante la etapa (peak_rss_delta_mb);
+    con HUASCO_PROFILE=tracemalloc se registra ademas el maximo de memoria asignada
+    en la propia etapa (traced_peak_mb). Entrega un diccionario donde el bloque puede
+    completar rows_out y bytes_written (y rows_in o bytes_read):
+
+        with instrumentation.stage('lectura', bytes_read=size) as record:
+            df = leer(...)
+            record['rows_out'] = len(df)
+
+    Las etapas no se deben anidar, para que los totales por etapa no se dupliquen.
+    """
+    record = {'sensor': current_unit, 'stage': stage_name,
+              'rows_in': rows_in, 'rows_out': None,
+              'bytes_read': bytes_read, 'bytes_written': None,
+              'status': 'ok'}
+    global traced_peak
+    rss_start = peak_rss_mb()
+    if tracemalloc.is_tracing():
+        traced_peak = max(traced_peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+
+    try:
+        yield record
+    except BaseException:
+        record['status'] = 'error'
+        raise
+    finally:
+        record['wall_seconds'] = round(time.perf_counter() - wall_start, 6)
+        record['cpu_seconds'] = round(time.process_time() - cpu_start, 6)
+        rss_end = peak_rss_mb()
+        record['peak_rss_delta_mb'] = None if rss_end is None else round(rss_end - rss_start, 3)
+        if tracemalloc.is_tracing():
+            stage_peak = tracemalloc.get_traced_memory()[1]
+            traced_peak = max(traced_peak, stage_peak)
+            record['traced_peak_mb'] = round(stage_peak / 1024 ** 2, 3)
+        unit_records.append(record)
+
+
+# Funcion de perfilado opcional de una unidad de trabajo
+@contextlib.contextmanager
+def profiling():
+    """
+    Si HUASCO_PROFILE esta activo, perfila el bloque con cProfile o tracemalloc y
+    guarda en el diccionario entregado las funciones (o lineas) de mayor costo.
+    """
+    global traced_peak
+    report = {}
+
+    if profile_mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield report
+        finally:
+            profiler.disable()
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(profile_top)
+            report['cprofile'] = [line for line in stream.getvalue().splitlines() if line.strip()]
+
+    elif profile_mode == 'tracemalloc':
+        traced_peak = 0
+        tracemalloc.start()
+        try:
+            yield report
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            # Las etapas reinician el maximo de tracemalloc: se combina con el de cada una
+            peak = max(traced_peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            report['tracemalloc_peak_mb'] = round(peak / 1024 ** 2, 3)
+            report['tracemalloc'] = [str(statistic) for statistic in
+                                     snapshot.statistics('lineno')[:profile_top]]
+
+    else:
+        yield report
+
+
+# Funcion de ejecucion instrumentada de una unidad de trabajo
+def run_instrumented(task, args, label):
+    """
+    Ejecuta task(*args) registrando sus etapas (y su perfil, si esta activo).
+    Devuelve el resultado y el reporte de la unidad. Se usa dentro de los procesos
+    del pool, por lo que el reporte se devuelve junto al resultado.
+    """
+    global current_unit
+    current_unit = label
+    unit_records.clear()
+    with profiling() as profile:
+        result = task(*args)
+    return result, {'stages': list(unit_records), 'profile': profile or None}
+
+
+# Funcion de registro del reporte de una unidad en la ejecucion en curso
+def add_unit_report(label, unit_report, error=None):
+    """
+    Agrega al reporte de la ejecucion las etapas de una unidad de trabajo y su estado.
+    """
+    unit_report = dict(unit_report or {'stages': [], 'profile': None})
+    unit_report['status'] = 'error' if error is not None else 'ok'
+    run_units[label] = unit_report
+
+
+# Funcion de inicio de una nueva ejecucion en el mismo proceso
+def reset_run():
+    """
+    Descarta las unidades registradas y reinicia la hora de inicio, para que cada
+    script ejecutado desde pipeline.py guarde un reporte solo con sus propias unidades.
+    """
+    global run_started
+    run_units.clear()
+    run_started = datetime.datetime.now()
+
+
+# Funcion de escritura del reporte de la ejecucion
+def write_run_report(output_dir, script_name):
+    """
+    Guarda un reporte json con las etapas de todas las unidades de la ejecucion en
+    <output_dir>/run-reports/<script>_<fecha>.json, junto a las salidas procesadas.
+    Incluye totales por etapa para identificar rapidamente la etapa mas costosa.
+    Si ninguna unidad fallo ni paso de la verificacion de huellas (todo estaba al
+    dia), no guarda nada. Devuelve la ruta del reporte, o None si no se guardo.
+    """
+    finished = datetime.datetime.now()
+
+    # Ejecucion sin trabajo: todas las unidades se omitieron segun sus huellas
+    if not any(unit_report['status'] == 'error'
+               or any(record['stage'] != fingerprint_stage for record in unit_report['stages'])
+               for unit_report in run_units.values()):
+        print('Sin unidades procesadas: no se guarda reporte de ejecucion.')
+        return None
+
+    # Totales por etapa sumando todos los sensores
+    totals = {}
+    for unit_report in run_units.values():
+        for record in unit_report['stages']:
+            stage_totals = totals.setdefault(record['stage'], {
+                'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'rows_out': 0,
+                'bytes_read': 0, 'bytes_written': 0})
+            for key in stage_totals:
+                stage_totals[key] = round(stage_totals[key] + (record[key] or 0), 6)
+
+    report = {
+        'script': script_name,
+        'started': run_started.isoformat(timespec='seconds'),
+        'finished': finished.isoformat(timespec='seconds'),
+        'wall_seconds': round((finished - run_started).total_seconds(), 3),
+        'profile_mode': profile_mode or None,
+        'environment': {'python': platform.python_version(),
+                        'platform': platform.platform(),
+                        'cpu_count': os.cpu_count()},
+        'stage_totals': totals,
+        'units': run_units
+    }
+
+    report_path = os.path.join(output_dir, report_folder,
+                               f'{script_name}_{finished:%Y%m%d-%H%M%S}.json')
+    os.makedirs(os.path.dirname(report_path), exist_ok=True)
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    print(f'Reporte de ejecucion guardado en: {report_path}')
+    return report_path
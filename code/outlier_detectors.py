@@ -0,0 +1,397 @@
+# IMPORTACIONES
+
+import json
+import os
+
+import numpy as np
+import dtype_policy
+
+
+# DEFINICION DE VARIABLES AUXILIARES
+
+# Factor que convierte la desviacion absoluta mediana (MAD) en una estimacion de la
+# desviacion estandar de una distribucion normal
+mad_to_std = 1.4826
+
+# Tasa de cambio maxima por hora de cada unidad (sufijo _unidad del nombre de columna)
+# para la deteccion de peaks. Las columnas con unidades no incluidas no se revisan
+max_rate_per_hour = {
+    'm': 0.5,         # Profundidad del nivel freatico
+    'masl': 0.5,      # Cota del nivel freatico
+    'degreeC': 5.0,   # Temperatura del agua y del suelo
+    'm3/m3': 0.2,     # Contenido de agua
+    'mS/cm': 1.0,     # Conductividad electrica
+    'kPa': 500.0      # Potencial matrico
+}
+
+# Paso efectivo de los sensores cuya resolucion es mayor que la de su unidad en
+# dtype_policy.unit_decimals, por modelo de sensor (prefijo del nombre de columna) y
+# unidad. Ej. los TEROS miden la temperatura cada 0.1 degreeC, y no cada 0.001 como
+# el piezometro
+sensor_resolution = {
+    'TEROS12': {'degreeC': 0.1},
+    'TEROS21': {'degreeC': 0.1}
+}
+
+# Detectores activos y sus parametros (ventanas en numero de muestras). La variable de
+# entorno HUASCO_OUTLIER_DETECTORS (ej. 'hampel,rate_of_change') restringe los detectores
+# usados. Un detector nuevo se agrega como clase en detector_classes
+detector_settings = {
+    'hampel': {'window': 25, 'n_sigmas': 5.0},
+    'rolling_mad': {'window': 25, 'n_sigmas': 6.0},
+    'rate_of_change': {}
+}
+enabled_detectors = [name for name in os.environ.get('HUASCO_OUTLIER_DETECTORS', '').split(',') if name]
+
+# Sufijo del archivo con la mascara de outliers de un sensor
+mask_suffix = '_outliers.npz'
+
+
+# DEFINICION DE CLASES
+
+class HampelDetector:
+    """
+    Filtro de Hampel: marca los valores que se alejan de la mediana de una ventana
+    centrada (window muestras) en mas de n_sigmas veces la escala robusta (MAD).
+    Necesita window // 2 muestras antes y despues de cada valor.
+    """
+
+    def __init__(self, window=25, n_sigmas=5.0):
+        self.window = window
+        self.n_sigmas = n_sigmas
+        self.before = self.after = window // 2
+
+    def flags(self, values, times, start, stop, limits):
+        """
+        Devuelve la mascara (filas start:stop, columnas) de valores anomalos.
+        """
+        half = self.window // 2
+        windows = np.lib.stride_tricks.sliding_window_view(
+            values[start - half:stop + half], self.window, axis=0)
+        median, scale, valid = median_and_scale(windows, limits['scale'])
+        deviation = np.abs(values[start:stop] - median)
+        return (deviation > self.n_sigmas * scale) & (valid > half)
+
+
+class RollingMADDetector:
+    """
+    Mediana y MAD moviles causales sobre los incrementos: compara el incremento de
+    cada valor con la mediana de los window incrementos anteriores, sin mirar hacia
+    adelante, por lo que cada valor se decide apenas llega. Usar incrementos en vez de
+    niveles evita marcar las tendencias sostenidas (ej. el ciclo diario de temperatura).
+    """
+
+    def __init__(self, window=25, n_sigmas=6.0):
+        self.window = window
+        self.n_sigmas = n_sigmas
+        self.before = window + 1
+        self.after = 0
+
+    def flags(self, values, times, start, stop, limits):
+        """
+        Devuelve la mascara (filas start:stop, columnas) de valores anomalos.
+        """
+        steps = np.diff(values[start - self.window - 1:stop], axis=0)
+        windows = np.lib.stride_tricks.sliding_window_view(steps[:-1], self.window, axis=0)
+        median, scale, valid = median_and_scale(windows, limits['scale'])
+        deviation = np.abs(steps[self.window:] - median)
+        return (deviation > self.n_sigmas * scale) & (valid > self.window // 2)
+
+
+class RateOfChangeDetector:
+    """
+    Deteccion de peaks por tasa de cambio: marca los valores a los que se llega y
+    desde los que se vuelve con una tasa mayor a la maxima de la unidad (ver
+    max_rate_per_hour) y en sentidos opuestos, como los que produce la manipulacion
+    de un sensor. Un cambio de nivel sostenido no se marca.
+    """
+
+    def __init__(self):
+        self.before = self.after = 1
+
+    def flags(self, values, times, start, stop, limits):
+        """
+        Devuelve la mascara (filas start:stop, columnas) de valores anomalos.
+        """
+        hours = times.astype(np.float64) / 3.6e12
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rate_in = ((values[start:stop] - values[start - 1:stop - 1])
+                       / (hours[start:stop] - hours[start - 1:stop - 1])[:, None])
+            rate_out = ((values[start + 1:stop + 1] - values[start:stop])
+                        / (hours[start + 1:stop + 1] - hours[start:stop])[:, None])
+        max_rate = limits['max_rate']
+        return ((np.abs(rate_in) > max_rate) & (np.abs(rate_out) > max_rate)
+                & (np.sign(rate_in) != np.sign(rate_out)))
+
+
+# Clases de detector disponibles, por nombre (ver detector_settings)
+detector_classes = {
+    'hampel': HampelDetector,
+    'rolling_mad': RollingMADDetector,
+    'rate_of_change': RateOfChangeDetector
+}
+
+
+# DEFINICION DE FUNCIONES
+
+# Funcion de mediana por ventana ignorando NaN
+def nan_median(windows):
+    """
+    Calcula la mediana del ultimo eje de un arreglo de ventanas ignorando los NaN,
+    ordenando cada ventana una sola vez (np.sort deja los NaN al final). Devuelve la
+    mediana y el numero de valores validos de cada ventana.
+    """
+    sorted_windows = np.sort(windows, axis=-1)
+    valid = np.count_nonzero(~np.isnan(windows), axis=-1)
+    low = np.maximum((valid - 1) // 2, 0)[..., None]
+    high = np.maximum(valid // 2, 0)[..., None]
+    median = (np.take_along_axis(sorted_windows, low, axis=-1)
+              + np.take_along_axis(sorted_windows, high, axis=-1))[..., 0] / 2
+    median[valid == 0] = np.nan
+    return median, valid
+
+
+# Funcion de mediana y MAD por ventana
+def median_and_scale(windows, min_scale):
+    """
+    Devuelve la mediana, la escala robusta (MAD x 1.4826, no menor que min_scale, la
+    resolucion de cada columna, para no marcar series planas) y el numero de valores
+    validos.
+    """
+    median, valid = nan_median(windows)
+    mad, _ = nan_median(np.abs(windows - median[..., None]))
+    return median, np.maximum(mad * mad_to_std, min_scale), valid
+
+
+# Funcion para obtener la resolucion de cada columna
+def column_scales(columns):
+    """
+    Devuelve la resolucion de cada columna: 10^-decimales segun su unidad (ver
+    dtype_policy.unit_decimals) o el paso efectivo de su sensor en sensor_resolution,
+    el mayor de ambos, o 0 si ninguno es conocido. Solo depende de los nombres de
+    columna, por lo que no cambia con el tamano de los bloques leidos.
+    """
+    scales = []
+    for column in columns:
+        decimals = dtype_policy.column_decimals(column)
+        parts = str(column).split('_', 3)
+        sensor_step = sensor_resolution.get(parts[0], {}).get(parts[3], 0.0) if len(parts) == 4 else 0.0
+        scales.append(max(0.0 if decimals is None else 10.0 ** -decimals, sensor_step))
+    return np.array(scales)
+
+
+# Funcion para obtener la tasa de cambio maxima de cada columna
+def column_max_rates(columns):
+    """
+    Devuelve la tasa de cambio maxima por hora de cada columna segun su unidad, o
+    infinito si la unidad no esta en max_rate_per_hour.
+    """
+    units = [str(column).split('_', 3)[-1] for column in columns]
+    return np.array([max_rate_per_hour.get(unit, np.inf) for unit in units])
+
+
+# Funcion de construccion de los detectores configurados
+def build_detectors(settings=None, names=None):
+    """
+    Crea los detectores configurados en detector_settings (o en settings), solo los
+    indicados en names o en HUASCO_OUTLIER_DETECTORS si se entregan.
+    """
+    settings = detector_settings if settings is None else settings
+    names = names or enabled_detectors or list(settings)
+    return {name: detector_classes[name](**settings[name]) for name in names}
+
+
+# Funcion de deteccion por bloques
+def stream_outlier_masks(chunks, detectors):
+    """
+    Recorre una etapa por bloques (ej. storage.iter_stage_chunks) en una sola pasada y
+    aplica todos los detectores a todas las columnas a la vez. Entre bloques se
+    conservan solo las muestras de contexto que necesitan los detectores (antes y
+    despues de cada valor), por lo que la memoria depende del tamano del bloque y no
+    del largo de la serie. Entrega, por cada tramo de filas decidido, la posicion de
+    su primera fila y un diccionario {detector: mascara (filas, columnas)}.
+    """
+    before = max(detector.before for detector in detectors.values())
+    after = max(detector.after for detector in detectors.values())
+
+    carry_values, carry_times = None, None
+    decided = 0
+    columns = limits = None
+
+    # Aplica los detectores a las filas before:stop del arreglo extendido
+    def decide(values, times, stop):
+        return {name: detector.flags(values, times, before, stop, limits)
+                for name, detector in detectors.items()}
+
+    for chunk in chunks:
+        chunk_values = chunk.to_numpy(dtype=np.float64)
+        if columns is None:
+            # La escala minima de cada columna es su resolucion (ver column_scales)
+            columns = list(chunk.columns)
+            limits = {'scale': column_scales(columns), 'max_rate': column_max_rates(columns)}
+
+            # Al inicio de la serie el contexto anterior se completa con NaN
+            carry_values = np.full((before, len(columns)), np.nan)
+            carry_times = np.zeros(before, dtype=np.int64)
+
+        values = np.vstack([carry_values, chunk_values])
+        times = np.concatenate([carry_times, chunk.index.as_unit('ns').asi8])
+
+        # Solo se deciden las filas con todo su contexto posterior disponible
+        stop = len(values) - after
+        if stop > before:
+            yield decided, decide(values, times, stop)
+            decided += stop - before
+            values, times = values[stop - before:], times[stop - before:]
+        carry_values, carry_times = values, times
+
+    # Al final de la serie el contexto posterior se completa con NaN
+    if columns is not None and len(carry_values) > before:
+        values = np.vstack([carry_values, np.full((after, len(columns)), np.nan)])
+        times = np.concatenate([carry_times, np.full(after, carry_times[-1], dtype=np.int64)])
+        yield decided, decide(values, times, len(values) - after)
+
+
+# Funcion de deteccion y escritura de la mascara de un sensor
+def detect_outliers(chunks, detectors, mask_path):
+    """
+    Aplica los detectores a una etapa en una sola pasada y guarda las posiciones de
+    los valores marcados. Devuelve el numero de filas y un diccionario
+    {detector: {columna: numero de outliers}}.
+    """
+    rows = {name: [] for name in detectors}
+    cols = {name: [] for name in detectors}
+    n_rows, columns = 0, None
+    start = end = None
+
+    # Registra tambien las columnas y el rango de fechas de los bloques leidos
+    def tracked(chunks):
+        nonlocal columns, start, end, n_rows
+        for chunk in chunks:
+            if chunk.empty:
+                continue
+            columns = columns or list(chunk.columns)
+            start = chunk.index[0] if start is None else start
+            end = chunk.index[-1]
+            n_rows += len(chunk)
+            yield chunk
+
+    for first_row, masks in stream_outlier_masks(tracked(chunks), detectors):
+        for name, mask in masks.items():
+            flagged_rows, flagged_cols = np.nonzero(mask)
+            rows[name].append(first_row + flagged_rows)
+            cols[name].append(flagged_cols)
+
+    metadata = {'n_rows': n_rows, 'columns': columns or [],
+                'start': str(start), 'end': str(end),
+                'detectors': {name: {key: value for key, value in vars(detector).items()}
+                              for name, detector in detectors.items()}}
+    arrays = {}
+    counts = {}
+    for number, name in enumerate(detectors):
+        detector_rows = np.concatenate(rows[name]) if rows[name] else np.array([], dtype=np.int64)
+        detector_cols = np.concatenate(cols[name]) if cols[name] else np.array([], dtype=np.int64)
+        arrays[f'rows_{number}'] = detector_rows.astype(np.int32)
+        arrays[f'cols_{number}'] = detector_cols.astype(np.int16)
+        counts[name] = {column: int(np.count_nonzero(detector_cols == i))
+                        for i, column in enumerate(metadata['columns'])}
+
+    np.savez_compressed(mask_path, metadata=np.array(json.dumps(metadata)), **arrays)
+    return n_rows, counts
+
+
+# Funcion de lectura de los metadatos de la mascara de un sensor
+def load_mask_metadata(mask_path):
+    """
+    Lee solo los metadatos (filas, columnas, rango de fechas y detectores) de una
+    mascara guardada por detect_outliers.
+    """
+    with np.load(mask_path) as saved:
+        return json.loads(str(saved['metadata']))
+
+
+# Funcion de verificacion de una mascara contra el eje temporal de una etapa
+def mask_matches_axis(metadata, axis):
+    """
+    Devuelve True si una mascara corresponde a las filas de una etapa segun su eje
+    temporal (time_axis): mismo numero de registros y mismos timestamps inicial y
+    final. Una etapa que cambio despues de 02b (ej. una exportacion nueva) no coincide.
+    """
+    return (metadata['n_rows'] == axis['n_records']
+            and (not axis['n_records']
+                 or (metadata['start'] == axis['start'] and metadata['end'] == axis['end'])))
+
+
+# Funcion de lectura de la mascara de un sensor
+def load_outlier_mask(mask_path, detectors=None):
+    """
+    Lee una mascara guardada por detect_outliers y devuelve sus metadatos y un arreglo
+    booleano (filas, columnas) con los valores marcados por alguno de los detectores
+    indicados (por defecto, todos).
+    """
+    with np.load(mask_path) as saved:
+        metadata = json.loads(str(saved['metadata']))
+        mask = np.zeros((metadata['n_rows'], len(metadata['columns'])), dtype=bool)
+        for number, name in enumerate(metadata['detectors']):
+            if detectors is None or name in detectors:
+                mask[saved[f'rows_{number}'], saved[f'cols_{number}']] = True
+    return metadata, mask
+
+
+# Funcion de reemplazo de los valores marcados de un df
+def mask_frame(df, mask, columns):
+    """
+    Reemplaza con NaN los valores de un df marcados en mask (filas del df, columnas
+    en el orden de columns). El df se copia solo si tiene valores marcados, por lo que
+    un df de solo lectura (ej. vistas del cache de arreglos) sin marcas se devuelve tal cual.
+    """
+    flagged = [(i, column) for i, column in enumerate(columns)
+               if column in df.columns and mask[:, i].any()]
+    if not flagged:
+        return df
+
+    df = df.copy()
+    for i, column in flagged:
+        df.loc[mask[:, i], column] = np.nan
+    return df
+
+
+# Funcion de aplicacion de una mascara a un df
+def apply_outlier_mask(df, mask_path, detectors=None):
+    """
+    Reemplaza con NaN los valores de un df marcados en su mascara de outliers. El df
+    debe tener las mismas filas (en el mismo orden) que la etapa analizada.
+    """
+    metadata, mask = load_outlier_mask(mask_path, detectors)
+    if metadata['n_rows'] != len(df) or (len(df) and str(df.index[0]) != metadata['start']):
+        raise ValueError(f'La mascara {mask_path} no corresponde a las filas del df.')
+    return mask_frame(df, mask, metadata['columns'])
+
+
+# Funcion de aplicacion de una mascara a una etapa leida por bloques
+def iter_masked_chunks(chunks, mask_path, detectors=None):
+    """
+    Aplica la mascara de outliers de una etapa a sus bloques (ej. los de
+    storage.iter_stage_chunks), que deben recorrer las mismas filas y en el mismo
+    orden que la etapa analizada. La mascara se lee una sola vez.
+    """
+    metadata, mask = load_outlier_mask(mask_path, detectors)
+    offset = 0
+
+    for chunk in chunks:
+        if offset + len(chunk) > metadata['n_rows'] or (
+                offset == 0 and len(chunk) and str(chunk.index[0]) != metadata['start']):
+            raise ValueError(f'La mascara {mask_path} no corresponde a las filas de la etapa.')
+        yield mask_frame(chunk, mask[offset:offset + len(chunk)], metadata['columns'])
+        offset += len(chunk)
+
+    if offset != metadata['n_rows']:
+        raise ValueError(f'La mascara {mask_path} no corresponde a las filas de la etapa.')
+
+
+# Funcion para construir la ruta de la mascara de un sensor
+def mask_path_for(output_dir, sensor_name):
+    """
+    Devuelve la ruta del archivo con la mascara de outliers de un sensor.
+    """
+    return os.path.join(output_dir, f'{sensor_name}{mask_suffix}')
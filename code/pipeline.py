@@ -0,0 +1,190 @@
+# IMPORTACIONES
+
+# Solo modulos de la biblioteca estandar: pandas y los scripts se importan recien al
+# ejecutar una etapa o al usar una funcion, por lo que --help responde sin cargarlos
+import argparse
+import importlib
+import os
+import sys
+import time
+
+
+# DEFINICION DE VARIABLES AUXILIARES
+
+# Carpeta con los scripts del flujo de trabajo; sus rutas relativas (ej. '../data/raw')
+# se resuelven desde ella
+code_path = os.path.dirname(os.path.abspath(__file__))
+
+# Etapas del flujo de trabajo, en orden de ejecucion, y el script de cada una
+stage_modules = {
+    '01a': '01a_piezometric-data_formatting',
+    '01b': '01b_soil-data_formatting',
+    '02a': '02a_piezometric-data_cleaning',
+    '02b': '02b_all-data_outlier-detection',
+    '03': '03_all-data_daily-aggregation',
+    '05': '05_all-stations_batch-analysis'
+}
+
+# Descripcion breve de cada etapa (ayuda de la linea de comandos)
+stage_descriptions = {
+    '01a': 'formateo de los piezometros (.xlsx)',
+    '01b': 'formateo de los dataloggers de suelo (.csv)',
+    '02a': 'limpieza de las campanas de terreno de los piezometros',
+    '02b': 'deteccion de outliers de todos los sensores',
+    '03': 'agregacion horaria, diaria y mensual',
+    '05': 'analisis de todas las estaciones'
+}
+
+# Funciones de la biblioteca y etapa (o modulo auxiliar) que las define. Se importan
+# al usarlas por primera vez (ej. pipeline.configure_timestamps), sin cargar el resto
+library_functions = {
+    'configure_timestamps': '01a',
+    'format_columns': '01a',
+    'process_piezometer': '01a',
+    'group_datalogger_files': '01b',
+    'iter_datalogger_chunks': '01b',
+    'write_datalogger_stage': '01b',
+    'process_datalogger': '01b',
+    'identify_campaign_outliers': '02a',
+    'remove_outliers': '02a',
+    'process_piezometer_file': '02a',
+    'process_sensor_file': '02b',
+    'aggregate_to_daily_mean': '03',
+    'process_file': '03',
+    'analyze_station': 'station_analysis',
+    'read_stage': 'storage',
+    'write_stage': 'storage'
+}
+
+
+# DEFINICION DE FUNCIONES
+
+# Funcion de importacion de una etapa o de un modulo auxiliar
+def load_stage(stage):
+    """
+    Importa el script de una etapa (ej. '01a') o un modulo auxiliar (ej. 'storage').
+    Los bloques de ejecucion de los scripts estan protegidos por
+    __name__ == '__main__', por lo que no se procesa nada al importarlos.
+    """
+    if code_path not in sys.path:
+        sys.path.insert(0, code_path)
+    return importlib.import_module(stage_modules.get(stage, stage))
+
+
+# Funcion de acceso diferido a las funciones de la biblioteca
+def __getattr__(name):
+    """
+    Importa la etapa que define una funcion de library_functions la primera vez que
+    se usa (ej. pipeline.aggregate_to_daily_mean).
+    """
+    if name in library_functions:
+        return getattr(load_stage(library_functions[name]), name)
+    raise AttributeError(f"module 'pipeline' has no attribute '{name}'")
+
+
+# Funcion con los nombres del modulo, incluidas las funciones diferidas
+def __dir__():
+    """
+    Devuelve los nombres del modulo junto con los de library_functions.
+    """
+    return sorted(list(globals()) + list(library_functions))
+
+
+# Funcion de ejecucion de un conjunto de etapas en el proceso actual
+def run_stages(stages):
+    """
+    Ejecuta la funcion main de cada etapa, en el orden del flujo de trabajo, en el
+    proceso actual. Cada etapa guarda su propio reporte de ejecucion. Con las etapas
+    en memoria de storage, las etapas siguientes reciben los df escritos por las
+    anteriores sin volver a leer sus archivos. Un error en un sensor no detiene las
+    etapas siguientes. Devuelve {etapa: unidades que fallaron} con las etapas que
+    tuvieron errores.
+    """
+    instrumentation = load_stage('instrumentation')
+    stage_failures = {}
+
+    for stage in [stage for stage in stage_modules if stage in stages]:
+        print(f'=== Etapa {stage}: {stage_modules[stage]} ===')
+        started = time.perf_counter()
+        module = load_stage(stage)
+        instrumentation.reset_run()
+        failures = module.main()
+        if failures:
+            stage_failures[stage] = failures
+        print(f'=== Etapa {stage} completada en {time.perf_counter() - started:.1f} s ===\n')
+
+    return stage_failures
+
+
+# Funcion de lectura de los argumentos de la linea de comandos
+def parse_arguments(argv=None):
+    """
+    Lee las etapas a ejecutar (por defecto, todas) y las opciones de la linea de
+    comandos.
+    """
+    parser = argparse.ArgumentParser(
+        prog='pipeline.py',
+        description='Ejecuta las etapas del flujo de trabajo en un solo proceso.',
+        epilog='Etapas: ' + '; '.join(f'{stage} {description}'
+                                      for stage, description in stage_descriptions.items()))
+    parser.add_argument('stages', nargs='*', metavar='ETAPA',
+                        help='etapas a ejecutar, en el orden del flujo (por defecto, todas)')
+    parser.add_argument('--raw-root', metavar='CARPETA',
+                        help='carpeta de los datos crudos (por defecto, ../data/raw)')
+    parser.add_argument('--processed-root', metavar='CARPETA',
+                        help='carpeta de los datos procesados (por defecto, ../data/processed)')
+    parser.add_argument('--workers', type=int, metavar='N',
+                        help='procesos en paralelo por etapa (ver HUASCO_MAX_WORKERS); con N > 1 '
+                             'las etapas se leen desde disco')
+    parser.add_argument('--apply-outlier-masks', action='store_true',
+                        help='agrega (03) sin los valores marcados por la deteccion de outliers (02b)')
+    parser.add_argument('--from-disk', action='store_true',
+                        help='lee cada etapa desde sus archivos en vez de usar los df en memoria')
+    args = parser.parse_args(argv)
+
+    unknown = [stage for stage in args.stages if stage not in stage_modules]
+    if unknown:
+        parser.error(f'etapas desconocidas: {", ".join(unknown)} '
+                     f'(disponibles: {", ".join(stage_modules)})')
+    return args
+
+
+# Funcion principal de la linea de comandos
+def main(argv=None):
+    """
+    Configura las carpetas de datos, los procesos en paralelo y las etapas en memoria
+    mediante las variables de entorno HUASCO_* (antes de importar los scripts, que las
+    leen al importarse) y ejecuta las etapas pedidas. Devuelve el codigo de salida:
+    1 si alguna unidad de trabajo fallo y 0 si no. Los df en memoria solo existen
+    en el proceso actual, por lo que con ellos las unidades de cada etapa se ejecutan
+    en serie; con --workers mayor que 1 las etapas se leen desde disco.
+    """
+    args = parse_arguments(argv)
+
+    # Las carpetas indicadas se resuelven desde la carpeta actual, antes de cambiar a code
+    if args.raw_root:
+        os.environ['HUASCO_RAW_ROOT'] = os.path.abspath(args.raw_root)
+    if args.processed_root:
+        os.environ['HUASCO_PROCESSED_ROOT'] = os.path.abspath(args.processed_root)
+    if args.workers:
+        os.environ['HUASCO_MAX_WORKERS'] = str(args.workers)
+    if args.apply_outlier_masks:
+        os.environ['HUASCO_APPLY_OUTLIER_MASKS'] = '1'
+    if args.workers and args.workers > 1 and not args.from_disk:
+        print(f'Con {args.workers} procesos en paralelo las etapas se leen desde disco.')
+    elif not args.from_disk:
+        os.environ['HUASCO_IN_MEMORY'] = '1'
+    os.chdir(code_path)
+
+    stage_failures = run_stages(args.stages or list(stage_modules))
+
+    # Resumen de errores: el codigo de salida distinto de 0 lo detectan cron y la CI
+    for stage, failures in stage_failures.items():
+        print(f'Etapa {stage}: {len(failures)} unidades fallaron ({", ".join(failures)})')
+    return 1 if stage_failures else 0
+
+
+# BUCLE DE EJECUCION
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+# IMPORTACIONES
+
+import concurrent.futures
+import contextlib
+import io
+import os
+import traceback
+import instrumentation
+import storage
+
+
+# DEFINICION DE VARIABLES AUXILIARES
+
+# Numero de procesos en paralelo. Se puede fijar con la variable de entorno
+# HUASCO_MAX_WORKERS; con 1 las unidades se ejecutan en serie en el mismo proceso. Con
+# las etapas en memoria de storage (keep_in_memory) siempre se ejecutan en serie, para
+# que los df escritos queden en el proceso que ejecuta las etapas siguientes
+max_workers = int(os.environ.get('HUASCO_MAX_WORKERS', 0)) or os.cpu_count()
+
+
+# DEFINICION DE FUNCIONES
+
+# Funcion que ejecuta una unidad de trabajo capturando sus mensajes y su instrumentacion
+def run_work_unit(task, args, label=None):
+    """
+    Ejecuta task(*args) redirigiendo los print a un buffer. Devuelve el texto
+    impreso, el resultado, el traceback en caso de error (o None) y el reporte de
+    instrumentacion de la unidad (etapas registradas y perfil opcional).
+    """
+    buffer = io.StringIO()
+    result, error, unit_report = None, None, None
+
+    with contextlib.redirect_stdout(buffer):
+        try:
+            result, unit_report = instrumentation.run_instrumented(task, args, label)
+        except Exception:
+            error = traceback.format_exc()
+            unit_report = {'stages': list(instrumentation.unit_records), 'profile': None}
+
+    return buffer.getvalue(), result, error, unit_report
+
+
+# Funcion de ejecucion en paralelo de las unidades de trabajo
+def run_parallel(task, work_units, workers=None):
+    """
+    Ejecuta una funcion sobre cada unidad de trabajo en un pool de procesos.
+    work_units es un diccionario {etiqueta: tupla de argumentos}. Los mensajes de
+    cada unidad se imprimen en el orden del diccionario y un error en una unidad
+    no detiene al resto. Devuelve un diccionario {etiqueta: resultado} y otro
+    {etiqueta: traceback} con las unidades que fallaron.
+    """
+    workers = workers or max_workers
+    results = {}
+    failures = {}
+
+    # Funcion interna que imprime los mensajes de una unidad y registra su resultado
+    def collect(label, output):
+        log, result, error, unit_report = output
+        print(log, end='')
+        instrumentation.add_unit_report(label, unit_report, error)
+        if error is not None:
+            print(f'  Error procesando {label}:\n{error}')
+            failures[label] = error
+        else:
+            results[label] = result
+
+    # Sin paralelismo (o con las etapas en memoria) se evita el costo de crear procesos
+    if workers == 1 or len(work_units) <= 1 or storage.keep_in_memory:
+        for label, args in work_units.items():
+            collect(label, run_work_unit(task, args, label))
+
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {label: executor.submit(run_work_unit, task, args, label)
+                       for label, args in work_units.items()}
+
+            # Recoge los resultados en el orden original de las unidades
+            for label, future in futures.items():
+                try:
+                    output = future.result()
+                except Exception:
+                    # Errores del propio pool (ej. proceso terminado abruptamente)
+                    output = ('', None, traceback.format_exc(), None)
+                collect(label, output)
+
+    # Resumen de unidades con errores
+    if failures:
+        print(f'{len(failures)} de {len(work_units)} unidades fallaron: {", ".join(failures)}')
+
+    return results, failures
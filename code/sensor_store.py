@@ -0,0 +1,134 @@
+# IMPORTACIONES
+
+import pandas as pd
+import numpy as np
+import storage
+
+
+# DEFINICION DE VARIABLES AUXILIARES
+
+# Campos codificados en el nombre de cada columna: Sensor_profundidad_variable_unidad
+metadata_fields = ['Sensor', 'Depth', 'Variable', 'Unit']
+
+
+# DEFINICION DE FUNCIONES
+
+# Funcion para extraer los metadatos de los nombres de columna
+def parse_column_metadata(columns):
+    """
+    Divide una sola vez el nombre de cada columna (ej. TEROS12_15cm_water-content_m3/m3)
+    en Sensor, Depth, Variable y Unit. Devuelve un df indexado por nombre de columna.
+    La unidad puede contener guiones bajos, por lo que se divide a lo mas tres veces.
+    """
+    rows = [column.split('_', len(metadata_fields) - 1) for column in columns]
+    rows = [row + [None] * (len(metadata_fields) - len(row)) for row in rows]
+    return pd.DataFrame(rows, index=pd.Index(columns, name='Column'), columns=metadata_fields)
+
+
+# DEFINICION DE CLASES
+
+class SensorStore:
+    """
+    Almacen en memoria de las series de varios sensores sobre un eje temporal comun.
+    Los valores se guardan en un arreglo float64 (columnas, tiempos) en el que cada
+    serie es contigua. Los metadatos de cada columna se obtienen una sola vez a partir
+    de su nombre y se guardan en metadata, donde se pueden agregar etiquetas por
+    columna (ej. Variable-label) que luego se incluyen en el formato largo.
+    """
+
+    def __init__(self, index, values, columns):
+        self.index = pd.DatetimeIndex(index, name=storage.index_name)
+        self.values = np.ascontiguousarray(values, dtype=np.float64)
+        self.columns = pd.Index(columns)
+        self.metadata = parse_column_metadata(list(self.columns))
+
+    # Funcion de construccion a partir de varios df con indice temporal
+    @classmethod
+    def from_frames(cls, frames, how='inner'):
+        """
+        Une varios df en el eje temporal comun (interseccion con how='inner', union
+        con how='outer', como pd.merge sobre el indice) y copia cada columna una sola
+        vez al arreglo de valores.
+        """
+        time_axis = frames[0].index
+        for df in frames[1:]:
+            time_axis = time_axis.join(df.index, how=how)
+
+        columns = [column for df in frames for column in df.columns]
+        values = np.empty((len(columns), len(time_axis)), dtype=np.float64)
+
+        position = 0
+        for df in frames:
+            # Solo se reindexa cuando el df no esta ya alineado con el eje comun
+            if not df.index.equals(time_axis):
+                df = df.reindex(time_axis)
+            values[position:position + df.shape[1]] = df.to_numpy(dtype=np.float64).T
+            position += df.shape[1]
+
+        return cls(time_axis, values, columns)
+
+    # Funcion de construccion a partir de etapas guardadas
+    @classmethod
+    def from_stages(cls, stage_columns, how='inner'):
+        """
+        Lee etapas con storage.read_stage_view y las une en un almacen. stage_columns es un
+        diccionario {ruta base (sin extension): lista de columnas o None para todas}.
+        """
+        frames = [storage.read_stage_view(base_path, columns=columns)
+                  for base_path, columns in stage_columns.items()]
+        return cls.from_frames(frames, how=how)
+
+    # Funcion para seleccionar columnas segun sus metadatos
+    def select(self, **filters):
+        """
+        Devuelve los nombres de las columnas cuyos metadatos cumplen con todos los
+        filtros (ej. select(Sensor='TEROS12', Variable='water-content')).
+        """
+        selected = np.ones(len(self.columns), dtype=bool)
+        for field, value in filters.items():
+            selected &= (self.metadata[field] == value).to_numpy()
+        return list(self.columns[selected])
+
+    # Funcion de la vista en formato ancho
+    def wide(self, columns=None):
+        """
+        Devuelve un df en formato ancho (tiempos x columnas). Con todas las columnas el
+        df comparte memoria con el almacen; con una seleccion se copian solo esas series.
+        """
+        if columns is None:
+            values, columns = self.values, self.columns
+        else:
+            values = self.values[self.columns.get_indexer(columns)]
+
+        # Se entrega la transpuesta: pandas guarda las columnas como filas de un bloque
+        return pd.DataFrame(values.T, index=self.index, columns=columns, copy=False)
+
+    # Funcion de la vista en formato largo
+    def long(self, columns=None):
+        """
+        Genera bajo demanda un df en formato largo, equivalente a wide().melt() con los
+        metadatos separados en columnas: Timestamps, un campo por cada columna de
+        metadata y Value. Los metadatos se repiten como codigos de tipo categorico, por
+        lo que no se procesa texto por cada fila. Las categorias incluyen solo los
+        valores presentes en la seleccion, en el orden de las columnas (el mismo orden
+        de aparicion que tendria el df de melt, por lo que los graficos no cambian).
+        """
+        if columns is None:
+            columns, values = list(self.columns), self.values
+            positions = np.arange(len(columns))
+        else:
+            positions = self.columns.get_indexer(columns)
+            values = self.values[positions]
+        n_times = len(self.index)
+
+        long_df = pd.DataFrame({storage.index_name: np.tile(self.index.to_numpy(), len(columns))})
+
+        # Cada campo de metadatos se expande repitiendo el codigo de cada columna
+        for field in self.metadata.columns:
+            codes, categories = pd.factorize(self.metadata[field].iloc[positions])
+            long_df[field] = pd.Categorical.from_codes(np.repeat(codes, n_times), categories)
+
+        # Las series son contiguas, por lo que ravel las concatena una tras otra
+        long_df['Value'] = values.ravel()
+
+        return long_df
@@ -0,0 +1,147 @@
+# IMPORTACIONES
+
+import hashlib
+import importlib
+import inspect
+import json
+import os
+
+
+# DEFINICION DE VARIABLES AUXILIARES
+
+# Nombre de la carpeta (dentro de cada carpeta de salida) donde se guardan las huellas
+cache_folder = '.stage-cache'
+
+# Con HUASCO_FORCE_REBUILD=1 se ignoran las huellas y se reprocesa todo
+force_rebuild = os.environ.get('HUASCO_FORCE_REBUILD') == '1'
+
+# Modulos auxiliares que leen o escriben las etapas: su codigo fuente se incluye en
+# todas las huellas de codigo, porque un cambio en ellos tambien cambia las salidas
+helper_modules = ['storage', 'time_axis', 'dtype_policy', 'array_cache']
+
+
+# DEFINICION DE FUNCIONES
+
+# Funcion para calcular el hash del contenido de un archivo
+def file_digest(file_path, block_size=1024 * 1024):
+    """
+    Calcula el hash sha256 del contenido de un archivo leyendolo por bloques.
+    """
+    file_hash = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+# Funcion para calcular el hash de un conjunto de objetos de configuracion
+def config_digest(*config_objects):
+    """
+    Calcula el hash de objetos de configuracion (diccionarios, listas, rangos de fechas)
+    a partir de su representacion json con claves ordenadas.
+    """
+    # Los objetos que json no reconoce (ej. pd.date_range) se convierten en listas de strings
+    def default(obj):
+        if hasattr(obj, '__iter__'):
+            return [str(value) for value in obj]
+        return str(obj)
+
+    text = json.dumps(config_objects, sort_keys=True, default=default)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+# Funcion para calcular el hash del codigo fuente de un conjunto de funciones
+def code_digest(*functions):
+    """
+    Calcula el hash del codigo fuente de las funciones (o modulos) que producen una
+    salida y de los modulos auxiliares de helper_modules, de modo que un cambio en el
+    codigo tambien invalida las salidas previas.
+    """
+    helpers = [importlib.import_module(name) for name in helper_modules]
+    source = ''.join(inspect.getsource(function) for function in [*functions, *helpers])
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+# Funcion para construir la ruta de la huella de un objetivo
+def fingerprint_path(output_dir, target):
+    """
+    Devuelve la ruta del archivo json con la huella de un objetivo (sensor y etapa).
+    """
+    return os.path.join(output_dir, cache_folder, f'{target}.json')
+
+
+# Funcion de lectura de la huella de un objetivo
+def load_fingerprint(output_dir, target):
+    """
+    Lee la huella guardada de un objetivo. Si no existe devuelve None.
+    """
+    path = fingerprint_path(output_dir, target)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+# Funcion de escritura de la huella de un objetivo
+def save_fingerprint(output_dir, target, fingerprint):
+    """
+    Guarda la huella de un objetivo despues de generar sus salidas. Cada objetivo
+    tiene su propio archivo, por lo que los procesos en paralelo no se interfieren.
+    """
+    path = fingerprint_path(output_dir, target)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as f:
+        json.dump(fingerprint, f, indent=2)
+    os.replace(temporary_path, path)
+
+
+# Funcion de construccion de la huella de un objetivo
+def build_fingerprint(input_paths, config, code, previous=None):
+    """
+    Construye la huella de un objetivo: tamano, fecha de modificacion y hash de cada
+    archivo de entrada, mas los hashes de configuracion y codigo. Como make, si el
+    tamano y la fecha de un archivo no cambiaron se reutiliza el hash previo, por
+    lo que un objetivo sin cambios no requiere leer sus entradas.
+    """
+    previous_inputs = previous['inputs'] if previous else {}
+    inputs = {}
+
+    for path in sorted(input_paths):
+        stat = os.stat(path)
+        entry = previous_inputs.get(path)
+        if not (entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns):
+            entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_digest(path)}
+        inputs[path] = entry
+
+    return {'inputs': inputs, 'config': config, 'code': code}
+
+
+# Funcion de verificacion de un objetivo
+def check_target(output_dir, target, input_paths, config, code, outputs_exist=True):
+    """
+    Compara la huella actual de un objetivo con la guardada. Devuelve True si el
+    objetivo esta al dia (mismas entradas por contenido, misma configuracion y mismo
+    codigo, y sus salidas existen), junto con la huella actual para guardarla
+    despues de reprocesar.
+    """
+    previous = load_fingerprint(output_dir, target)
+    fingerprint = build_fingerprint(input_paths, config, code, previous)
+
+    if force_rebuild or previous is None or not outputs_exist:
+        return False, fingerprint
+
+    # Las entradas se comparan por contenido (hash), no por fecha de modificacion
+    previous_hashes = {path: entry['sha256'] for path, entry in previous['inputs'].items()}
+    current_hashes = {path: entry['sha256'] for path, entry in fingerprint['inputs'].items()}
+
+    up_to_date = (previous_hashes == current_hashes
+                  and previous['config'] == config
+                  and previous['code'] == code)
+
+    # Si solo cambiaron fechas de modificacion se actualiza la huella para no
+    # volver a calcular los hashes en la proxima ejecucion
+    if up_to_date and fingerprint != previous:
+        save_fingerprint(output_dir, target, fingerprint)
+
+    return up_to_date, fingerprint
@@ -0,0 +1,209 @@
+# IMPORTACIONES
+
+import os
+
+import numpy as np
+import pandas as pd
+import storage
+import instrumentation
+import sensor_store
+import correlation
+import depth_interpolation
+
+
+# DEFINICION DE VARIABLES AUXILIARES
+
+# Tabla de estaciones: piezometro y datalogger de suelo de cada estacion, sensor de suelo
+# a analizar y sus profundidades (None: todas las que se encuentren en los nombres de
+# columna Sensor_profundidad_variable_unidad del datalogger)
+stations = {
+    'norte': {
+        'piezometer': 'SDH1PS01',
+        'datalogger': 'z6-25818',
+        'sensor': 'TEROS12',
+        'depths': ['15cm', '30cm', '48cm']
+    },
+    'sur': {
+        'piezometer': 'SDH1PS02',
+        'datalogger': 'z6-26092',
+        'sensor': 'TEROS12',
+        'depths': None
+    }
+}
+
+# Variables del suelo que se comparan con la profundidad del nivel freatico
+soil_variables = ['water-content', 'soil-temperature']
+
+# Columna de profundidad del nivel freatico, referencia de las correlaciones
+groundwater_col = 'Piezometer_NA_groundwater-depth_m'
+
+# Parametros del analisis: orden de la diferenciacion (series estacionarias), dias de
+# desfase de las correlaciones cruzadas, largo de la ventana movil (dias) y resolucion
+# (m) y metodo ('linear' o 'pchip') de la interpolacion vertical
+analysis_parameters = {
+    'difference_order': 2,
+    'lag_days': 15,
+    'window_days': 61,
+    'depth_resolution': 0.01,
+    'depth_method': 'linear'
+}
+
+# Carpeta con las etapas diarias y patrones de sus nombres (sin extension)
+daily_data_path = os.path.join(storage.processed_root, '03_daily')
+piezometer_stage_pattern = 'piezo-data_{piezometer}_daily'
+datalogger_stage_pattern = 'soil-data_{datalogger}_daily'
+
+# Tablas consolidadas que entrega analyze_station para cada estacion
+result_tables = ['summary', 'cross-correlation', 'rolling-correlation', 'depth-profiles']
+
+
+# DEFINICION DE FUNCIONES
+
+# Funcion para construir las rutas de las etapas diarias de una estacion
+def station_stages(station):
+    """
+    Devuelve las rutas base (sin extension) de las etapas diarias del piezometro y del
+    datalogger de una estacion. Lanza FileNotFoundError si alguna no existe.
+    """
+    piezometer_path = os.path.join(daily_data_path, piezometer_stage_pattern.format(**station))
+    datalogger_path = os.path.join(daily_data_path, datalogger_stage_pattern.format(**station))
+    for base_path in (piezometer_path, datalogger_path):
+        if not storage.stage_files(base_path):
+            raise FileNotFoundError(f'No se encontro la etapa diaria {base_path}')
+    return piezometer_path, datalogger_path
+
+
+# Funcion de seleccion de las columnas de suelo de una estacion
+def station_columns(store, station, variables=None):
+    """
+    Busca en los metadatos del almacen (nombres Sensor_profundidad_variable_unidad) las
+    columnas del sensor de suelo de la estacion para cada variable, ordenadas por
+    profundidad y restringidas a las profundidades de la estacion si se indican.
+    Devuelve un diccionario {variable: [columnas]} sin las variables no encontradas.
+    """
+    columns = {}
+    for variable in variables or soil_variables:
+        selected = store.select(Sensor=station['sensor'], Variable=variable)
+        if station.get('depths'):
+            selected = [column for column in selected
+                        if store.metadata.loc[column, 'Depth'] in station['depths']]
+        selected.sort(key=lambda column: depth_interpolation.depth_label_to_m(
+            store.metadata.loc[column, 'Depth']))
+        if selected:
+            columns[variable] = selected
+    return columns
+
+
+# Funcion de analisis de una estacion (unidad de trabajo en paralelo)
+def analyze_station(station_name, station, parameters=None):
+    """
+    Une las series diarias del piezometro y del datalogger de una estacion en un eje
+    temporal comun, las diferencia y calcula las correlaciones cruzadas y moviles
+    entre la profundidad del nivel freatico y cada columna de suelo, y la
+    interpolacion vertical de cada variable. Devuelve un diccionario con un df por
+    cada tabla de result_tables, con las columnas Station, Variable y Depth.
+    """
+    parameters = {**analysis_parameters, **(parameters or {})}
+    print(f'Analizando estacion {station_name} '
+          f'({station["piezometer"]} - {station["datalogger"]})')
+
+    # Union de las series en el eje temporal comun (interseccion de fechas)
+    piezometer_path, datalogger_path = station_stages(station)
+    with instrumentation.stage('lectura', bytes_read=instrumentation.path_bytes(
+            storage.stage_read_files(piezometer_path) + storage.stage_read_files(datalogger_path))) as record:
+        store = sensor_store.SensorStore.from_stages(
+            {piezometer_path: [groundwater_col], datalogger_path: None}, how='inner')
+        record['rows_out'] = len(store.index)
+
+    columns = station_columns(store, station)
+    if not columns:
+        raise ValueError(f'No se encontraron columnas {station["sensor"]} de {soil_variables} '
+                         f'en {datalogger_path}')
+    soil_cols = [column for variable_cols in columns.values() for column in variable_cols]
+    column_labels = {column: (store.metadata.loc[column, 'Variable'], store.metadata.loc[column, 'Depth'])
+                     for column in soil_cols}
+    print(f'  {len(store.index)} dias en comun, {len(soil_cols)} columnas de suelo: '
+          f'{", ".join(soil_cols)}')
+
+    with instrumentation.stage('correlaciones', rows_in=len(store.index)) as record:
+        # Diferenciacion para generar series temporales estacionarias
+        diff_df = store.wide([groundwater_col] + soil_cols)
+        for _ in range(parameters['difference_order']):
+            diff_df = diff_df.diff()
+        diff_df = diff_df.dropna()
+
+        lags = np.arange(-parameters['lag_days'], parameters['lag_days'] + 1)
+        cross_df = correlation.cross_correlation_df(diff_df, groundwater_col, column_labels, lags)
+        rolling_df = correlation.rolling_correlation_df(
+            diff_df, groundwater_col, column_labels, parameters['window_days']).dropna().reset_index()
+        record['rows_out'] = len(cross_df) + len(rolling_df)
+
+    # Resumen por columna: desfase de la correlacion cruzada de mayor magnitud
+    n_obs = len(diff_df)
+    strongest = cross_df.loc[cross_df['Cross-correlation'].abs().groupby(
+        [cross_df['Variable-label'], cross_df['Depth-label']], sort=False).idxmax()]
+    summary_df = pd.DataFrame({
+        'Variable-label': strongest['Variable-label'].to_numpy(),
+        'Depth-label': strongest['Depth-label'].to_numpy(),
+        'Column': soil_cols,
+        'Days': len(store.index),
+        'Differenced-days': n_obs,
+        'Best-lag': strongest['Lag'].to_numpy(),
+        'Best-cross-correlation': strongest['Cross-correlation'].to_numpy(),
+        'Confidence-limit': 1.96 / np.sqrt(n_obs) if n_obs else np.nan
+    })
+
+    # Interpolacion vertical de cada variable con al menos dos profundidades
+    profiles = []
+    with instrumentation.stage('interpolacion', rows_in=len(store.index)) as record:
+        for variable, variable_cols in columns.items():
+            if len(variable_cols) < 2:
+                continue
+            depths_m = [depth_interpolation.depth_label_to_m(store.metadata.loc[column, 'Depth'])
+                        for column in variable_cols]
+            fine_depths, grid = depth_interpolation.interpolate_depth_grid(
+                store.wide(variable_cols).to_numpy().T, depths_m,
+                resolution=parameters['depth_resolution'], method=parameters['depth_method'])
+            profiles.append(pd.DataFrame({
+                'Variable-label': variable,
+                storage.index_name: np.tile(store.index.to_numpy(), len(fine_depths)),
+                'Depth-m': np.repeat(np.round(fine_depths, 6), len(store.index)),
+                'Value': grid.ravel()
+            }))
+        profiles_df = pd.concat(profiles, ignore_index=True) if profiles else pd.DataFrame()
+        record['rows_out'] = len(profiles_df)
+
+    # Columnas comunes de las tablas consolidadas
+    tables = {}
+    for table_name, df in zip(result_tables, [summary_df, cross_df, rolling_df, profiles_df]):
+        df = df.rename(columns={'Variable-label': 'Variable', 'Depth-label': 'Depth'})
+        df.insert(0, 'Station', station_name)
+        tables[table_name] = df
+    print('  Correlaciones e interpolacion calculadas.\n')
+    return tables
+
+
+# Funcion de union de los resultados de todas las estaciones
+def consolidate(results):
+    """
+    Une las tablas de cada estacion ({estacion: {tabla: df}}, ver analyze_station) en
+    una tabla por tipo de resultado, en el orden de las estaciones.
+    """
+    return {table_name: pd.concat([tables[table_name] for tables in results.values()],
+                                  ignore_index=True)
+            for table_name in result_tables
+            if any(table_name in tables for tables in results.values())}
+
+
+# Funcion de escritura de las tablas consolidadas
+def write_result_tables(tables, output_dir):
+    """
+    Guarda cada tabla consolidada como .csv en la carpeta de salida y devuelve las rutas.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    written_paths = []
+    for table_name, df in tables.items():
+        path = os.path.join(output_dir, f'stations_{table_name}.csv')
+        df.to_csv(path, index=False)
+        written_paths.append(path)
+    return written_paths
@@ -0,0 +1,527 @@
+# IMPORTACIONES
+
+import pandas as pd
+import numpy as np
+import glob
+import json
+import os
+import dtype_policy
+import array_cache
+
+# pyarrow es opcional: sin el, las etapas se guardan solo como csv
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+# DEFINICION DE VARIABLES AUXILIARES
+
+# Formatos en que se guarda cada etapa procesada. El primero disponible es el que se
+# usa para la lectura; csv se mantiene como exportacion legible
+output_formats = ['parquet', 'csv'] if pq is not None else ['csv']
+
+# Nombre del indice temporal comun a todas las etapas
+index_name = 'Timestamps'
+
+# Valores que se interpretan como NaN al leer archivos csv
+csv_na_values = ['#N/D']
+
+# Carpetas raiz de los datos crudos y procesados, relativas a la carpeta code. Se
+# pueden cambiar con las variables de entorno HUASCO_RAW_ROOT y HUASCO_PROCESSED_ROOT
+# (o con --raw-root y --processed-root de pipeline.py) antes de importar los scripts
+raw_root = os.environ.get('HUASCO_RAW_ROOT', '../data/raw')
+processed_root = os.environ.get('HUASCO_PROCESSED_ROOT', '../data/processed')
+
+# Etapas en memoria: con keep_in_memory (HUASCO_IN_MEMORY=1, activo en pipeline.py)
+# write_stage conserva una copia de cada df escrito y las lecturas posteriores de la
+# etapa en el mismo proceso la usan en vez de volver a leer y convertir los archivos,
+# mientras estos no cambien. No se usa con la representacion compacta de dtype_policy
+keep_in_memory = os.environ.get('HUASCO_IN_MEMORY') == '1'
+memory_stages = {}
+
+# Tamano maximo (MB) de las etapas en memoria; al superarlo se descartan las usadas
+# hace mas tiempo. Se puede fijar con la variable de entorno HUASCO_IN_MEMORY_MB
+memory_limit_mb = float(os.environ.get('HUASCO_IN_MEMORY_MB', 512))
+
+# Numero maximo de partes parquet por particion anual. Cada append_stage agrega una
+# parte a cada particion que recibe registros (ej. la ingesta incremental de 01b);
+# al superarlo las partes de la particion se unen en una sola
+max_parts_per_partition = 16
+
+
+# DEFINICION DE FUNCIONES
+
+# Funcion para construir la ruta de un formato
+def format_path(base_path, file_format):
+    """
+    Agrega la extension de un formato a una ruta base (sin extension).
+    En parquet la ruta corresponde a una carpeta particionada por ano.
+    """
+    return f'{base_path}.{file_format}'
+
+
+# Funcion para verificar si existe una etapa
+def stage_exists(base_path, formats=None):
+    """
+    Devuelve True si la etapa existe en todos los formatos indicados
+    (por defecto, los formatos de salida configurados).
+    """
+    formats = formats or output_formats
+    return all(os.path.exists(format_path(base_path, file_format))
+               for file_format in formats)
+
+
+# Funcion para listar las etapas de una carpeta
+def list_stages(directory, pattern):
+    """
+    Busca archivos csv y carpetas parquet que cumplen con un patron y devuelve
+    una lista ordenada con sus rutas base (sin extension ni duplicados).
+    """
+    base_paths = set()
+    for file_format in ['parquet', 'csv']:
+        filepath_pattern = os.path.join(directory, f'{pattern}.{file_format}')
+        for path in glob.glob(filepath_pattern):
+            base_paths.add(path[:-len(file_format) - 1])
+    return sorted(base_paths)
+
+
+# Funcion para listar las particiones parquet de una etapa
+def list_parquet_parts(base_path):
+    """
+    Devuelve las rutas a los archivos parquet de una etapa ordenadas por ano y,
+    dentro de cada ano, por numero de parte (orden de escritura). No es el orden de
+    escritura de toda la etapa: una parte agregada con registros de un ano anterior
+    se lee antes que las de los anos siguientes, por lo que en una etapa desordenada
+    el orden de las filas puede diferir del csv (que conserva el orden de escritura).
+    """
+    pattern = os.path.join(format_path(base_path, 'parquet'), 'year=*', 'part-*.parquet')
+    return sorted(glob.glob(pattern))
+
+
+# Funcion para listar los archivos de una etapa
+def stage_files(base_path):
+    """
+    Devuelve todos los archivos en disco de una etapa: el csv y las partes parquet.
+    """
+    csv_path = format_path(base_path, 'csv')
+    csv_files = [csv_path] if os.path.exists(csv_path) else []
+    return csv_files + list_parquet_parts(base_path)
+
+
+# Funcion para listar los archivos que se leen de una etapa
+def stage_read_files(base_path):
+    """
+    Devuelve los archivos que leen read_stage e iter_stage_chunks: las partes parquet
+    si existen y pyarrow esta disponible; si no, el csv.
+    """
+    if pq is not None and list_parquet_parts(base_path):
+        return list_parquet_parts(base_path)
+    return [format_path(base_path, 'csv')]
+
+
+# Funcion para construir la clave de una etapa en memoria
+def memory_key(base_path):
+    """
+    Devuelve la ruta absoluta de una etapa, para que las rutas relativas y absolutas
+    de una misma etapa compartan la copia en memoria.
+    """
+    return os.path.abspath(base_path)
+
+
+# Funcion de registro de una etapa en memoria
+def remember_stage(df, base_path):
+    """
+    Conserva una copia de un df recien escrito con el indice y los tipos con que lo
+    entrega read_stage (float64 si la etapa se lee desde csv) y el estado de los
+    archivos de la etapa. Solo actua con keep_in_memory activo.
+    """
+    memory_stages.pop(memory_key(base_path), None)
+    source_files = [path for path in stage_read_files(base_path) if os.path.exists(path)]
+    if not keep_in_memory or dtype_policy.compact_storage or not source_files:
+        return
+
+    frame = df.astype(np.float64) if source_files[0].endswith('.csv') else df.copy()
+    frame.index = pd.DatetimeIndex(frame.index, freq=None)
+    memory_stages[memory_key(base_path)] = (frame, array_cache.source_state(source_files))
+    evict_memory_stages()
+
+
+# Funcion de liberacion de etapas en memoria
+def evict_memory_stages():
+    """
+    Descarta las etapas en memoria usadas hace mas tiempo hasta que su tamano total no
+    supere memory_limit_mb. Un df mayor que el limite no se conserva.
+    """
+    sizes = {key: frame.memory_usage(index=True).sum() for key, (frame, _) in memory_stages.items()}
+    total = sum(sizes.values())
+    for key in list(memory_stages):
+        if total <= memory_limit_mb * 1024 ** 2:
+            break
+        total -= sizes[key]
+        memory_stages.pop(key)
+
+
+# Funcion de lectura de una etapa en memoria
+def recall_stage(base_path, columns=None):
+    """
+    Devuelve una copia de la etapa conservada por remember_stage (solo las columnas
+    pedidas), o None si no esta en memoria o si sus archivos cambiaron desde que se
+    escribio.
+    """
+    entry = memory_stages.get(memory_key(base_path))
+    if entry is None:
+        return None
+
+    frame, state = entry
+    source_files = [path for path in stage_read_files(base_path) if os.path.exists(path)]
+    if not source_files or array_cache.source_state(source_files) != state:
+        memory_stages.pop(memory_key(base_path), None)
+        return None
+
+    # La etapa pasa a ser la usada mas recientemente (la ultima en descartarse)
+    memory_stages[memory_key(base_path)] = memory_stages.pop(memory_key(base_path))
+
+    return frame.copy() if columns is None else frame[list(columns)]
+
+
+# Funcion para escribir particiones parquet
+def write_parquet_parts(df, base_path):
+    """
+    Escribe un df como un nuevo archivo parquet dentro de cada particion anual.
+    Si la particion ya tiene archivos, la nueva parte se numera a continuacion.
+    """
+    if pq is None:
+        raise ImportError('Se requiere pyarrow para guardar en formato parquet.')
+
+    written_paths = []
+    for year, df_year in df.groupby(df.index.year, sort=True):
+        partition_path = os.path.join(format_path(base_path, 'parquet'), f'year={year}')
+        os.makedirs(partition_path, exist_ok=True)
+
+        # Numera la nueva parte a continuacion de las existentes
+        part_number = len(glob.glob(os.path.join(partition_path, 'part-*.parquet')))
+        part_path = os.path.join(partition_path, f'part-{part_number:05d}.parquet')
+
+        # Con la representacion compacta se guardan enteros escalados o float32 y el
+        # indice como rango de frecuencia fija; si no, preserve_index guarda el indice
+        # datetime64 con su nombre y tipo
+        if dtype_policy.compact_storage:
+            table = dtype_policy.encode_table(df_year)
+        else:
+            table = pa.Table.from_pandas(df_year, preserve_index=True)
+        pq.write_table(table, part_path)
+        written_paths.append(part_path)
+
+    return written_paths
+
+
+# Funcion de compactacion de las particiones parquet de una etapa
+def compact_parquet_parts(base_path, max_parts=None):
+    """
+    Une en una sola parte las partes de cada particion anual que tenga mas de
+    max_parts (por defecto max_parts_per_partition), conservando el orden de sus
+    filas. La parte unida reemplaza primero a la primera parte y luego se eliminan
+    las demas, de modo que una interrupcion no pierde registros. Devuelve las rutas
+    de las particiones compactadas.
+    """
+    max_parts = max_parts or max_parts_per_partition
+    compacted = []
+
+    partitions = {}
+    for part_path in list_parquet_parts(base_path):
+        partitions.setdefault(os.path.dirname(part_path), []).append(part_path)
+
+    for partition_path, part_paths in partitions.items():
+        if len(part_paths) <= max_parts:
+            continue
+
+        # Escribe la particion completa con la representacion actual y la ubica como
+        # primera parte (os.replace es atomico)
+        df = read_parquet_parts(part_paths)
+        if dtype_policy.compact_storage:
+            table = dtype_policy.encode_table(df)
+        else:
+            table = pa.Table.from_pandas(df, preserve_index=True)
+        temporary_path = os.path.join(partition_path, 'compact.parquet.tmp')
+        pq.write_table(table, temporary_path)
+        os.replace(temporary_path, part_paths[0])
+        for part_path in part_paths[1:]:
+            os.remove(part_path)
+        compacted.append(partition_path)
+
+    return compacted
+
+
+# Funcion de escritura de una etapa
+def write_stage(df, base_path, formats=None):
+    """
+    Guarda un df con indice temporal en cada uno de los formatos indicados,
+    reemplazando cualquier version previa. Devuelve las rutas escritas.
+    """
+    formats = formats or output_formats
+    written_paths = []
+
+    for file_format in formats:
+        path = format_path(base_path, file_format)
+
+        if file_format == 'parquet':
+            # Elimina las particiones previas para no mezclar versiones
+            for part_path in list_parquet_parts(base_path):
+                os.remove(part_path)
+            write_parquet_parts(df, base_path)
+        else:
+            df.to_csv(path)
+
+        written_paths.append(path)
+
+    remember_stage(df, base_path)
+    return written_paths
+
+
+# Funcion de agregacion de registros a una etapa
+def append_stage(df, base_path, formats=None):
+    """
+    Agrega registros al final de una etapa existente. En csv se escriben las filas
+    sin encabezado y en parquet se agrega una nueva parte a cada particion anual.
+    """
+    formats = formats or output_formats
+    written_paths = []
+
+    for file_format in formats:
+        path = format_path(base_path, file_format)
+
+        # Si el formato aun no existe se escribe completo
+        if not os.path.exists(path):
+            write_stage(df, base_path, formats=[file_format])
+        elif file_format == 'parquet':
+            write_parquet_parts(df, base_path)
+        else:
+            df.to_csv(path, mode='a', header=False)
+
+        written_paths.append(path)
+
+    # Une las partes de las particiones que acumularon demasiadas
+    if 'parquet' in formats:
+        compact_parquet_parts(base_path)
+
+    # La copia en memoria ya no corresponde a la etapa completa
+    memory_stages.pop(memory_key(base_path), None)
+    return written_paths
+
+
+# Funcion de escritura por bloques de una etapa
+def write_stage_chunks(chunks, base_path, append=False, formats=None):
+    """
+    Escribe una etapa a partir de bloques con las mismas columnas (ej. un generador)
+    sin reunirlos en memoria: el primer bloque reemplaza la version previa, o se
+    agrega a ella con append=True, y los siguientes se agregan con append_stage. En
+    parquet cada bloque agrega una parte a sus particiones anuales. Devuelve las rutas
+    escritas y el numero de filas; si no hay bloques con filas no se escribe nada.
+    """
+    written_paths = []
+    n_rows = 0
+
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        if n_rows == 0 and not append:
+            written_paths = write_stage(chunk, base_path, formats)
+        else:
+            written_paths = append_stage(chunk, base_path, formats)
+        n_rows += len(chunk)
+
+    return written_paths, n_rows
+
+
+# Funcion con las opciones de lectura de una etapa en formato csv
+def csv_read_options(path, columns=None):
+    """
+    Devuelve los argumentos de pd.read_csv para leer una etapa: Timestamps como
+    indice datetime y el tipo float64 en las demas columnas (o en las pedidas).
+    """
+    # Asigna el tipo float64 a todas las columnas que no sean Timestamp
+    header = pd.read_csv(path, nrows=0).columns.tolist()
+    numeric_columns = [col for col in header if col != index_name]
+    if columns is not None:
+        numeric_columns = [col for col in numeric_columns if col in columns]
+    dtype_map = {col: np.float64 for col in numeric_columns}
+
+    return {'usecols': [index_name] + numeric_columns,
+            'parse_dates': [index_name],
+            'index_col': index_name,
+            'dtype': dtype_map,
+            'na_values': csv_na_values}
+
+
+# Funcion de lectura de una etapa en formato csv
+def read_csv_stage(path, columns=None):
+    """
+    Lee una etapa en formato csv estableciendo Timestamps como indice datetime
+    y asignando el tipo float64 a las demas columnas.
+    """
+    df = pd.read_csv(path, **csv_read_options(path, columns))
+    return dtype_policy.compact_frame(df) if dtype_policy.compact_storage else df
+
+
+# Funcion de lectura de una etapa en formato parquet
+def read_parquet_stage(base_path, columns=None):
+    """
+    Lee todas las partes parquet de una etapa, cargando solo las columnas pedidas.
+    El indice y los tipos se recuperan de los metadatos de pandas o, en las partes
+    escritas con la representacion compacta, de los de dtype_policy.
+    """
+    if pq is None:
+        raise ImportError('Se requiere pyarrow para leer archivos parquet.')
+
+    return read_parquet_parts(list_parquet_parts(base_path), columns)
+
+
+# Funcion de lectura de una lista de partes parquet
+def read_parquet_parts(part_paths, columns=None):
+    """
+    Lee en orden una lista de partes parquet y devuelve un solo df, decodificando las
+    partes escritas con la representacion compacta de dtype_policy.
+    """
+    schemas = [pq.read_schema(part_path) for part_path in part_paths]
+
+    # Sin partes compactas las tablas se unen antes de convertirlas a pandas
+    if not any(dtype_policy.is_compact(schema) for schema in schemas):
+        tables = [pq.read_pandas(part_path, columns=columns) for part_path in part_paths]
+        return pa.concat_tables(tables).to_pandas()
+
+    frames = []
+    for part_path, schema in zip(part_paths, schemas):
+        if dtype_policy.is_compact(schema):
+            table = pq.read_table(part_path, columns=dtype_policy.stored_columns(schema, columns))
+            frames.append(dtype_policy.decode_table(table))
+        else:
+            frames.append(pq.read_pandas(part_path, columns=columns).to_pandas())
+    return pd.concat(frames)
+
+
+# Funcion de lectura de una etapa
+def read_stage(base_path, columns=None):
+    """
+    Lee una etapa desde parquet si existe y pyarrow esta disponible; si no, desde csv.
+    columns permite cargar solo un subconjunto de columnas. Con keep_in_memory activo
+    devuelve la copia conservada al escribir la etapa en el mismo proceso.
+    """
+    df = recall_stage(base_path, columns)
+    if df is not None:
+        return df
+
+    if pq is not None and list_parquet_parts(base_path):
+        return read_parquet_stage(base_path, columns=columns)
+
+    return read_csv_stage(format_path(base_path, 'csv'), columns=columns)
+
+
+# Funcion de lectura por bloques de los archivos de una etapa
+def iter_file_chunks(base_path, chunksize, columns=None):
+    """
+    Recorre los archivos de una etapa (parquet o csv) en bloques de a lo mas chunksize
+    filas, en el orden en que fueron escritas. Cada bloque es un df con el mismo indice
+    y tipos que read_stage, por lo que la memoria usada depende del tamano del bloque
+    y no del archivo.
+    """
+    if pq is not None and list_parquet_parts(base_path):
+        # El indice se lee junto con las columnas para que to_pandas lo restablezca
+        batch_columns = None if columns is None else [index_name] + list(columns)
+        for part_path in list_parquet_parts(base_path):
+            parquet_file = pq.ParquetFile(part_path)
+
+            # Las partes compactas se decodifican bloque a bloque; offset permite
+            # reconstruir los indices de frecuencia fija
+            if dtype_policy.is_compact(parquet_file.schema_arrow):
+                encoding = json.loads(parquet_file.schema_arrow.metadata[dtype_policy.metadata_key])
+                offset = 0
+                for batch in parquet_file.iter_batches(
+                        batch_size=chunksize,
+                        columns=dtype_policy.stored_columns(parquet_file.schema_arrow, columns)):
+                    yield dtype_policy.decode_table(batch, encoding, offset)
+                    offset += batch.num_rows
+                continue
+
+            for batch in parquet_file.iter_batches(batch_size=chunksize, columns=batch_columns):
+                yield batch.to_pandas()
+        return
+
+    # En csv se usan las mismas opciones de read_csv_stage, bloque a bloque
+    path = format_path(base_path, 'csv')
+    yield from pd.read_csv(path, chunksize=chunksize, **csv_read_options(path, columns))
+
+
+# Funcion de lectura por bloques de una etapa
+def iter_stage_chunks(base_path, chunksize, columns=None):
+    """
+    Recorre una etapa en bloques de a lo mas chunksize filas (ver iter_file_chunks).
+    Con el cache de arreglos activo (array_cache.enabled) los bloques son vistas de
+    solo lectura sobre los arreglos mapeados en memoria, sin leer ni convertir los
+    archivos, por lo que no se deben modificar. Las etapas en memoria (ver read_stage)
+    se recorren sobre una copia, sin leer los archivos.
+    """
+    df = recall_stage(base_path, columns)
+    if df is not None:
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+        return
+
+    if array_cache.enabled and ensure_array_cache(base_path):
+        df = array_cache.load_frame(base_path, columns)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+        return
+
+    yield from iter_file_chunks(base_path, chunksize, columns)
+
+
+# Funcion de conteo de las filas de una etapa
+def count_stage_rows(base_path):
+    """
+    Cuenta las filas de una etapa: en parquet desde los metadatos de cada parte y en
+    csv recorriendo solo el indice por bloques.
+    """
+    if pq is not None and list_parquet_parts(base_path):
+        return sum(pq.ParquetFile(part_path).metadata.num_rows
+                   for part_path in list_parquet_parts(base_path))
+    return sum(len(chunk) for chunk in iter_file_chunks(base_path, 1_000_000, columns=[]))
+
+
+# Funcion de construccion (si falta o esta desactualizado) del cache de arreglos
+def ensure_array_cache(base_path):
+    """
+    Construye el cache de arreglos de una etapa por bloques si no existe o si los
+    archivos de la etapa cambiaron desde su construccion. Devuelve False si la etapa
+    no tiene archivos o filas, en cuyo caso se lee de la forma habitual.
+    """
+    source_files = [path for path in stage_read_files(base_path) if os.path.exists(path)]
+    if not source_files:
+        return False
+    if array_cache.is_current(base_path, source_files):
+        return True
+
+    n_rows = count_stage_rows(base_path)
+    if n_rows == 0:
+        return False
+    array_cache.build_array_cache(base_path, iter_file_chunks(base_path, 100_000), n_rows, source_files)
+    return True
+
+
+# Funcion de lectura de una etapa para consumidores de solo lectura
+def read_stage_view(base_path, columns=None):
+    """
+    Lee una etapa como read_stage. Con el cache de arreglos activo devuelve un df de
+    solo lectura sobre los arreglos mapeados en memoria (compartidos entre procesos y
+    sin conversion desde texto); el df no se debe modificar. Las etapas en memoria
+    tienen prioridad sobre el cache de arreglos.
+    """
+    df = recall_stage(base_path, columns)
+    if df is not None:
+        return df
+
+    if array_cache.enabled and ensure_array_cache(base_path):
+        return array_cache.load_frame(base_path, columns)
+    return read_stage(base_path, columns=columns)
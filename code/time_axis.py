@@ -0,0 +1,318 @@
+# IMPORTACIONES
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# DEFINICION DE VARIABLES AUXILIARES
+
+# Sufijo del archivo con el indice del eje temporal, junto a la etapa (ruta sin extension)
+sidecar_suffix = '.time-axis.json'
+
+# Nanosegundos de un dia, para agrupar por dia con division entera
+ns_per_day = 86_400 * 10 ** 9
+
+# Numero maximo de vacios y de timestamps duplicados listados en el indice (los
+# primeros en el tiempo); los totales se guardan en n_gaps y n_duplicates
+max_listed = 100
+
+
+# DEFINICION DE FUNCIONES
+
+# Funcion para obtener los timestamps como enteros
+def epoch_ns(timestamps):
+    """
+    Devuelve los timestamps como un arreglo int64 de nanosegundos desde 1970.
+    """
+    return pd.DatetimeIndex(timestamps).as_unit('ns').asi8
+
+
+# Funcion de calculo del intervalo nominal de muestreo
+def nominal_interval(times_ns):
+    """
+    Devuelve el intervalo de muestreo mas frecuente (ns) entre timestamps
+    consecutivos, o None si hay menos de dos timestamps distintos.
+    """
+    steps = np.diff(times_ns)
+    steps = steps[steps > 0]
+    if steps.size == 0:
+        return None
+    values, counts = np.unique(steps, return_counts=True)
+    return int(values[np.argmax(counts)])
+
+
+# Funcion de construccion del indice del eje temporal
+def build_time_axis(timestamps):
+    """
+    Describe el eje temporal de una etapa: intervalo nominal, vacios (tramos sin
+    registros mas largos que el intervalo), timestamps duplicados y cobertura. Si los
+    registros estan ordenados, sin duplicados y sobre la grilla inicio + k * intervalo
+    (aligned), las posiciones de cualquier fecha se calculan con aritmetica entera
+    (ver positions), sin buscar en el indice. Los vacios y duplicados se listan hasta
+    max_listed; n_gaps y n_duplicates tienen los totales.
+    """
+    times = epoch_ns(timestamps)
+    interval = nominal_interval(times)
+    monotonic = bool((np.diff(times) >= 0).all())
+
+    axis = {
+        'n_records': int(times.size),
+        'start': str(pd.Timestamp(times[0])) if times.size else None,
+        'end': str(pd.Timestamp(times[-1])) if times.size else None,
+        'start_ns': int(times[0]) if times.size else None,
+        'end_ns': int(times[-1]) if times.size else None,
+        'interval_ns': interval,
+        'interval': str(pd.Timedelta(interval, unit='ns')) if interval else None,
+        'monotonic': monotonic,
+        'aligned': False,
+        'n_gaps': 0,
+        'gaps': [],
+        'n_duplicates': 0,
+        'duplicates': []
+    }
+
+    # Duplicados: timestamps que aparecen mas de una vez (ej. exportaciones traslapadas)
+    unique_times, counts = np.unique(times, return_counts=True)
+    repeated = counts > 1
+    axis['n_unique'] = int(unique_times.size)
+    axis['n_duplicates'] = int(repeated.sum())
+    axis['duplicates'] = list_duplicates(unique_times[repeated], counts[repeated], max_listed)
+
+    # Registros con el ultimo timestamp, para extender el indice (ver extend_time_axis)
+    axis['end_count'] = int(counts[-1]) if times.size and monotonic else None
+
+    if interval is None or not monotonic:
+        axis['n_expected'] = int(times.size)
+        axis['coverage'] = 1.0 if times.size else None
+        return axis
+
+    # Vacios: saltos mayores al intervalo nominal entre registros consecutivos
+    gap_rows = np.flatnonzero(np.diff(times) > interval)
+    axis['n_gaps'] = int(gap_rows.size)
+    axis['gaps'] = list_gaps(times, gap_rows[:max_listed], interval)
+
+    # Registros esperados segun el intervalo nominal entre el primero y el ultimo
+    axis['n_expected'] = int((times[-1] - times[0]) // interval + 1)
+    axis['coverage'] = round(axis['n_unique'] / axis['n_expected'], 6)
+
+    # Eje alineado: sin duplicados y con todos los registros sobre la grilla
+    axis['aligned'] = bool(not axis['n_duplicates'] and ((times - times[0]) % interval == 0).all())
+    return axis
+
+
+# Funcion para listar timestamps duplicados
+def list_duplicates(times, counts, limit):
+    """
+    Devuelve hasta limit pares [timestamp, numero de registros] de timestamps duplicados.
+    """
+    return [[str(pd.Timestamp(t)), int(c)] for t, c in zip(times[:limit], counts[:limit])]
+
+
+# Funcion para listar vacios
+def list_gaps(times, gap_rows, interval, row_offset=0):
+    """
+    Devuelve la descripcion de los vacios que siguen a las posiciones gap_rows del
+    arreglo times; row_offset es la fila de la etapa que corresponde a times[0].
+    """
+    return [{'after_row': int(row) + row_offset,
+             'from': str(pd.Timestamp(times[row])),
+             'to': str(pd.Timestamp(times[row + 1])),
+             'missing': int((times[row + 1] - times[row]) // interval - 1)}
+            for row in gap_rows]
+
+
+# Funcion de extension del indice con registros agregados al final
+def extend_time_axis(axis, timestamps):
+    """
+    Extiende el indice del eje temporal de una etapa con los timestamps de registros
+    agregados al final (ej. bloques de una ingesta incremental), sin leer los
+    registros previos. Conserva el intervalo nominal del indice previo, por lo que
+    coincide con build_time_axis de la etapa completa mientras ese intervalo siga
+    siendo el mas frecuente. Devuelve None si no se puede extender (indice previo
+    desordenado o de una version anterior, o registros nuevos fuera de orden); en ese
+    caso se debe construir el indice de la etapa completa.
+    """
+    times = epoch_ns(timestamps)
+    if axis is None or not axis['n_records']:
+        return build_time_axis(timestamps)
+    if not times.size:
+        return axis
+    if (not axis['monotonic'] or axis.get('end_count') is None or times[0] < axis['end_ns']
+            or (np.diff(times) < 0).any()):
+        return None
+
+    extended = dict(axis, gaps=list(axis['gaps']), duplicates=[list(entry) for entry in axis['duplicates']])
+
+    # Un indice previo sin intervalo tiene un solo timestamp distinto: se calcula con los nuevos
+    joined = np.concatenate([[axis['end_ns']], times])
+    interval = axis['interval_ns'] or nominal_interval(joined)
+
+    # Duplicados: los de los registros nuevos y el ultimo timestamp previo si se repite
+    unique_times, counts = np.unique(times, return_counts=True)
+    boundary = unique_times[0] == axis['end_ns']
+    if boundary:
+        counts[0] += axis['end_count']
+    repeated = counts > 1
+    if boundary and axis['end_count'] > 1:
+        # Ya era duplicado: se actualiza su numero de registros si esta listado
+        end_entry = [axis['end'], int(counts[0])]
+        extended['duplicates'] = [end_entry if entry[0] == axis['end'] else entry
+                                  for entry in extended['duplicates']]
+        repeated[0] = False
+    extended['n_duplicates'] += int(repeated.sum())
+    extended['duplicates'] += list_duplicates(unique_times[repeated], counts[repeated],
+                                              max_listed - len(extended['duplicates']))
+    extended['n_unique'] += int(unique_times.size - boundary)
+    extended['end_count'] = int(counts[-1])
+
+    # Totales y extremos del eje extendido
+    extended['n_records'] += int(times.size)
+    extended['end'] = str(pd.Timestamp(times[-1]))
+    extended['end_ns'] = int(times[-1])
+    if interval is None:
+        extended['n_expected'] = extended['n_records']
+        extended['coverage'] = 1.0
+        return extended
+    extended['interval_ns'] = interval
+    extended['interval'] = str(pd.Timedelta(interval, unit='ns'))
+
+    # Vacios: saltos entre el ultimo registro previo y los nuevos, y entre los nuevos
+    gap_rows = np.flatnonzero(np.diff(joined) > interval)
+    extended['n_gaps'] += int(gap_rows.size)
+    extended['gaps'] += list_gaps(joined, gap_rows[:max_listed - len(extended['gaps'])], interval,
+                                  row_offset=axis['n_records'] - 1)
+
+    extended['n_expected'] = int((extended['end_ns'] - extended['start_ns']) // interval + 1)
+    extended['coverage'] = round(extended['n_unique'] / extended['n_expected'], 6)
+    extended['aligned'] = bool((axis['aligned'] or axis['interval_ns'] is None)
+                               and not extended['n_duplicates']
+                               and ((times - extended['start_ns']) % interval == 0).all())
+    return extended
+
+
+# Funcion para construir la ruta del indice de una etapa
+def sidecar_path(base_path):
+    """
+    Devuelve la ruta del archivo json con el indice del eje temporal de una etapa.
+    """
+    return f'{base_path}{sidecar_suffix}'
+
+
+# Funcion de escritura del indice de una etapa
+def save_time_axis(base_path, axis):
+    """
+    Guarda el indice del eje temporal de una etapa junto a sus archivos. Escribe
+    primero un archivo temporal para no dejar un indice incompleto.
+    """
+    temporary_path = sidecar_path(base_path) + '.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as f:
+        json.dump(axis, f, indent=2)
+    os.replace(temporary_path, sidecar_path(base_path))
+
+
+# Funcion de construccion y escritura del indice de una etapa
+def write_time_axis(base_path, timestamps):
+    """
+    Construye y guarda el indice del eje temporal de una etapa. Devuelve el indice.
+    """
+    axis = build_time_axis(timestamps)
+    save_time_axis(base_path, axis)
+    return axis
+
+
+# Funcion de descripcion breve de un indice
+def describe(axis):
+    """
+    Devuelve un texto con el intervalo nominal, la cobertura, los vacios y los
+    duplicados de un eje temporal, para los mensajes de los scripts.
+    """
+    return (f'intervalo {axis["interval"]}, cobertura {axis["coverage"] or 0:.1%}, '
+            f'{axis["n_gaps"]} vacios, {axis["n_duplicates"]} timestamps duplicados')
+
+
+# Funcion de lectura del indice de una etapa
+def load_time_axis(base_path):
+    """
+    Lee el indice del eje temporal de una etapa, o devuelve None si no existe.
+    """
+    path = sidecar_path(base_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+# Funcion para verificar que un indice describe un eje temporal
+def matches(axis, timestamps):
+    """
+    Devuelve True si el indice corresponde al eje (mismo numero de registros, inicio
+    y fin), por ejemplo para descartar un indice desactualizado.
+    """
+    if axis is None or axis['n_records'] != len(timestamps):
+        return False
+    if not len(timestamps):
+        return True
+    times = epoch_ns(timestamps[[0, -1]])
+    return axis['start_ns'] == times[0] and str(pd.Timestamp(times[-1])) == axis['end']
+
+
+# Funcion de calculo de posiciones en un eje temporal
+def positions(axis, timestamps, side='left'):
+    """
+    Devuelve, como DatetimeIndex.searchsorted, la posicion de cada fecha en el eje:
+    la primera fila con tiempo >= fecha (side='left') o > fecha (side='right'). En un
+    eje alineado la posicion es la casilla de la grilla, (fecha - inicio) // intervalo,
+    menos las casillas vacias anteriores, que se obtienen de la lista de vacios.
+    Devuelve None si el eje no esta alineado o si la lista de vacios esta incompleta
+    (mas de max_listed vacios, o un indice de una version anterior).
+    """
+    if axis is None or not axis['aligned'] or axis.get('n_gaps') != len(axis['gaps']):
+        return None
+
+    times = epoch_ns(timestamps)
+    start, interval = axis['start_ns'], axis['interval_ns']
+
+    # Casilla de la grilla: la primera >= fecha (left) o > fecha (right)
+    if side == 'left':
+        slots = -((start - times) // interval)
+    else:
+        slots = (times - start) // interval + 1
+
+    # Casillas vacias: la primera casilla de cada vacio y cuantas faltan
+    gap_missing = np.array([gap['missing'] for gap in axis['gaps']], dtype=np.int64)
+    gap_rows = np.array([gap['after_row'] for gap in axis['gaps']], dtype=np.int64)
+    missing_before = np.concatenate([[0], np.cumsum(gap_missing)])
+    gap_slots = gap_rows + 1 + missing_before[:-1]
+
+    total_slots = axis['n_records'] + int(missing_before[-1])
+    slots = np.clip(slots, 0, total_slots)
+
+    # Resta las casillas vacias anteriores (las de un vacio en curso, hasta la casilla)
+    gap_number = np.searchsorted(gap_slots, slots, side='right') - 1
+    inside = gap_number >= 0
+    skipped = np.zeros_like(slots)
+    skipped[inside] = missing_before[gap_number[inside]] + np.minimum(
+        slots[inside] - gap_slots[gap_number[inside]], gap_missing[gap_number[inside]])
+
+    return slots - skipped
+
+
+# Funcion de agrupamiento por dia con division entera
+def day_codes(timestamps):
+    """
+    Devuelve el numero de dia (desde 1970) de cada timestamp mediante division entera
+    de sus nanosegundos, equivalente a timestamps.floor('D') sin manejo de fechas.
+    """
+    return epoch_ns(timestamps) // ns_per_day
+
+
+# Funcion para convertir numeros de dia en fechas
+def days_to_index(days, name=None):
+    """
+    Convierte numeros de dia (ver day_codes) en un DatetimeIndex a medianoche.
+    """
+    return pd.DatetimeIndex((np.asarray(days, dtype=np.int64) * ns_per_day).view('datetime64[ns]'),
+                            name=name)
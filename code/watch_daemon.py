@@ -0,0 +1,369 @@
+# IMPORTACIONES
+
+import asyncio
+import concurrent.futures
+import ctypes
+import ctypes.util
+import fnmatch
+import os
+import signal
+import struct
+import sys
+import storage
+import runner
+import instrumentation
+import pipeline
+import outlier_detectors
+
+
+# DEFINICION DE VARIABLES AUXILIARES
+
+# Segundos que un archivo debe permanecer sin cambios (tamano y fecha de modificacion)
+# antes de procesarlo, para no leer exportaciones que aun se estan copiando
+debounce_seconds = float(os.environ.get('HUASCO_WATCH_DEBOUNCE', 5))
+
+# Intervalo de revision de las carpetas cuando no se usa inotify (segundos)
+poll_interval_seconds = float(os.environ.get('HUASCO_WATCH_POLL', 2))
+
+# Usa inotify (Linux) para detectar archivos nuevos; con False o en otros sistemas
+# operativos se revisan las carpetas periodicamente
+use_inotify = os.environ.get('HUASCO_WATCH_POLLING') != '1'
+
+# Al iniciar se revisan los archivos existentes; las huellas de stage_cache omiten
+# los sensores sin cambios desde la ultima ejecucion
+initial_scan = True
+
+# Numero maximo de sensores procesados a la vez (ver HUASCO_MAX_WORKERS en runner)
+max_concurrent_sensors = runner.max_workers
+
+# Etapas que procesan cada sensor; sus scripts son los de pipeline.stage_modules
+sensor_stages = ['01a', '01b', '02a', '02b', '03']
+
+# Eventos de inotify: archivo creado, modificado, cerrado tras escribir o movido a la carpeta
+inotify_mask = 0x00000002 | 0x00000008 | 0x00000080 | 0x00000100
+
+# Formato del encabezado de cada evento de inotify: wd, mask, cookie y largo del nombre
+inotify_event = struct.Struct('iIII')
+
+
+# DEFINICION DE FUNCIONES
+
+# Funcion de importacion de los scripts del flujo de trabajo
+def load_stages():
+    """
+    Importa los scripts de las etapas de sensor_stages con pipeline.load_stage. Los
+    bloques de ejecucion estan protegidos por __name__ == '__main__', por lo que no se
+    procesa nada al importar.
+    """
+    return {stage: pipeline.load_stage(stage) for stage in sensor_stages}
+
+
+# Funcion de identificacion del sensor de un archivo crudo
+def classify_raw_file(path, stages):
+    """
+    Devuelve ('piezometer', nombre) o ('datalogger', nombre) segun la carpeta y el
+    patron del archivo crudo, con el nombre extraido igual que en 01a y 01b. Devuelve
+    None para los archivos que no pertenecen al flujo (ej. temporales de Excel).
+    """
+    folder, filename = os.path.split(os.path.abspath(path))
+
+    if (folder == os.path.abspath(stages['01a'].raw_data_path)
+            and fnmatch.fnmatch(filename, stages['01a'].file_pattern)):
+        return 'piezometer', filename.split('_')[-2].strip()
+
+    if (folder == os.path.abspath(stages['01b'].raw_data_path)
+            and fnmatch.fnmatch(filename, stages['01b'].file_pattern)):
+        return 'datalogger', filename.split('(')[0].strip()
+
+    return None
+
+
+# Funcion de procesamiento de un sensor en todas las etapas (unidad de trabajo)
+def run_sensor_pipeline(kind, name, raw_path):
+    """
+    Procesa un sensor en formateo (01a o 01b), limpieza (02a, solo piezometros),
+    deteccion de outliers (02b) y agregacion (03), con las mismas funciones de los
+    scripts. Las etapas sin cambios
+    en sus entradas se omiten segun las huellas de stage_cache.
+    """
+    stages = load_stages()
+
+    # Crea las carpetas de salida en caso de que no existan (como el bucle de cada script)
+    for stage in ('01a', '01b', '02a', '02b'):
+        os.makedirs(stages[stage].output_path, exist_ok=True)
+
+    if kind == 'piezometer':
+        stages['01a'].process_piezometer(raw_path)
+        formatted_path = os.path.join(stages['01a'].output_path, f'piezo-data_{name}_formatted')
+        stages['02a'].process_piezometer_file(formatted_path)
+        stages['02b'].process_sensor_file(formatted_path)
+        aggregation_input = os.path.join(stages['02a'].output_path, f'piezo-data_{name}_cleaned')
+    else:
+        # Todas las exportaciones del datalogger, como en 01b
+        file_paths = (stages['01b'].group_datalogger_files(stages['01b'].raw_data_path) or {}).get(name, [])
+        stages['01b'].process_datalogger(name, file_paths)
+        stages['02b'].process_sensor_file(os.path.join(stages['01b'].output_path, f'soil-data_{name}_formatted'))
+        aggregation_input = os.path.join(stages['01b'].output_path, f'soil-data_{name}_formatted')
+
+    # Con apply_outlier_masks activo en 03 se agrega sin los outliers detectados en 02b
+    mask_path = outlier_detectors.mask_path_for(
+        stages['02b'].output_path, stages['03'].stage_sensor(aggregation_input)
+    ) if stages['03'].apply_outlier_masks else None
+    stages['03'].process_file(aggregation_input, mask_path)
+
+
+# Funcion de registro de carpetas en inotify
+def open_inotify(folders):
+    """
+    Crea un descriptor de inotify (via libc, sin dependencias externas) que vigila
+    las carpetas indicadas. Devuelve el descriptor y un diccionario {watch: carpeta},
+    o (None, None) si inotify no esta disponible.
+    """
+    if not use_inotify or not sys.platform.startswith('linux'):
+        return None, None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None, None
+    if fd < 0:
+        return None, None
+
+    watches = {}
+    for folder in folders:
+        watch = libc.inotify_add_watch(fd, os.fsencode(folder), inotify_mask)
+        if watch < 0:
+            os.close(fd)
+            return None, None
+        watches[watch] = folder
+    return fd, watches
+
+
+# Funcion de lectura de eventos de inotify
+def read_inotify_events(fd, watches):
+    """
+    Lee los eventos pendientes del descriptor y devuelve las rutas de los archivos
+    afectados.
+    """
+    try:
+        data = os.read(fd, 64 * 1024)
+    except BlockingIOError:
+        return []
+
+    paths = []
+    offset = 0
+    while offset < len(data):
+        watch, _, _, name_length = inotify_event.unpack_from(data, offset)
+        offset += inotify_event.size
+        name = data[offset:offset + name_length].rstrip(b'\0')
+        offset += name_length
+        if name and watch in watches:
+            paths.append(os.path.join(watches[watch], os.fsdecode(name)))
+    return paths
+
+
+# Funcion para obtener el estado de los archivos de una carpeta
+def folder_snapshot(folder):
+    """
+    Devuelve {ruta: (tamano, fecha de modificacion)} de los archivos de una carpeta.
+    """
+    snapshot = {}
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.is_file():
+                stat = entry.stat()
+                snapshot[entry.path] = (stat.st_size, stat.st_mtime)
+    return snapshot
+
+
+# DEFINICION DE CLASES
+
+class IngestionDaemon:
+    """
+    Servicio asincrono que vigila las carpetas de datos crudos y procesa solo los
+    sensores con archivos nuevos o modificados. Los eventos pasan por una espera
+    (debounce) hasta que el archivo deja de cambiar; luego el sensor entra a una cola
+    atendida por un numero acotado de tareas, cada una ejecutando el flujo del sensor
+    en un pool de procesos. Un sensor nunca se procesa dos veces a la vez: si llegan
+    archivos mientras se procesa, se vuelve a procesar al terminar.
+    """
+
+    def __init__(self, stages, workers=None):
+        self.stages = stages
+        self.workers = workers or max_concurrent_sensors
+        self.folders = [os.path.abspath(stages['01a'].raw_data_path),
+                        os.path.abspath(stages['01b'].raw_data_path)]
+        self.queue = asyncio.Queue()
+        self.pending = {}       # Archivos en espera: {ruta: (estado, instante del ultimo cambio)}
+        self.latest_file = {}   # Ultimo archivo crudo de cada sensor
+        self.queued = set()
+        self.running = set()
+        self.dirty = set()
+        self.stop_event = asyncio.Event()
+
+    # Funcion de registro de un archivo nuevo o modificado
+    def notify(self, path):
+        """
+        Registra un cambio en un archivo crudo; el plazo de espera se reinicia.
+        """
+        sensor = classify_raw_file(path, self.stages)
+        if sensor is None or not os.path.exists(path):
+            return
+        self.latest_file[sensor] = path
+        self.pending[path] = (None, asyncio.get_running_loop().time())
+
+    # Funcion de ingreso de un sensor a la cola
+    def schedule(self, sensor):
+        """
+        Agrega un sensor a la cola, salvo que ya este en ella. Si se esta procesando,
+        se marca para procesarlo de nuevo al terminar.
+        """
+        if sensor in self.running:
+            self.dirty.add(sensor)
+        elif sensor not in self.queued:
+            self.queued.add(sensor)
+            self.queue.put_nowait(sensor)
+
+    # Tarea de espera hasta que los archivos dejan de cambiar
+    async def debounce(self):
+        """
+        Revisa los archivos en espera y envia a la cola los sensores cuyos archivos no
+        cambiaron de tamano ni de fecha durante debounce_seconds.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(min(debounce_seconds, poll_interval_seconds) / 2)
+            now = loop.time()
+            for path, (previous_state, changed_at) in list(self.pending.items()):
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    del self.pending[path]
+                    continue
+                state = (stat.st_size, stat.st_mtime)
+                if state != previous_state:
+                    self.pending[path] = (state, now)
+                elif now - changed_at >= debounce_seconds:
+                    del self.pending[path]
+                    self.schedule(classify_raw_file(path, self.stages))
+
+    # Tarea que procesa los sensores de la cola
+    async def worker(self, executor):
+        """
+        Toma sensores de la cola y ejecuta su flujo en el pool de procesos, imprimiendo
+        sus mensajes y registrando su instrumentacion como runner.run_parallel.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            sensor = await self.queue.get()
+            self.queued.discard(sensor)
+            self.running.add(sensor)
+            kind, name = sensor
+            label = f'{kind} {name}'
+
+            try:
+                output = await loop.run_in_executor(
+                    executor, runner.run_work_unit, run_sensor_pipeline,
+                    (kind, name, self.latest_file[sensor]), label)
+            except Exception as error:
+                # Errores del propio pool (ej. proceso terminado abruptamente)
+                output = ('', None, repr(error), None)
+
+            log, _, error, unit_report = output
+            print(log, end='')
+            if error is not None:
+                print(f'  Error procesando {label}:\n{error}')
+            instrumentation.add_unit_report(label, unit_report, error)
+
+            self.running.discard(sensor)
+            self.queue.task_done()
+            if sensor in self.dirty:
+                self.dirty.discard(sensor)
+                self.schedule(sensor)
+
+    # Tarea de vigilancia con inotify
+    async def watch_inotify(self, fd, watches):
+        """
+        Registra los eventos de inotify a medida que el sistema operativo los informa.
+        """
+        loop = asyncio.get_running_loop()
+
+        def on_events():
+            for path in read_inotify_events(fd, watches):
+                self.notify(path)
+
+        loop.add_reader(fd, on_events)
+        try:
+            await self.stop_event.wait()
+        finally:
+            loop.remove_reader(fd)
+            os.close(fd)
+
+    # Tarea de vigilancia por revision periodica
+    async def watch_polling(self):
+        """
+        Compara periodicamente el tamano y la fecha de los archivos de cada carpeta.
+        """
+        snapshots = {folder: folder_snapshot(folder) for folder in self.folders}
+        while True:
+            await asyncio.sleep(poll_interval_seconds)
+            for folder in self.folders:
+                snapshot = folder_snapshot(folder)
+                for path, state in snapshot.items():
+                    if snapshots[folder].get(path) != state:
+                        self.notify(path)
+                snapshots[folder] = snapshot
+
+    # Funcion principal del servicio
+    async def run(self):
+        """
+        Inicia la vigilancia, la espera y las tareas de procesamiento, y las mantiene
+        hasta recibir SIGINT o SIGTERM.
+        """
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signal_number, self.stop_event.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        # Revision inicial de los archivos existentes
+        if initial_scan:
+            for folder in self.folders:
+                for path in folder_snapshot(folder):
+                    self.notify(path)
+
+        fd, watches = open_inotify(self.folders)
+        watcher = self.watch_inotify(fd, watches) if fd is not None else self.watch_polling()
+        mode = 'inotify' if fd is not None else f'revision cada {poll_interval_seconds:g} s'
+        print(f'Vigilando {", ".join(self.folders)} ({mode}, espera de {debounce_seconds:g} s, '
+              f'{self.workers} sensores a la vez). Ctrl+C para detener.')
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as executor:
+            tasks = [asyncio.create_task(watcher), asyncio.create_task(self.debounce())]
+            tasks += [asyncio.create_task(self.worker(executor)) for _ in range(self.workers)]
+
+            await self.stop_event.wait()
+            print('Deteniendo el servicio...')
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# MANEJO DE RUTAS Y ARCHIVOS
+
+# Carpeta donde se guardan los reportes de ejecucion del servicio
+report_path = storage.processed_root
+
+
+# BUCLE DE EJECUCION
+
+# El bloque solo se ejecuta al correr el script (no al importarlo desde los procesos del pool)
+if __name__ == '__main__':
+
+    daemon = IngestionDaemon(load_stages())
+    asyncio.run(daemon.run())
+
+    # Guarda el reporte de tiempos, memoria y volumen de datos de los sensores procesados
+    if instrumentation.run_units:
+        instrumentation.write_run_report(report_path, 'watch_daemon')